@@ -0,0 +1,97 @@
+"""
+Admission control in front of the LLM worker pool.
+
+Each request is checked against the pool's current load before it is queued:
+a full lane is rejected with 503, and a request whose expected queueing delay
+already exceeds its deadline is rejected with 429, both with a Retry-After hint.
+Rejecting early keeps the queue short enough that admitted requests finish in
+time instead of every request in a spike timing out together.
+"""
+import os
+import math
+import threading
+
+ADMISSION_MAX_QUEUE_FREE = int(os.getenv("ADMISSION_MAX_QUEUE_FREE", "64"))
+ADMISSION_MAX_QUEUE_PAID = int(os.getenv("ADMISSION_MAX_QUEUE_PAID", "256"))
+# Used for the wait estimate until the pool has completed a request
+DEFAULT_SERVICE_TIME = float(os.getenv("ADMISSION_DEFAULT_SERVICE_TIME", "5"))
+
+
+class Overloaded(Exception):
+    """A request rejected before queueing because the pool cannot serve it in time."""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded per-lane queues with deadline-aware early rejection.
+
+    Parameters:
+        max_queue (dict): Maximum queued requests per lane ("paid", "free").
+        default_service_time (float): Seconds per request assumed before any was measured.
+    """
+
+    def __init__(self, max_queue=None, default_service_time=DEFAULT_SERVICE_TIME):
+        self.max_queue = max_queue or {"paid": ADMISSION_MAX_QUEUE_PAID, "free": ADMISSION_MAX_QUEUE_FREE}
+        self.default_service_time = default_service_time
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0}
+
+    def expected_wait(self, load, lane, size=1):
+        """Seconds a new request of `size` prompts in `lane` is expected to wait before a worker picks it up."""
+        queued = load["queued"]
+        # Paid requests only queue behind other paid requests
+        ahead = queued.get("paid", 0) if lane == "paid" else sum(queued.values())
+        capacity = load["capacity"]
+        if capacity <= 0:
+            return math.inf
+        waiting = ahead + size - load["free_slots"]
+        if waiting <= 0:
+            return 0.0
+        service_time = load["avg_service_time"] or self.default_service_time
+        return waiting / capacity * service_time
+
+    def admit(self, pool, lane, time_left=None, size=1):
+        """
+        Raises Overloaded if the request should not be queued on `pool`. A batch of
+        `size` prompts counts as that many requests.
+        """
+        load = pool.load()
+        if load["queued"].get(lane, 0) + size > self.max_queue.get(lane, 0):
+            wait = self.expected_wait(load, lane, size)
+            self._reject("queue_full")
+            raise Overloaded("Server is overloaded, request queue is full", 503,
+                             self._retry_after(wait))
+
+        wait = self.expected_wait(load, lane, size)
+        if time_left is not None and wait > time_left:
+            self._reject("deadline")
+            raise Overloaded("Server is too busy to answer within the request deadline", 429,
+                             self._retry_after(wait))
+
+        with self._lock:
+            self.admitted += size
+
+    def _retry_after(self, wait):
+        if math.isinf(wait):
+            wait = self.default_service_time
+        return max(1, math.ceil(wait))
+
+    def _reject(self, reason):
+        with self._lock:
+            self.rejected[reason] += 1
+
+    def stats(self):
+        """Admitted and rejected request counts."""
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "max_queue": dict(self.max_queue),
+            }
@@ -1,163 +1,123 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS
-import subprocess
-import json
-import sys
 import os
-from multiprocessing import Value
+import time
 from functools import wraps
 
+import chat_service
+from metrics import CONTENT_TYPE
+from chat_service import (
+    MODEL_DIR, ChatError, get_llm_pool, get_request_count, request_identity, request_timeout, response_headers
+)
+
 app = Flask(__name__)
 CORS(app)
 
-# ✅ Add request counter with thread-safe increment
-request_counter = Value('i', 0)  # Integer counter starting at 0
-FREE_LIMIT = 1
-
-# Get the path to the model directory
-MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
-
-def increment_request_count():
-    """Thread-safe counter increment"""
-    with request_counter.get_lock():
-        request_counter.value += 1
-        return request_counter.value
+def current_identity():
+    """Quota identity of the current request"""
+    return request_identity(request.headers, request.remote_addr)
 
-def get_request_count():
-    """Get current request count safely"""
-    with request_counter.get_lock():
-        return request_counter.value
+def track_requests(f=None, cost=None):
+    """
+    Decorator to automatically track API requests and enforce the caller's quota.
+    `cost(data)` prices the request from its JSON body (default: 1) and may raise ChatError
+    """
+    if f is None:
+        return lambda f: track_requests(f, cost)
 
-def track_requests(f):
-    """Decorator to automatically track API requests"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Increment counter before processing request
-        current_count = increment_request_count()
-        print(f"🔢 Request #{current_count} to {request.endpoint}")
-        
-        # Execute the original function
-        return f(*args, **kwargs)
+        started = time.perf_counter()
+        # Check and increment the caller's quota before processing request
+        try:
+            units = cost(request.get_json(silent=True)) if cost else 1
+            g.quota = chat_service.track_request(request.endpoint, current_identity(), units)
+        except ChatError as e:
+            response = make_response(jsonify(e.payload), e.status, response_headers(e.payload))
+        else:
+            # Execute the original function
+            response = make_response(f(*args, **kwargs))
+            # Requests shed by admission control or timed out are not charged
+            chat_service.settle_request(g.quota, response.status_code, units)
+
+        chat_service.observe_request(request.endpoint, response.status_code, time.perf_counter() - started)
+        return response
     return decorated_function
 
 @app.route('/api/chat', methods=['GET', 'POST'])
 @track_requests  # ✅ This will increment counter automatically
 def chat():
     """Handle chat requests from frontend and send to llm.py"""
-    current_requests = get_request_count()
-    
-    # Check if user exceeded free limit
-    if current_requests > FREE_LIMIT:
-        return jsonify({
-            "error": "Free limit exceeded. Payment required.",
-            "requests_made": current_requests,
-            "free_limit": FREE_LIMIT,
-            "payment_required": True
-        }), 402  # Payment Required
-    
     try:
         # Get the message from frontend
         data = request.get_json()
-        message = data.get('message', '')
-        
-        if not message:
-            return jsonify({"error": "No message provided"}), 400
-            
-        # Prepare input for llm.py
-        llm_input = {
-            "prompt": message
-        }
-        
-        # Call llm.py script
-        result = subprocess.run(
-            [sys.executable, 'llm.py'],
-            input=json.dumps(llm_input),
-            text=True,
-            capture_output=True,
-            cwd=MODEL_DIR
-        )
-        
-        if result.returncode == 0:
-            try:
-                llm_response = json.loads(result.stdout)
-                
-                return jsonify({
-                    "success": True,
-                    "response": llm_response.get("response", ""),
-                    "context_chunks": llm_response.get("context_chunks", ""),
-                    "raw_llm_output": llm_response,
-                    "requests_made": current_requests,  # ✅ Include current count
-                    "free_limit": FREE_LIMIT
-                })
-            except json.JSONDecodeError:
-                return jsonify({
-                    "error": "Invalid JSON response from LLM",
-                    "raw_output": result.stdout
-                }), 500
-        else:
-            return jsonify({
-                "error": "LLM execution failed",
-                "stderr": result.stderr,
-                "stdout": result.stdout
-            }), 500
-            
+        payload, status = chat_service.handle_chat(data, g.quota, request_timeout(request.headers))
+        return jsonify(payload), status, response_headers(payload)
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/api/chat/batch', methods=['POST'])
+@track_requests(cost=chat_service.batch_cost)  # one quota unit per uncached prompt
+def chat_batch():
+    """Handle a list of prompts in one request (POST {"messages": [...]})"""
+    try:
+        data = request.get_json()
+        payload, status = chat_service.handle_chat_batch(data, g.quota, request_timeout(request.headers))
+        return jsonify(payload), status, response_headers(payload)
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route('/api/chat/stream', methods=['GET', 'POST'])
+@track_requests
+def chat_stream():
+    """Stream a chat completion as server-sent events (GET ?message=... for EventSource)"""
+    try:
+        data = request.get_json(silent=True) or {"message": request.args.get('message', '')}
+        handle = chat_service.open_chat_stream(data, g.quota, request_timeout(request.headers))
+    except ChatError as e:
+        return jsonify(e.payload), e.status, response_headers(e.payload)
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+    return Response(
+        stream_with_context(chat_service.chat_sse(handle, g.quota)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/user/status', methods=['GET'])
 def user_status():
     """Get user payment status and request limits"""
     try:
-        current_requests = get_request_count()
-        payment_required = current_requests >= FREE_LIMIT
-        
-        return jsonify({
-            "requests_made": current_requests,  # ✅ Real dynamic count
-            "free_limit": FREE_LIMIT,
-            "user_id": "user123",
-            "payment_required": payment_required,
-            "remaining_requests": max(0, FREE_LIMIT - current_requests)
-        })
+        payload, status = chat_service.user_status(current_identity())
+        return jsonify(payload), status
     except Exception as e:
         return jsonify({"error": f"Status error: {str(e)}"}), 500
 
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    current_requests = get_request_count()
-    return jsonify({
-        "status": "healthy", 
-        "message": "Backend is running",
-        "total_requests": current_requests
-    })
+    payload, status = chat_service.health()
+    return jsonify(payload), status
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics"""
+    return Response(chat_service.metrics_text(), content_type=CONTENT_TYPE)
 
 @app.route('/api/reset-counter', methods=['POST'])
 def reset_counter():
     """Reset request counter (for testing)"""
-    with request_counter.get_lock():
-        request_counter.value = 0
-    return jsonify({"message": "Counter reset", "requests_made": 0})
+    payload, status = chat_service.reset_counter()
+    return jsonify(payload), status
 
 @app.route('/api/verify-payment', methods=['POST'])
 def verify_payment():
     """Verify payment and reset user's request count"""
     try:
         data = request.get_json()
-        tx_hash = data.get('tx_hash')
-        
-        if not tx_hash:
-            return jsonify({"error": "Transaction hash required"}), 400
-            
-        # TODO: Add real payment verification logic here
-        # For now, just reset the counter
-        with request_counter.get_lock():
-            request_counter.value = 0
-            
-        return jsonify({
-            "success": True, 
-            "message": "Payment verified and counter reset",
-            "tx_hash": tx_hash
-        })
+        payload, status = chat_service.verify_payment(data, current_identity())
+        return jsonify(payload), status
     except Exception as e:
         return jsonify({"error": f"Payment verification error: {str(e)}"}), 500
 
@@ -166,5 +126,10 @@ if __name__ == '__main__':
     print(f"📁 Model directory: {MODEL_DIR}")
     print("🌐 Server will run on http://localhost:8000")
     print(f"🔢 Request counter initialized at: {get_request_count()}")
-    
+
+    # Warm the LLM workers in the serving process (not in the reloader's watcher)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        pool = get_llm_pool()
+        print(f"🧠 LLM worker pool: {pool.size} workers x {pool.concurrency} concurrent requests")
+
     app.run(debug=True, host='0.0.0.0', port=8000)
@@ -0,0 +1,177 @@
+"""
+Asyncio-native serving mode for the chat backend.
+
+Exposes the same endpoints and JSON payloads as api_server.py, but handlers await
+the LLM worker pool instead of blocking a request thread for the whole Gemini
+round trip, so a handful of uvicorn processes can hold hundreds of in-flight calls.
+Quota reads and writes (SQLite, which can wait on its busy timeout) run in the
+thread pool so they never block the event loop.
+
+Run with:
+    python asgi_server.py
+or
+    uvicorn asgi_server:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+import os
+import time
+import json
+import contextlib
+from functools import wraps
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import chat_service
+from metrics import CONTENT_TYPE
+from chat_service import MODEL_DIR, ChatError, get_llm_pool, request_identity, request_timeout, response_headers
+
+async def read_json(request):
+    """Parses the request body as JSON, mirroring Flask's request.get_json()"""
+    body = await request.body()
+    return json.loads(body) if body else None
+
+def current_identity(request):
+    """Quota identity of the current request"""
+    return request_identity(request.headers, request.client.host if request.client else None)
+
+def observed(endpoint):
+    """Records the handler's latency and status code in the request duration histogram"""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await handler(request)
+            chat_service.observe_request(endpoint, response.status_code, time.perf_counter() - started)
+            return response
+        return wrapper
+    return decorator
+
+@observed("chat")
+async def chat(request):
+    """Handle chat requests from frontend and send to llm.py"""
+    try:
+        quota = await run_in_threadpool(chat_service.track_request, "chat", current_identity(request))
+    except ChatError as e:
+        return JSONResponse(e.payload, status_code=e.status, headers=response_headers(e.payload))
+    try:
+        data = await read_json(request)
+        payload, status = await chat_service.handle_chat_async(data, quota, request_timeout(request.headers))
+    except Exception as e:
+        return JSONResponse({"error": f"Server error: {str(e)}"}, status_code=500)
+    # Requests shed by admission control or timed out are not charged
+    await run_in_threadpool(chat_service.settle_request, quota, status)
+    return JSONResponse(payload, status_code=status, headers=response_headers(payload))
+
+@observed("chat_batch")
+async def chat_batch(request):
+    """Handle a list of prompts in one request (POST {"messages": [...]})"""
+    try:
+        try:
+            data = await read_json(request)
+        except ValueError:
+            data = None
+        # One quota unit per uncached prompt, charged only once the body is valid
+        cost = chat_service.batch_cost(data)
+        quota = await run_in_threadpool(chat_service.track_request, "chat_batch", current_identity(request), cost)
+    except ChatError as e:
+        return JSONResponse(e.payload, status_code=e.status, headers=response_headers(e.payload))
+    try:
+        payload, status = await chat_service.handle_chat_batch_async(data, quota, request_timeout(request.headers))
+    except Exception as e:
+        return JSONResponse({"error": f"Server error: {str(e)}"}, status_code=500)
+    await run_in_threadpool(chat_service.settle_request, quota, status, cost)
+    return JSONResponse(payload, status_code=status, headers=response_headers(payload))
+
+@observed("chat_stream")
+async def chat_stream(request):
+    """Stream a chat completion as server-sent events (GET ?message=... for EventSource)"""
+    quota = None
+    try:
+        quota = await run_in_threadpool(chat_service.track_request, "chat_stream", current_identity(request))
+        try:
+            data = await read_json(request)
+        except ValueError:
+            data = None
+        handle = chat_service.open_chat_stream(data or {"message": request.query_params.get('message', '')},
+                                               quota, request_timeout(request.headers))
+    except ChatError as e:
+        await run_in_threadpool(chat_service.settle_request, quota, e.status)
+        return JSONResponse(e.payload, status_code=e.status, headers=response_headers(e.payload))
+    except Exception as e:
+        return JSONResponse({"error": f"Server error: {str(e)}"}, status_code=500)
+
+    return StreamingResponse(
+        chat_service.chat_sse_async(handle, quota),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+async def user_status(request):
+    """Get user payment status and request limits"""
+    try:
+        payload, status = await run_in_threadpool(chat_service.user_status, current_identity(request))
+        return JSONResponse(payload, status_code=status)
+    except Exception as e:
+        return JSONResponse({"error": f"Status error: {str(e)}"}, status_code=500)
+
+async def health(request):
+    """Health check endpoint"""
+    payload, status = chat_service.health()
+    return JSONResponse(payload, status_code=status)
+
+async def metrics(request):
+    """Prometheus metrics"""
+    return Response(chat_service.metrics_text(), media_type=CONTENT_TYPE)
+
+async def reset_counter(request):
+    """Reset request counter (for testing)"""
+    payload, status = await run_in_threadpool(chat_service.reset_counter)
+    return JSONResponse(payload, status_code=status)
+
+async def verify_payment(request):
+    """Verify payment and reset user's request count"""
+    try:
+        data = await read_json(request)
+        payload, status = await run_in_threadpool(chat_service.verify_payment, data, current_identity(request))
+        return JSONResponse(payload, status_code=status)
+    except Exception as e:
+        return JSONResponse({"error": f"Payment verification error: {str(e)}"}, status_code=500)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Warm the LLM workers before accepting traffic and stop them on shutdown"""
+    if os.getenv("LLM_POOL_WARM_START", "1") == "1":
+        get_llm_pool()
+    yield
+    chat_service.shutdown_llm_pool()
+
+routes = [
+    Route('/api/chat', chat, methods=['GET', 'POST']),
+    Route('/api/chat/batch', chat_batch, methods=['POST']),
+    Route('/api/chat/stream', chat_stream, methods=['GET', 'POST']),
+    Route('/api/user/status', user_status, methods=['GET']),
+    Route('/api/health', health, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+    Route('/api/reset-counter', reset_counter, methods=['POST']),
+    Route('/api/verify-payment', verify_payment, methods=['POST']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    workers = int(os.getenv("ASGI_WORKERS", "1"))
+    print("🚀 Starting Neo Pay Backend Server (ASGI)")
+    print(f"📁 Model directory: {MODEL_DIR}")
+    print(f"🌐 Server will run on http://localhost:8000 with {workers} worker process(es)")
+
+    uvicorn.run("asgi_server:app", host='0.0.0.0', port=8000, workers=workers)
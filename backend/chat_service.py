@@ -0,0 +1,651 @@
+"""
+Request handling shared by the Flask (api_server.py) and ASGI (asgi_server.py) servers.
+
+Every handler returns a (payload, status_code) tuple so the JSON contract the
+frontend relies on stays identical whichever server is running. The LLM call
+itself is exposed as a Future so the sync server can block on it while the
+async server awaits it without tying up a thread.
+"""
+import os
+import sys
+import json
+import atexit
+import hashlib
+import hmac
+import time
+import asyncio
+import threading
+from multiprocessing import Value
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from admission import AdmissionController, Overloaded
+from llm_pool import DeadlineExceeded, LLMWorkerPool, StreamHandle, WorkerError
+from metrics import Registry
+from quota import QuotaStore
+from response_cache import ResponseCache, make_cache_key
+from single_flight import SingleFlight
+
+# Get the path to the model directory
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+if MODEL_DIR not in sys.path:
+    sys.path.insert(0, MODEL_DIR)
+
+from prompting import GEMINI_MODEL_NAME, SYSTEM_PROMPT, normalize_instruction
+from corpus_registry import corpus_version, load_registry, parse_corpora, registry_version
+
+# ✅ Add request counter with thread-safe increment (total requests served by this process)
+request_counter = Value('i', 0)  # Integer counter starting at 0
+
+# Same corpora the llm.py workers load; their versions are part of the response cache key
+CORPORA = load_registry()
+_SYSTEM_PROMPT_HASH = hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:16]
+response_cache = ResponseCache()
+
+# Concurrent identical prompts share one in-flight LLM call
+chat_flights = SingleFlight()
+
+# Warm LLM workers (model, samples and Gemini client are loaded once per worker)
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", "64"))  # prompts accepted by /api/chat/batch
+# Fields of each /api/chat/batch result, taken from the /api/chat payload
+BATCH_RESULT_KEYS = ("success", "response", "context_chunks", "prompt_tokens", "corpora", "error", "details")
+_llm_pool = None
+_llm_pool_lock = threading.Lock()
+
+# Bounded queue in front of the pool; paid users get their own priority lane
+admission = AdmissionController()
+
+# Prometheus metrics served by /metrics
+metrics = Registry()
+requests_total = metrics.counter(
+    "neopay_requests_total", "API requests by endpoint and quota outcome.", ("endpoint", "outcome"))
+request_duration = metrics.histogram(
+    "neopay_request_duration_seconds", "Time spent in the server handler.", ("endpoint", "status"))
+llm_stage_duration = metrics.histogram(
+    "neopay_llm_stage_duration_seconds",
+    "Latency of each LLM pipeline stage: worker startup, queue wait, worker job and the llm.py stages.",
+    ("stage",))
+
+# Per-identity free-tier quotas, shared by every server process through SQLite
+_quota_store = None
+_quota_store_lock = threading.Lock()
+# Requests shed by admission control or timed out: the server, not the caller, ended them
+REFUNDED_STATUSES = {429, 503, 504}
+# Key signing per-user bearer tokens (issue_quota_token); unset, quotas are per client address
+QUOTA_TOKEN_SECRET = os.getenv("QUOTA_TOKEN_SECRET", "")
+# Reverse proxies (e.g. the Vite dev server) whose X-Forwarded-For header names the real client
+TRUSTED_PROXIES = {host.strip() for host in os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if host.strip()}
+
+
+class ChatError(Exception):
+    """A request that is answered with an error payload before reaching the LLM."""
+
+    def __init__(self, payload, status):
+        super().__init__(payload.get("error", ""))
+        self.payload = payload
+        self.status = status
+
+
+def get_llm_pool():
+    """Returns the shared worker pool, starting it on first use"""
+    global _llm_pool
+    with _llm_pool_lock:
+        if _llm_pool is None:
+            _llm_pool = LLMWorkerPool(stage_observer=observe_llm_stage).start()
+            atexit.register(_llm_pool.shutdown)
+        return _llm_pool
+
+def shutdown_llm_pool():
+    """Stops the worker pool if it was started"""
+    global _llm_pool
+    with _llm_pool_lock:
+        if _llm_pool is not None:
+            _llm_pool.shutdown()
+            _llm_pool = None
+
+def get_quota_store():
+    """Returns the shared quota store, opening it on first use"""
+    global _quota_store
+    with _quota_store_lock:
+        if _quota_store is None:
+            _quota_store = QuotaStore()
+        return _quota_store
+
+def issue_quota_token(user_id):
+    """Signed bearer token "<user_id>.<hmac>" that request_identity() accepts as the user's identity"""
+    signature = hmac.new(QUOTA_TOKEN_SECRET.encode(), user_id.encode(), hashlib.sha256).hexdigest()
+    return f"{user_id}.{signature}"
+
+def verified_user(token):
+    """The user id of a token issued by issue_quota_token(), or None if it is unsigned or forged"""
+    user_id, _, signature = token.rpartition('.')
+    if not QUOTA_TOKEN_SECRET or not user_id:
+        return None
+    expected = issue_quota_token(user_id).rpartition('.')[2]
+    return user_id if hmac.compare_digest(signature, expected) else None
+
+def client_address(headers, client_host):
+    """
+    The client's address: the peer itself, or, when the peer is one of TRUSTED_PROXIES,
+    the last X-Forwarded-For hop not added by a trusted proxy (earlier hops are client-chosen)
+    """
+    if client_host not in TRUSTED_PROXIES:
+        return client_host
+    hops = [hop.strip() for hop in (headers.get('X-Forwarded-For') or '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in TRUSTED_PROXIES:
+            return hop
+    return client_host
+
+def request_identity(headers, client_host):
+    """
+    Identifies the caller for quota purposes: the user of a verified bearer token,
+    else the client address. Client-chosen values (headers, unsigned tokens) are
+    never trusted, since a fresh value per request would reset the quota
+    """
+    auth = headers.get('Authorization') or ''
+    user_id = verified_user(auth[7:].strip()) if auth.startswith('Bearer ') else None
+    if user_id:
+        return f"user:{user_id}"
+    return f"ip:{client_address(headers, client_host) or 'unknown'}"
+
+def increment_request_count():
+    """Thread-safe counter increment"""
+    with request_counter.get_lock():
+        request_counter.value += 1
+        return request_counter.value
+
+def get_request_count():
+    """Get current request count safely"""
+    with request_counter.get_lock():
+        return request_counter.value
+
+def reset_request_count():
+    """Reset the request counter to zero"""
+    with request_counter.get_lock():
+        request_counter.value = 0
+
+def request_timeout(headers):
+    """Per-request deadline in seconds: X-Request-Timeout header, capped at LLM_REQUEST_TIMEOUT"""
+    try:
+        timeout = float(headers.get('X-Request-Timeout') or LLM_REQUEST_TIMEOUT)
+    except ValueError:
+        return LLM_REQUEST_TIMEOUT
+    return min(max(timeout, 0.0), LLM_REQUEST_TIMEOUT)
+
+def response_headers(payload):
+    """Extra HTTP headers for an error payload (Retry-After on 402/429/503)"""
+    retry_after = payload.get("retry_after") if isinstance(payload, dict) else None
+    return {"Retry-After": str(retry_after)} if retry_after else {}
+
+def track_request(endpoint, identity, cost=1):
+    """
+    Counts an API request and charges the caller's quota in one call.
+    Returns the QuotaDecision or raises ChatError (402) when the free limit is used up
+    """
+    increment_request_count()
+    decision = get_quota_store().consume(identity, cost)
+    requests_total.inc(endpoint=endpoint, outcome="allowed" if decision.allowed else "quota_exceeded")
+
+    # Check if user exceeded free limit
+    if not decision.allowed:
+        raise ChatError({
+            "error": "Free limit exceeded. Payment required.",
+            "requests_made": decision.requests_made,
+            "free_limit": decision.limit,
+            "payment_required": True,
+            "retry_after": round(decision.retry_after)
+        }, 402)  # Payment Required
+    return decision
+
+def settle_request(quota, status, cost=1):
+    """Refunds the quota units track_request() charged when the request was shed or timed out"""
+    if quota is not None and status in REFUNDED_STATUSES:
+        get_quota_store().refund(quota.identity, cost)
+
+# --- /api/chat ---
+
+def prepare_chat(data):
+    """Validates the body. Returns the message or raises ChatError"""
+    # Get the message from frontend
+    message = data.get('message', '')
+    if not message:
+        raise ChatError({"error": "No message provided"}, 400)
+    return message
+
+def prepare_corpora(data):
+    """The corpora the request names in "corpus" (a name or a list), or None to route automatically"""
+    try:
+        return parse_corpora((data or {}).get('corpus'), CORPORA)
+    except ValueError as e:
+        raise ChatError({"error": str(e)}, 400)
+
+def vector_store_version():
+    """Version of the corpora llm.py loads: each binary store if built, else its JSONL file"""
+    return registry_version({name: corpus_version(spec) for name, spec in CORPORA.items()})
+
+def response_cache_key(message, version=None, corpora=None):
+    """Cache key: normalized instruction, Gemini model, system prompt, corpus versions and selection"""
+    return make_cache_key(normalize_instruction(message), GEMINI_MODEL_NAME, _SYSTEM_PROMPT_HASH,
+                          version or vector_store_version(), ",".join(corpora) if corpora else "auto")
+
+def cache_response(message, llm_response, corpora=None):
+    """
+    Caches a successful response under the store version it was generated with
+    (workers hot-reload the store, so that can lag the version on disk)
+    """
+    if "error" not in llm_response:
+        response_cache.put(response_cache_key(message, llm_response.get("store_version"), corpora), llm_response)
+
+def _cache_when_done(message, future, corpora=None):
+    def store(f):
+        if not f.cancelled() and f.exception() is None:
+            cache_response(message, f.result(), corpora)
+    future.add_done_callback(store)
+
+def request_lane(quota):
+    """Priority lane for the request: users who paid skip the free queue"""
+    return "paid" if quota is not None and quota.paid else "free"
+
+def admit(pool, lane, deadline, size=1):
+    """Rejects the request (or batch of `size` prompts) early (Overloaded) if it cannot be served before its deadline"""
+    admission.admit(pool, lane, deadline - time.monotonic(), size)
+
+def submit_chat(message, lane="free", deadline=None, corpora=None):
+    """
+    Serves the prompt from the response cache, joins an identical in-flight request,
+    or hands it to a warm llm.py worker after admission control. Returns a Future
+    """
+    deadline = time.monotonic() + LLM_REQUEST_TIMEOUT if deadline is None else deadline
+    key = response_cache_key(message, corpora=corpora)
+    cached = response_cache.get(key)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    def compute():
+        pool = get_llm_pool()
+        admit(pool, lane, deadline)
+        future = pool.submit(message, lane=lane, deadline=deadline, corpora=corpora)
+        _cache_when_done(message, future, corpora)
+        return future
+
+    future, _ = chat_flights.submit(key, compute)
+    return future
+
+def chat_result(llm_response, quota):
+    """Builds the /api/chat payload from an llm.py response dict"""
+    if "error" in llm_response:
+        return {
+            "error": "LLM execution failed",
+            "details": llm_response["error"]
+        }, 500
+
+    return {
+        "success": True,
+        "response": llm_response.get("response", ""),
+        "context_chunks": llm_response.get("context_chunks", ""),
+        "prompt_tokens": llm_response.get("prompt_tokens"),
+        "corpora": llm_response.get("corpora"),
+        "raw_llm_output": llm_response,
+        "requests_made": quota.requests_made,  # ✅ Include current count
+        "free_limit": quota.limit
+    }, 200
+
+def chat_failure(exc):
+    """Maps a failed or timed out LLM call to an error payload"""
+    if isinstance(exc, (FutureTimeoutError, asyncio.TimeoutError)):
+        return {"error": "LLM request timed out"}, 504
+    if isinstance(exc, Overloaded):
+        return {"error": exc.reason, "retry_after": exc.retry_after}, exc.status
+    if isinstance(exc, DeadlineExceeded):
+        return {"error": "Request deadline exceeded while queued", "retry_after": 1}, 503
+    if isinstance(exc, WorkerError):
+        return {
+            "error": "LLM execution failed",
+            "details": str(exc)
+        }, 500
+    return {"error": f"Server error: {str(exc)}"}, 500
+
+def handle_chat(data, quota, timeout=LLM_REQUEST_TIMEOUT):
+    """Blocking /api/chat handler for a request already charged by track_request()"""
+    try:
+        message = prepare_chat(data)
+        corpora = prepare_corpora(data)
+        deadline = time.monotonic() + timeout
+        future = submit_chat(message, request_lane(quota), deadline, corpora)
+        llm_response = future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except ChatError as e:
+        return e.payload, e.status
+    except Exception as e:
+        return chat_failure(e)
+    return chat_result(llm_response, quota)
+
+async def handle_chat_async(data, quota, timeout=LLM_REQUEST_TIMEOUT):
+    """/api/chat handler that awaits the worker pool instead of blocking a thread"""
+    try:
+        message = prepare_chat(data)
+        corpora = prepare_corpora(data)
+        deadline = time.monotonic() + timeout
+        future = asyncio.wrap_future(submit_chat(message, request_lane(quota), deadline, corpora))
+        llm_response = await asyncio.wait_for(future, timeout=max(0.0, deadline - time.monotonic()))
+    except ChatError as e:
+        return e.payload, e.status
+    except Exception as e:
+        return chat_failure(e)
+    return chat_result(llm_response, quota)
+
+# --- /api/chat/batch ---
+
+def prepare_batch(data):
+    """Validates a batch body. Returns the list of messages or raises ChatError"""
+    messages = (data or {}).get('messages')
+    if not isinstance(messages, list) or not messages:
+        raise ChatError({"error": "No messages provided"}, 400)
+    if len(messages) > CHAT_BATCH_MAX:
+        raise ChatError({"error": f"Too many messages (max {CHAT_BATCH_MAX})"}, 400)
+    if not all(isinstance(message, str) and message for message in messages):
+        raise ChatError({"error": "Every message must be a non-empty string"}, 400)
+    return messages
+
+def batch_cost(data):
+    """
+    Quota cost of a /api/chat/batch body: one per distinct prompt not already in
+    the response cache (at least one). Validates the body first; raises ChatError
+    """
+    messages = prepare_batch(data)
+    corpora = prepare_corpora(data)
+    uncached = {key for key in (response_cache_key(message, corpora=corpora) for message in messages)
+                if not response_cache.contains(key)}
+    return max(1, len(uncached))
+
+def submit_chat_batch(messages, lane="free", deadline=None, corpora=None):
+    """
+    Answers cached prompts from the response cache and sends the rest, deduplicated,
+    to one worker as a single batch job. Returns a Future of response dicts in order
+    """
+    deadline = time.monotonic() + LLM_REQUEST_TIMEOUT if deadline is None else deadline
+    keys = [response_cache_key(message, corpora=corpora) for message in messages]
+    responses = [response_cache.get(key) for key in keys]
+    future = Future()
+
+    missing = {}  # cache key -> message, in first-seen order
+    for key, message, cached in zip(keys, messages, responses):
+        if cached is None:
+            missing.setdefault(key, message)
+    if not missing:
+        future.set_result(responses)
+        return future
+
+    pool = get_llm_pool()
+    admit(pool, lane, deadline, len(missing))
+    batch = pool.submit_batch(list(missing.values()), lane=lane, deadline=deadline, corpora=corpora)
+
+    def merge(f):
+        # The caller may have timed out and cancelled the future already
+        if future.done():
+            return
+        if f.exception() is not None:
+            future.set_exception(f.exception())
+            return
+        computed = dict(zip(missing, f.result()))
+        for key, llm_response in computed.items():
+            cache_response(missing[key], llm_response, corpora)
+        future.set_result([cached if cached is not None else computed[key]
+                           for key, cached in zip(keys, responses)])
+    batch.add_done_callback(merge)
+    return future
+
+def batch_result(llm_responses, quota):
+    """Builds the /api/chat/batch payload: one /api/chat-style entry per message"""
+    results = []
+    for llm_response in llm_responses:
+        payload, _ = chat_result(llm_response, quota)
+        results.append({key: payload[key] for key in BATCH_RESULT_KEYS if key in payload})
+    return {
+        "success": True,
+        "results": results,
+        "requests_made": quota.requests_made,
+        "free_limit": quota.limit
+    }, 200
+
+def handle_chat_batch(data, quota, timeout=LLM_REQUEST_TIMEOUT):
+    """Blocking /api/chat/batch handler"""
+    try:
+        messages = prepare_batch(data)
+        corpora = prepare_corpora(data)
+        deadline = time.monotonic() + timeout
+        future = submit_chat_batch(messages, request_lane(quota), deadline, corpora)
+        llm_responses = future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except ChatError as e:
+        return e.payload, e.status
+    except Exception as e:
+        return chat_failure(e)
+    return batch_result(llm_responses, quota)
+
+async def handle_chat_batch_async(data, quota, timeout=LLM_REQUEST_TIMEOUT):
+    """Async version of handle_chat_batch()"""
+    try:
+        messages = prepare_batch(data)
+        corpora = prepare_corpora(data)
+        deadline = time.monotonic() + timeout
+        future = asyncio.wrap_future(submit_chat_batch(messages, request_lane(quota), deadline, corpora))
+        llm_responses = await asyncio.wait_for(future, timeout=max(0.0, deadline - time.monotonic()))
+    except ChatError as e:
+        return e.payload, e.status
+    except Exception as e:
+        return chat_failure(e)
+    return batch_result(llm_responses, quota)
+
+# --- /api/chat/stream ---
+
+def format_sse(event, data):
+    """Encodes one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def open_chat_stream(data, quota=None, timeout=LLM_REQUEST_TIMEOUT):
+    """Validates the request like /api/chat and starts a streamed generation. Raises ChatError"""
+    message = prepare_chat(data)
+    corpora = prepare_corpora(data)
+    key = response_cache_key(message, corpora=corpora)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return StreamHandle.completed([
+            ("context", {"context_chunks": cached.get("context_chunks", "")}),
+            ("code", {"text": cached.get("response", "")}),
+        ], cached)
+
+    pool = get_llm_pool()
+    lane = request_lane(quota)
+    deadline = time.monotonic() + timeout
+    try:
+        admit(pool, lane, deadline)
+    except Overloaded as e:
+        raise ChatError(*chat_failure(e))
+    handle = pool.submit_stream(message, lane=lane, deadline=deadline, corpora=corpora)
+    _cache_when_done(message, handle.future, corpora)
+    return handle
+
+def _final_stream_event(handle, quota):
+    try:
+        llm_response = handle.result()
+    except Exception as e:
+        return "error", chat_failure(e)[0]
+    payload, status = chat_result(llm_response, quota)
+    return ("done" if status == 200 else "error"), payload
+
+def chat_sse(handle, quota):
+    """
+    Yields the SSE body for a streamed chat: a `context` event with the retrieved
+    context_chunks, `token` and `code` events as Gemini produces text, and a final
+    `done` event carrying the same payload /api/chat returns (or an `error` event).
+    """
+    try:
+        for event, data in handle.events(timeout=LLM_REQUEST_TIMEOUT):
+            yield format_sse(event, data)
+    except Exception as e:
+        yield format_sse("error", chat_failure(e)[0])
+        return
+    yield format_sse(*_final_stream_event(handle, quota))
+
+async def chat_sse_async(handle, quota):
+    """Async version of chat_sse()"""
+    try:
+        async for event, data in handle.aevents(timeout=LLM_REQUEST_TIMEOUT):
+            yield format_sse(event, data)
+    except Exception as e:
+        yield format_sse("error", chat_failure(e)[0])
+        return
+    yield format_sse(*_final_stream_event(handle, quota))
+
+# --- metrics ---
+
+def observe_llm_stage(stage, seconds):
+    """Records one LLM pipeline stage duration reported by the worker pool"""
+    llm_stage_duration.observe(seconds, stage=stage)
+
+def observe_request(endpoint, status, seconds):
+    """Records the server-side latency of one request"""
+    request_duration.observe(seconds, endpoint=endpoint, status=status)
+
+def _collect_runtime_metrics():
+    """Scrape-time gauges and counters that live in other components"""
+    yield ("neopay_requests_served_total", "counter", "Requests counted by this process.",
+           [({}, get_request_count())])
+
+    pool = _llm_pool.stats() if _llm_pool else None
+    if pool is not None:
+        yield ("neopay_llm_queue_depth", "gauge", "Jobs waiting for an LLM worker.",
+               [({"lane": lane}, depth) for lane, depth in pool["queued_by_lane"].items()])
+        yield ("neopay_llm_in_flight", "gauge", "Jobs running on LLM workers.", [({}, pool["in_flight"])])
+        yield ("neopay_llm_ready_workers", "gauge", "LLM workers ready to serve.", [({}, pool["ready_workers"])])
+        yield ("neopay_llm_worker_restarts_total", "counter", "LLM worker restarts.", [({}, pool["restarts"])])
+        embeddings = pool.get("engine", {}).get("embedding_cache")
+        if embeddings:
+            yield ("neopay_embedding_cache_lookups_total", "counter", "Query embedding cache lookups in LLM workers.",
+                   [({"result": "hit"}, embeddings["hits"]), ({"result": "miss"}, embeddings["misses"])])
+            yield ("neopay_embedding_cache_entries", "gauge", "Query embeddings cached in LLM workers.",
+                   [({}, embeddings["entries"])])
+        batcher = pool.get("engine", {}).get("embedding_batcher")
+        if batcher:
+            yield ("neopay_embedding_batches_total", "counter", "Micro-batched encode() calls in LLM workers.",
+                   [({}, batcher["batches"])])
+            yield ("neopay_embedding_batched_queries_total", "counter", "Queries encoded by the micro-batcher.",
+                   [({}, batcher["items"])])
+        reranker = pool.get("engine", {}).get("reranker")
+        if reranker:
+            yield ("neopay_rerank_requests_total", "counter",
+                   "Retrievals reranked in LLM workers; fallback ones missed RERANK_BUDGET_MS and kept "
+                   "the first-pass order.",
+                   [({"result": "reranked"}, reranker["reranked"]), ({"result": "fallback"}, reranker["fallbacks"])])
+            yield ("neopay_rerank_batches_total", "counter", "Micro-batched reranker scoring calls.",
+                   [({}, reranker["batches"])])
+        completions = pool.get("engine", {}).get("semantic_cache")
+        if completions:
+            yield ("neopay_semantic_cache_lookups_total", "counter",
+                   "Semantic completion cache lookups in LLM workers; guard_rejected lookups were similar "
+                   "enough but had different parameters.",
+                   [({"result": "hit"}, completions["hits"]), ({"result": "miss"}, completions["misses"]),
+                    ({"result": "guard_rejected"}, completions["guard_rejections"])])
+            yield ("neopay_semantic_cache_entries", "gauge", "Completions cached by embedding in LLM workers.",
+                   [({}, completions["entries"])])
+        store = pool.get("engine", {}).get("store")
+        if store:
+            yield ("neopay_vector_store_reloads_total", "counter", "Vector store hot reloads in LLM workers.",
+                   [({"result": "ok"}, store["reloads"]), ({"result": "failed"}, store["reload_failures"])])
+        gemini = pool.get("engine", {}).get("gemini")
+        if gemini:
+            yield ("neopay_gemini_requests_total", "counter", "Gemini HTTP/RPC attempts by LLM workers, by kind.",
+                   [({"kind": "attempt"}, gemini["attempts"]), ({"kind": "retry"}, gemini["retries"]),
+                    ({"kind": "hedge"}, gemini["hedges"])])
+            yield ("neopay_gemini_hedge_wins_total", "counter", "Hedged Gemini requests that answered first.",
+                   [({}, gemini["hedge_wins"])])
+            yield ("neopay_gemini_errors_total", "counter", "Gemini calls failed after retries.",
+                   [({}, gemini["errors"])])
+
+    cache = response_cache.stats()
+    yield ("neopay_response_cache_lookups_total", "counter", "Response cache lookups by result.",
+           [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])])
+    yield ("neopay_response_cache_evictions_total", "counter", "Response cache entries evicted or expired.",
+           [({"reason": "capacity"}, cache["evictions"]), ({"reason": "ttl"}, cache["expirations"])])
+    yield ("neopay_response_cache_entries", "gauge", "Cached responses.", [({}, cache["entries"])])
+    yield ("neopay_response_cache_bytes", "gauge", "Approximate size of cached responses.", [({}, cache["bytes"])])
+
+    flights = chat_flights.stats()
+    yield ("neopay_coalesced_requests_total", "counter", "Requests by whether they joined an in-flight call.",
+           [({"role": "leader"}, flights["leaders"]), ({"role": "follower"}, flights["followers"])])
+
+    admitted = admission.stats()
+    yield ("neopay_admission_decisions_total", "counter", "Admission control decisions.",
+           [({"decision": "admitted"}, admitted["admitted"])] +
+           [({"decision": f"rejected_{reason}"}, count) for reason, count in admitted["rejected"].items()])
+
+metrics.add_collector(_collect_runtime_metrics)
+
+def metrics_text():
+    """Prometheus text exposition of every metric"""
+    return metrics.render()
+
+# --- status, health and payment ---
+
+def user_status(identity):
+    """Get user payment status and request limits"""
+    quota = get_quota_store().peek(identity)
+
+    return {
+        "requests_made": quota.requests_made,  # ✅ Real dynamic count
+        "free_limit": quota.limit,
+        "user_id": identity,
+        "payment_required": quota.remaining < 1,
+        "remaining_requests": quota.remaining,
+        "paid": quota.paid
+    }, 200
+
+def health():
+    """Health check payload"""
+    return {
+        "status": "healthy",
+        "message": "Backend is running",
+        "total_requests": get_request_count(),
+        "llm_pool": _llm_pool.stats() if _llm_pool else None,
+        "response_cache": response_cache.stats(),
+        "coalescing": chat_flights.stats(),
+        "admission": admission.stats()
+    }, 200
+
+def reset_counter():
+    """Reset request counter and every user's quota (for testing)"""
+    reset_request_count()
+    get_quota_store().reset()
+    return {"message": "Counter reset", "requests_made": 0}, 200
+
+def verify_payment(data, identity):
+    """
+    Verify payment and reset the paying user's request count. A caller without a
+    quota token gets one for the payment, so its paid quota is no longer shared
+    with everyone behind the same address
+    """
+    tx_hash = data.get('tx_hash')
+
+    if not tx_hash:
+        return {"error": "Transaction hash required"}, 400
+
+    token = None
+    if QUOTA_TOKEN_SECRET and not identity.startswith("user:"):
+        token = issue_quota_token(f"tx-{tx_hash}")
+        identity = f"user:tx-{tx_hash}"
+
+    # TODO: Add real payment verification logic here
+    # For now, just refill this user's quota and mark them as paid
+    get_quota_store().reset(identity, paid=True)
+
+    payload = {
+        "success": True,
+        "message": "Payment verified and counter reset",
+        "tx_hash": tx_hash
+    }
+    if token:
+        payload["quota_token"] = token  # send as "Authorization: Bearer <quota_token>"
+    return payload, 200
@@ -1,13 +1,28 @@
 import json
 import os
+import re
 import sys
-from sentence_transformers import SentenceTransformer
-import numpy as np # For converting embeddings to list for JSON serialization
+import numpy as np
+
+# The binary store format lives next to llm.py, which reads it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "model"))
+from vector_store import load_store, store_paths, store_version, write_store
+from ann_index import ANN_INDEX, INDEX_SUFFIX, load_or_build_index
+from lexical_index import LEXICAL_SUFFIX, load_or_build_lexical_index
+from embedding_backends import EMBEDDING_BACKEND, load_embedding_model
+from corpus_registry import CORPORA_MANIFEST, load_registry
 
 # Configuration
 SAMPLES_FILE = os.path.join("agentKitContext.jsonl")
-VECTOR_SAMPLES_FILE = os.path.join("vector_samples.jsonl")
+# Writes vector_samples.npy (float32 matrix) and vector_samples.meta.json (instruction/output text)
+VECTOR_STORE_BASE = os.path.join("vector_samples")
 EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2' # Use the same model as your main script
+# float32, float16 or int8; quantized stores keep float32 vectors for rescoring unless VECTOR_STORE_RESCORE=0
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32")
+VECTOR_STORE_RESCORE = os.getenv("VECTOR_STORE_RESCORE", "1") == "1"
+TEXT_CHUNK_CHARS = int(os.getenv("TEXT_CHUNK_CHARS", "1200"))  # longest chunk of a scraped .txt source
+# Block prefixes web_scraping.py writes to scraped_content.txt
+TEXT_BLOCK_PREFIXES = ("P: ", "DIV: ", "H: ")
 
 def load_raw_samples(filepath):
     """Loads instructions and outputs from a .jsonl file."""
@@ -23,34 +38,104 @@ def load_raw_samples(filepath):
                 print(f"Error decoding JSON from line: {line.strip()} - {e}", file=sys.stderr)
     return samples
 
+def split_text(text, max_chars=TEXT_CHUNK_CHARS):
+    """Splits text into chunks of at most max_chars, at sentence ends where possible."""
+    chunks, current = [], ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        while len(sentence) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+def load_text_chunks(filepath):
+    """
+    Turns scraped_content.txt (web_scraping.py) into samples: each P:/DIV: block,
+    split into chunks, becomes the output of a sample whose instruction is the
+    last heading seen. Repeated blocks (a DIV repeating its paragraphs) are skipped.
+    """
+    if not os.path.exists(filepath):
+        print(f"Error: Text file not found at {filepath}. Cannot create embeddings.", file=sys.stderr)
+        return []
+    samples, seen, heading = [], set(), "Documentation"
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            prefix = next((p for p in TEXT_BLOCK_PREFIXES if line.startswith(p)), None)
+            if prefix is None:
+                continue
+            text = line[len(prefix):].strip()
+            if prefix == "H: ":
+                heading = text
+                continue
+            for chunk in split_text(text):
+                if chunk not in seen:
+                    seen.add(chunk)
+                    samples.append({"instruction": heading, "output": chunk})
+    return samples
+
 def create_and_store_embeddings():
-    print(f"Loading SentenceTransformer model: {EMBEDDING_MODEL_NAME}...")
+    print(f"Loading embedding model: {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND} backend)...")
     try:
-        model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        model = load_embedding_model(EMBEDDING_MODEL_NAME)
         print("Model loaded.")
     except Exception as e:
         print(f"Error loading SentenceTransformer model: {e}", file=sys.stderr)
         print("Please ensure you have internet access for the first download or model is cached.")
         return
 
-    raw_samples = load_raw_samples(SAMPLES_FILE)
+    if os.path.exists(CORPORA_MANIFEST):
+        # One store per corpus of the manifest, built from its source JSONL or scraped .txt
+        for spec in load_registry(CORPORA_MANIFEST).values():
+            if not spec.source:
+                print(f"Corpus {spec.name} has no source; skipping.")
+                continue
+            print(f"Building corpus {spec.name} from {spec.source}...")
+            build_store(model, spec.source, spec.store_base, spec.ann)
+    else:
+        build_store(model, SAMPLES_FILE, VECTOR_STORE_BASE)
+
+def build_store(model, samples_file, store_base, ann=None):
+    """
+    Embeds the samples of samples_file (JSONL, or scraped .txt) into the binary store
+    at store_base and prebuilds its indexes.
+    """
+    text_source = samples_file.endswith(".txt")
+    raw_samples = load_text_chunks(samples_file) if text_source else load_raw_samples(samples_file)
     if not raw_samples:
         print("No raw samples to process. Exiting.")
         return
 
-    instructions = [s.get("instruction", "") for s in raw_samples]
+    # Text chunks are found by their content, not just the heading they sit under
+    instructions = [f"{s.get('instruction', '')}\n{s.get('output', '')}" if text_source else s.get("instruction", "")
+                    for s in raw_samples]
     print(f"Encoding {len(instructions)} instructions...")
     # Encode in batches for efficiency
-    instruction_embeddings = model.encode(instructions, convert_to_tensor=False) # Convert to numpy array directly
-
-    print(f"Storing embeddings to {VECTOR_SAMPLES_FILE}...")
-    with open(VECTOR_SAMPLES_FILE, 'w', encoding='utf-8') as f_out:
-        for i, sample in enumerate(raw_samples):
-            # Convert numpy array embedding to a list for JSON serialization
-            sample['embedding'] = instruction_embeddings[i].tolist()
-            f_out.write(json.dumps(sample) + '\n')
+    instruction_embeddings = model.encode(instructions) # numpy array, one row per instruction
+
+    matrix_path, meta_path = store_paths(store_base)
+    print(f"Storing {VECTOR_STORE_DTYPE} embeddings to {matrix_path} and {meta_path}...")
+    write_store(store_base, raw_samples, np.asarray(instruction_embeddings, dtype=np.float32),
+                EMBEDDING_MODEL_NAME, VECTOR_STORE_DTYPE, VECTOR_STORE_RESCORE)
     print("Embeddings stored successfully.")
 
+    # Prebuild the ANN and BM25 indexes so server workers load them instead of building them on startup
+    ann = ann or {}
+    store = load_store(store_base)
+    index = load_or_build_index(store.matrix, store_base + INDEX_SUFFIX, store_version(store_base),
+                                ann.get("index", ANN_INDEX), ann.get("n_lists"), ann.get("nprobe"))
+    print(f"Built {index.kind} index over {len(store)} samples.")
+    lexical = load_or_build_lexical_index(store.samples, store_base + LEXICAL_SUFFIX, store_version(store_base))
+    print(f"Built BM25 index with {len(lexical.vocabulary)} terms.")
+
 if __name__ == "__main__":
     # Ensure the 'data' directory exists
     os.makedirs("data", exist_ok=True)
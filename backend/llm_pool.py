@@ -0,0 +1,593 @@
+"""
+Persistent worker pool for the LLM pipeline.
+
+Each worker is a separate process that imports model/engine.py once, builds a warm
+LLMEngine (embedding model, vector samples, Gemini client) and then serves prompts
+from an in-memory queue with a small thread pool. A supervisor thread restarts
+workers that die and fails the requests they were holding.
+
+Results come back over one pipe per worker rather than a shared queue, so a worker
+that is killed mid-write cannot leave a lock held that wedges the other workers.
+"""
+import os
+import sys
+import time
+import itertools
+import queue
+import asyncio
+import threading
+import traceback
+import multiprocessing as mp
+from multiprocessing import connection as mp_connection
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+
+DEFAULT_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "2"))
+DEFAULT_WORKER_CONCURRENCY = int(os.getenv("LLM_WORKER_CONCURRENCY", "4"))
+MAX_RESTART_DELAY = 30.0
+ENGINE_STATS_INTERVAL = 1.0  # seconds between engine stats reports from a busy worker
+
+# Dispatch order: every queued paid job goes before any free one
+LANES = ("paid", "free")
+SERVICE_TIME_DECAY = 0.1  # weight of the newest sample in the service time average
+
+
+class WorkerError(RuntimeError):
+    """Raised when a worker could not produce a result for a job."""
+
+
+class WorkerCrashed(WorkerError):
+    """Raised for jobs that were in flight on a worker process that died."""
+
+
+class DeadlineExceeded(WorkerError):
+    """Raised for jobs whose deadline passed before a worker picked them up."""
+
+
+def default_engine_factory():
+    """Builds the warm LLMEngine inside a worker process."""
+    if MODEL_DIR not in sys.path:
+        sys.path.insert(0, MODEL_DIR)
+    from engine import LLMEngine
+    return LLMEngine()
+
+
+def _run_job(engine, kind, payload, emit):
+    # Only requests that name corpora pass them on; routing is the engine's default
+    kwargs = {"corpora": payload["corpora"]} if payload.get("corpora") else {}
+    if kind == "generate":
+        return engine.generate(payload["prompt"], **kwargs)
+    if kind == "batch":
+        return engine.generate_batch(payload["prompts"], **kwargs)
+    if kind == "stream":
+        stream = engine.generate_stream(payload["prompt"], **kwargs)
+        while True:
+            try:
+                event, data = next(stream)
+            except StopIteration as stop:
+                return stop.value
+            emit((event, data))
+    raise ValueError(f"Unknown job kind: {kind}")
+
+
+def _worker_main(worker_id, engine_factory, concurrency, task_queue, result_conn):
+    """Entry point of a worker process."""
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            result_conn.send(message)
+
+    # Ship llm.py's per-stage timings to the parent for /metrics
+    if MODEL_DIR not in sys.path:
+        sys.path.insert(0, MODEL_DIR)
+    import stage_timing
+    stage_timing.set_observer(lambda stage, seconds: send(("stage", None, (stage, seconds))))
+
+    try:
+        with stage_timing.timed_stage("engine_init"):
+            engine = engine_factory()
+    except Exception as e:
+        send(("failed", None, f"{type(e).__name__}: {e}"))
+        return
+    send(("ready", None, None))
+
+    last_stats = [0.0]
+
+    def report_stats():
+        now = time.monotonic()
+        if hasattr(engine, "stats") and now - last_stats[0] >= ENGINE_STATS_INTERVAL:
+            last_stats[0] = now
+            send(("stats", None, engine.stats()))
+
+    def run(job_id, kind, payload):
+        def emit(event):
+            send(("event", job_id, event))
+        try:
+            send(("result", job_id, _run_job(engine, kind, payload, emit)))
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            send(("error", job_id, f"{type(e).__name__}: {e}"))
+        report_stats()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"llm-worker-{worker_id}") as executor:
+        while True:
+            item = task_queue.get()
+            if item is None:
+                break
+            executor.submit(run, *item)
+    if hasattr(engine, "close"):
+        engine.close()
+
+
+_END_OF_STREAM = object()
+
+
+class StreamHandle:
+    """
+    Consumer side of a streamed job.
+
+    Events pushed by the worker are buffered here and can be read either with the
+    blocking events() iterator or the async aevents() iterator. `future` resolves
+    to the final response dict once the stream is finished.
+    """
+
+    def __init__(self, future):
+        self.future = future
+        self._events = queue.Queue()
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def completed(cls, events, result):
+        """A handle for a stream that is already finished, e.g. served from a cache."""
+        future = Future()
+        handle = cls(future)
+        for event in events:
+            handle._push(event)
+        future.set_result(result)
+        handle._push(_END_OF_STREAM)
+        return handle
+
+    def _push(self, item):
+        self._events.put(item)
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, wakeup in waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def result(self):
+        """Final response dict; raises the job's exception if it failed."""
+        return self.future.result(timeout=0)
+
+    def events(self, timeout=None):
+        """Yields (event, data) tuples, waiting at most `timeout` seconds for each."""
+        while True:
+            try:
+                item = self._events.get(timeout=timeout)
+            except queue.Empty:
+                raise FutureTimeoutError()
+            if item is _END_OF_STREAM:
+                return
+            yield item
+
+    async def aevents(self, timeout=None):
+        """Async version of events() that never blocks the event loop."""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        waiter = (loop, wakeup)
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            while True:
+                try:
+                    item = self._events.get_nowait()
+                except queue.Empty:
+                    wakeup.clear()
+                    if self._events.empty():
+                        await asyncio.wait_for(wakeup.wait(), timeout)
+                    continue
+                if item is _END_OF_STREAM:
+                    return
+                yield item
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+def _merge_stats(reports):
+    """Sums the numeric counters of several engines' stats() reports, recomputing hit ratios."""
+    merged = {}
+    for report in reports:
+        for key, value in report.items():
+            if isinstance(value, dict):
+                merged[key] = _merge_stats([merged.get(key, {}), value])
+            elif isinstance(value, (int, float)) and key != "hit_ratio":
+                merged[key] = merged.get(key, 0) + value
+    if "hits" in merged and "misses" in merged:
+        lookups = merged["hits"] + merged["misses"]
+        merged["hit_ratio"] = round(merged["hits"] / lookups, 4) if lookups else 0.0
+    return merged
+
+
+class _Job:
+    """A queued or in-flight unit of work."""
+
+    def __init__(self, job_id, kind, payload, future, lane, deadline):
+        self.job_id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.future = future
+        self.lane = lane
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+
+
+class _WorkerHandle:
+    """Parent-side bookkeeping for one worker process."""
+
+    def __init__(self, worker_id, process, task_queue, result_conn):
+        self.worker_id = worker_id
+        self.process = process
+        self.task_queue = task_queue
+        self.result_conn = result_conn
+        self.connected = True
+        self.in_flight = {}
+        self.ready = False
+        self.restarts = 0
+        self.spawned_at = time.monotonic()
+        self.engine_stats = None
+
+
+class LLMWorkerPool:
+    """
+    Pool of warm LLM worker processes.
+
+    Parameters:
+        size (int): Number of worker processes.
+        concurrency (int): Jobs each worker runs at the same time.
+        engine_factory: Picklable callable that builds the engine in the worker.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, concurrency=DEFAULT_WORKER_CONCURRENCY,
+                 engine_factory=default_engine_factory, stage_observer=None):
+        self.size = max(1, size)
+        self.concurrency = max(1, concurrency)
+        self.engine_factory = engine_factory
+        # observer(stage, seconds) for worker startup, queue wait, job time and llm.py stages
+        self.stage_observer = stage_observer
+
+        self._ctx = mp.get_context("spawn")
+        self._cond = threading.Condition()
+        self._pending = {lane: deque() for lane in LANES}
+        self._avg_service_time = None
+        self._workers = {}
+        self._retired = []
+        self._job_ids = itertools.count(1)
+        self._streams = {}
+        self._closed = False
+        self._started = False
+        self._last_startup_error = None
+        self._threads = []
+
+    # --- lifecycle ---
+
+    def start(self):
+        """Spawns the workers and the collector, dispatcher and supervisor threads."""
+        with self._cond:
+            if self._started:
+                return self
+            self._started = True
+            for worker_id in range(self.size):
+                self._spawn(worker_id)
+
+        for target in (self._collect, self._dispatch, self._supervise):
+            thread = threading.Thread(target=target, name=f"llm-pool-{target.__name__.strip('_')}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def shutdown(self, timeout=5.0):
+        """Stops all workers and fails any job that has not completed."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers.values())
+            pending = self._drain_pending()
+            self._cond.notify_all()
+
+        for job in pending:
+            job.future.set_exception(WorkerError("LLM worker pool is shut down"))
+        for worker in workers:
+            try:
+                worker.task_queue.put(None)
+            except (OSError, ValueError):
+                pass
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            self._fail_in_flight(worker, WorkerError("LLM worker pool is shut down"))
+            self._release(worker)
+        for thread in self._threads:
+            thread.join(timeout)
+        for worker in workers + self._retired:
+            if worker.connected:
+                worker.connected = False
+                worker.result_conn.close()
+
+    def _spawn(self, worker_id, restarts=0):
+        task_queue = self._ctx.Queue()
+        result_conn, child_conn = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.engine_factory, self.concurrency, task_queue, child_conn),
+            name=f"llm-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        # Only the child keeps the write end, so its death shows up as EOF here
+        child_conn.close()
+        worker = _WorkerHandle(worker_id, process, task_queue, result_conn)
+        worker.restarts = restarts
+        self._workers[worker_id] = worker
+
+    def _release(self, worker):
+        # The collector closes result_conn once it has drained it to EOF
+        worker.task_queue.cancel_join_thread()
+        worker.task_queue.close()
+
+    # --- public API ---
+
+    def submit(self, prompt, lane="free", deadline=None, corpora=None):
+        """
+        Queues a prompt and returns a Future resolving to the llm.py response dict.
+
+        Jobs in the "paid" lane are dispatched before "free" ones. A job still queued
+        at `deadline` (time.monotonic() based) fails with DeadlineExceeded. `corpora`
+        names the corpora to search (default: routed by the engine).
+        """
+        return self._submit("generate", {"prompt": prompt, "corpora": corpora}, lane=lane, deadline=deadline)
+
+    def generate(self, prompt, timeout=None):
+        """Blocking helper around submit()."""
+        return self.submit(prompt).result(timeout)
+
+    def submit_batch(self, prompts, lane="free", deadline=None, corpora=None):
+        """Queues several prompts as one job; the Future resolves to a list of response dicts."""
+        return self._submit("batch", {"prompts": list(prompts), "corpora": corpora}, lane=lane, deadline=deadline)
+
+    def submit_stream(self, prompt, lane="free", deadline=None, corpora=None):
+        """Queues a prompt for streaming and returns a StreamHandle."""
+        future = Future()
+        handle = StreamHandle(future)
+        self._submit("stream", {"prompt": prompt, "corpora": corpora}, future, handle, lane, deadline)
+        return handle
+
+    def load(self):
+        """Queue depth per lane, free dispatch slots and average service time, for admission control."""
+        with self._cond:
+            ready = [w for w in self._workers.values() if w.ready]
+            return {
+                "queued": {lane: len(jobs) for lane, jobs in self._pending.items()},
+                "capacity": self.size * self.concurrency,
+                "free_slots": sum(self.concurrency - len(w.in_flight) for w in ready),
+                "avg_service_time": self._avg_service_time,
+            }
+
+    def stats(self):
+        """Returns a snapshot of queue depth and worker state."""
+        with self._cond:
+            return {
+                "size": self.size,
+                "concurrency": self.concurrency,
+                "ready_workers": sum(1 for w in self._workers.values() if w.ready),
+                "queued": sum(len(jobs) for jobs in self._pending.values()),
+                "queued_by_lane": {lane: len(jobs) for lane, jobs in self._pending.items()},
+                "in_flight": sum(len(w.in_flight) for w in self._workers.values()),
+                "restarts": sum(w.restarts for w in self._workers.values()),
+                "last_startup_error": self._last_startup_error,
+                "avg_service_time": self._avg_service_time,
+                "engine": _merge_stats([w.engine_stats for w in self._workers.values() if w.engine_stats]),
+            }
+
+    def _submit(self, kind, payload, future=None, stream=None, lane="free", deadline=None):
+        if lane not in self._pending:
+            raise ValueError(f"Unknown lane: {lane}")
+        if not self._started:
+            self.start()
+        future = future or Future()
+        with self._cond:
+            if self._closed:
+                raise WorkerError("LLM worker pool is shut down")
+            job_id = next(self._job_ids)
+            if stream is not None:
+                self._streams[job_id] = stream
+
+                def close_stream(_):
+                    self._streams.pop(job_id, None)
+                    stream._push(_END_OF_STREAM)
+                future.add_done_callback(close_stream)
+            self._pending[lane].append(_Job(job_id, kind, payload, future, lane, deadline))
+            self._cond.notify_all()
+        return future
+
+    def _has_pending(self):
+        return any(self._pending.values())
+
+    def _next_pending(self):
+        for lane in LANES:
+            if self._pending[lane]:
+                return self._pending[lane].popleft()
+        return None
+
+    def _drain_pending(self):
+        jobs = [job for lane in LANES for job in self._pending[lane]]
+        for jobs_in_lane in self._pending.values():
+            jobs_in_lane.clear()
+        return jobs
+
+    def _expire_pending(self, now):
+        """Removes queued jobs whose deadline has passed. Caller holds the lock."""
+        expired = []
+        for lane in LANES:
+            jobs = self._pending[lane]
+            if any(job.deadline is not None and job.deadline <= now for job in jobs):
+                keep = deque(job for job in jobs if job.deadline is None or job.deadline > now)
+                expired.extend(job for job in jobs if job.deadline is not None and job.deadline <= now)
+                self._pending[lane] = keep
+        return expired
+
+    # --- background threads ---
+
+    def _free_worker(self):
+        for worker in self._workers.values():
+            if worker.ready and len(worker.in_flight) < self.concurrency:
+                return worker
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._has_pending() or self._free_worker() is None):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                worker = min(
+                    (w for w in self._workers.values() if w.ready and len(w.in_flight) < self.concurrency),
+                    key=lambda w: len(w.in_flight),
+                )
+                job = self._next_pending()
+                now = time.monotonic()
+                if job.deadline is not None and job.deadline <= now:
+                    job.future.set_exception(DeadlineExceeded("Request deadline passed while queued"))
+                    continue
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                job.started_at = now
+                worker.in_flight[job.job_id] = job
+                self._observe("queue_wait", now - job.enqueued_at)
+            try:
+                worker.task_queue.put((job.job_id, job.kind, job.payload))
+            except (OSError, ValueError):
+                # The worker was released by the supervisor in the meantime
+                if worker.in_flight.pop(job.job_id, None) is not None:
+                    job.future.set_exception(WorkerCrashed(f"LLM worker {worker.worker_id} is gone"))
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                workers = list(self._workers.values()) + self._retired
+                conns = {w.result_conn: w for w in workers if w.connected}
+            for conn in mp_connection.wait(list(conns), timeout=0.2):
+                worker = conns[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    # The supervisor notices the dead process and restarts it
+                    with self._cond:
+                        worker.connected = False
+                        if worker in self._retired:
+                            self._retired.remove(worker)
+                    conn.close()
+                    continue
+                self._handle_message(worker, *message)
+
+    def _handle_message(self, worker, status, job_id, value):
+        if status == "event":
+            stream = self._streams.get(job_id)
+            if stream is not None:
+                stream._push(value)
+            return
+        if status == "stage":
+            self._observe(*value)
+            return
+        if status == "stats":
+            worker.engine_stats = value
+            return
+
+        pending = []
+        job = None
+        with self._cond:
+            if status == "ready":
+                worker.ready = True
+                self._last_startup_error = None
+                self._observe("worker_startup", time.monotonic() - worker.spawned_at)
+            elif status == "failed":
+                self._last_startup_error = value
+                print(f"LLM worker {worker.worker_id} failed to start: {value}", file=sys.stderr)
+                # Nobody can serve the queue: fail fast instead of letting callers time out
+                if not any(w.ready for w in self._workers.values()):
+                    pending = self._drain_pending()
+            else:
+                job = worker.in_flight.pop(job_id, None)
+                if job is not None:
+                    service_time = time.monotonic() - job.started_at
+                    self._record_service_time(service_time)
+                    self._observe("worker_job", service_time)
+            self._cond.notify_all()
+
+        for pending_job in pending:
+            pending_job.future.set_exception(WorkerError(f"LLM worker failed to start: {value}"))
+        if job is None:
+            return
+        if status == "result":
+            job.future.set_result(value)
+        else:
+            job.future.set_exception(WorkerError(value))
+
+    def _observe(self, stage, seconds):
+        if self.stage_observer is not None:
+            try:
+                self.stage_observer(stage, seconds)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+
+    def _record_service_time(self, seconds):
+        if self._avg_service_time is None:
+            self._avg_service_time = seconds
+        else:
+            self._avg_service_time += SERVICE_TIME_DECAY * (seconds - self._avg_service_time)
+
+    def _supervise(self):
+        while True:
+            time.sleep(0.5)
+            with self._cond:
+                if self._closed:
+                    return
+                dead = [w for w in self._workers.values() if not w.process.is_alive()]
+                expired = self._expire_pending(time.monotonic())
+            for job in expired:
+                job.future.set_exception(DeadlineExceeded("Request deadline passed while queued"))
+            for worker in dead:
+                # Back off when a worker keeps dying before it ever becomes ready
+                delay = 0 if worker.ready else min(MAX_RESTART_DELAY, 0.5 * 2 ** min(worker.restarts, 6))
+                self._fail_in_flight(worker, WorkerCrashed(
+                    f"LLM worker {worker.worker_id} exited with code {worker.process.exitcode}"))
+                self._release(worker)
+                if delay:
+                    time.sleep(delay)
+                with self._cond:
+                    if self._closed:
+                        return
+                    print(f"Restarting LLM worker {worker.worker_id}", file=sys.stderr)
+                    if worker.connected:
+                        self._retired.append(worker)
+                    self._spawn(worker.worker_id, worker.restarts + 1)
+                    self._cond.notify_all()
+
+    def _fail_in_flight(self, worker, exc):
+        with self._cond:
+            in_flight = list(worker.in_flight.values())
+            worker.in_flight.clear()
+            worker.ready = False
+            self._cond.notify_all()
+        for job in in_flight:
+            job.future.set_exception(exc)
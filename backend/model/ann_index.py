@@ -0,0 +1,199 @@
+"""
+Nearest-neighbour indexes over the L2-normalized sample matrix.
+
+Two interchangeable indexes expose search(queries, top_n, threshold) ->
+[(ids, scores), ...], best match first, scores being cosine similarities and
+matches below `threshold` dropped:
+
+    ExactIndex     brute-force dot product against every row (the exact fallback)
+    IVFFlatIndex   inverted-file index: k-means partitions the rows into `n_lists`
+                   cells and a query only scores the rows of its `nprobe` closest
+                   cells. Raising nprobe trades latency for recall; nprobe ==
+                   n_lists is exact.
+
+Both accept a float32 matrix or a vector_store.QuantizedMatrix (float16/int8
+rows), which is scored without making a float32 copy of the whole matrix.
+
+build_index() picks IVF-flat for corpora of at least IVF_MIN_SAMPLES rows and the
+exact index below that, where scanning everything is already cheap. Built IVF
+indexes are saved next to the vector store and reloaded while the store is
+unchanged.
+"""
+import os
+import math
+
+import numpy as np
+
+ANN_INDEX = os.getenv("ANN_INDEX", "auto")  # auto | ivf | exact
+ANN_NLISTS = int(os.getenv("ANN_NLISTS", "0"))  # 0: about sqrt(number of samples)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+IVF_MIN_SAMPLES = int(os.getenv("ANN_IVF_MIN_SAMPLES", "2048"))
+INDEX_FORMAT_VERSION = 1
+INDEX_SUFFIX = ".ivf.npz"  # saved next to the vector store it was built from
+
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, best first."""
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _select(ids, scores, top_n, threshold):
+    """Top `top_n` of (ids, scores) scoring at least `threshold`, best first."""
+    if threshold is not None:
+        keep = np.flatnonzero(scores >= threshold)
+        ids, scores = ids[keep], scores[keep]
+    best = _top_k(scores, top_n)
+    return ids[best], scores[best]
+
+
+def _scores(matrix, queries):
+    """Rows of query-by-sample dot products for a float32 or quantized matrix."""
+    if hasattr(matrix, "scores"):
+        return matrix.scores(queries)
+    # One matrix-vector product for a single query, one matrix product for a batch
+    return [matrix @ queries[0]] if len(queries) == 1 else queries @ matrix.T
+
+
+class ExactIndex:
+    """Scores every row; always exact."""
+
+    kind = "exact"
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def search(self, queries, top_n, threshold=None):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if len(self.matrix) == 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        all_ids = np.arange(len(self.matrix))
+        return [_select(all_ids, row, top_n, threshold) for row in _scores(self.matrix, queries)]
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index with exact (flat) scoring inside the probed cells.
+
+    Parameters:
+        matrix (np.ndarray): float32 (count, dim), rows L2-normalized.
+        centroids (np.ndarray): float32 (n_lists, dim) cell centroids.
+        list_ids (np.ndarray): Row ids grouped by cell.
+        list_offsets (np.ndarray): Cell i holds list_ids[list_offsets[i]:list_offsets[i + 1]].
+        nprobe (int): Cells scanned per query.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, matrix, centroids, list_ids, list_offsets, nprobe=ANN_NPROBE):
+        self.matrix = matrix
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, nprobe=ANN_NPROBE, iterations=10, seed=0, train_size=65536):
+        """Partitions `matrix` with spherical k-means (trained on a sample of at most `train_size` rows)."""
+        count = len(matrix)
+        n_lists = max(1, min(count, n_lists or ANN_NLISTS or int(math.sqrt(count))))
+        rng = np.random.default_rng(seed)
+        train = matrix[:] if count <= train_size else matrix[np.sort(rng.choice(count, train_size, replace=False))]
+        train = np.asarray(train, dtype=np.float32)
+
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = cls._assign(train, centroids)
+            counts = np.bincount(assignment, minlength=n_lists)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            empty = counts == 0
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(train[np.argsort(assignment, kind="stable")], starts[~empty], axis=0)
+            # Re-seed empty cells with random training rows
+            sums[empty] = train[rng.choice(len(train), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        assignment = cls._assign(matrix, centroids)
+        list_ids = np.argsort(assignment, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=n_lists)))).astype(np.int64)
+        return cls(matrix, centroids.astype(np.float32), list_ids, list_offsets, nprobe)
+
+    @staticmethod
+    def _assign(rows, centroids, chunk=8192):
+        assignment = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), chunk):
+            assignment[start:start + chunk] = np.argmax(rows[start:start + chunk] @ centroids.T, axis=1)
+        return assignment
+
+    def search(self, queries, top_n, threshold=None, nprobe=None):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = max(1, min(self.n_lists, nprobe or self.nprobe))
+        results = []
+        for query, centroid_scores in zip(queries, queries @ self.centroids.T):
+            cells = _top_k(centroid_scores, nprobe)
+            candidates = np.concatenate(
+                [self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in cells])
+            results.append(_select(candidates, self.matrix[candidates] @ query, top_n, threshold))
+        return results
+
+    def save(self, path, version=""):
+        """Writes the index; `version` identifies the store it was built from."""
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(tmp_path, format=INDEX_FORMAT_VERSION, version=version, count=len(self.matrix),
+                 centroids=self.centroids, list_ids=self.list_ids, list_offsets=self.list_offsets)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, matrix, version="", nprobe=ANN_NPROBE):
+        """Loads a saved index for `matrix`. Returns None if it was built from another store."""
+        try:
+            with np.load(path) as data:
+                if (int(data["format"]) != INDEX_FORMAT_VERSION or str(data["version"]) != version
+                        or int(data["count"]) != len(matrix)):
+                    return None
+                return cls(matrix, data["centroids"], data["list_ids"], data["list_offsets"], nprobe)
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def _wants_exact(matrix, kind):
+    if kind not in ("auto", "ivf", "exact"):
+        raise ValueError(f"Unknown ANN index kind: {kind}")
+    return kind == "exact" or len(matrix) == 0 or (kind == "auto" and len(matrix) < IVF_MIN_SAMPLES)
+
+
+def build_index(matrix, kind=ANN_INDEX, **params):
+    """Builds the index `kind` ("auto", "ivf" or "exact") over `matrix`."""
+    if _wants_exact(matrix, kind):
+        return ExactIndex(matrix)
+    return IVFFlatIndex.build(matrix, **params)
+
+
+def load_or_build_index(matrix, index_path=None, version="", kind=ANN_INDEX, n_lists=None, nprobe=None):
+    """
+    Reuses the IVF index saved at `index_path` for this store version (and `n_lists`,
+    if given), or builds (and saves) one.
+    """
+    if _wants_exact(matrix, kind):
+        return ExactIndex(matrix)
+    nprobe = nprobe or ANN_NPROBE
+    if index_path and os.path.exists(index_path):
+        index = IVFFlatIndex.load(index_path, matrix, version, nprobe)
+        if index is not None and (not n_lists or index.n_lists == min(n_lists, len(matrix))):
+            return index
+    index = build_index(matrix, kind, n_lists=n_lists, nprobe=nprobe)
+    if index_path:
+        try:
+            index.save(index_path, version)
+        except OSError:
+            pass  # read-only deployment: keep the in-memory index
+    return index
@@ -0,0 +1,117 @@
+"""
+Token-budgeted packing of retrieved examples into the Gemini prompt.
+
+Examples are added in relevance order while they fit CONTEXT_TOKEN_BUDGET. An
+example that does not fit is truncated to the space left, cutting its output at
+the last code-structure boundary (a closed top-level `}` block, a blank line or
+a dedent back to column 0) rather than mid-statement, provided at least
+CONTEXT_MIN_EXAMPLE_TOKENS remain; otherwise it is skipped.
+
+Tokens are counted with tiktoken (imported on first use) and estimated at about
+four characters per token when it is not installed. Neither is Gemini's own
+tokenizer, so budgets are approximate.
+"""
+import os
+import math
+import threading
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_MIN_EXAMPLE_TOKENS = int(os.getenv("CONTEXT_MIN_EXAMPLE_TOKENS", "64"))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+CHARS_PER_TOKEN = 4  # fallback estimate without tiktoken
+TRUNCATION_MARKER = "\n... (truncated)"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """The tiktoken encoding, or False if tiktoken is unavailable."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+                except Exception:  # not installed, or the encoding cannot be downloaded
+                    _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    """Number of tokens in `text` (tiktoken, or the characters-per-token estimate)."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _boundaries(lines):
+    """Line counts after which the code is at a structure boundary."""
+    cuts = []
+    depth = 0
+    for i, line in enumerate(lines):
+        depth = max(0, depth + line.count("{") - line.count("}"))
+        if depth:
+            continue
+        following = lines[i + 1] if i + 1 < len(lines) else ""
+        if not line.strip() or not following.strip() or not following[:1].isspace():
+            cuts.append(i + 1)
+    return cuts
+
+
+def truncate_code(text, max_tokens, count=count_tokens):
+    """
+    Shortens `text` to at most `max_tokens` tokens (marker included), ending at a
+    structure boundary when one fits and at a whole line otherwise.
+    """
+    if count(text) <= max_tokens:
+        return text
+    budget = max_tokens - count(TRUNCATION_MARKER)
+    lines = text.split("\n")
+    # Per-line counts are additive enough to find the cut without re-encoding every prefix
+    used = []
+    total = 0
+    for line in lines:
+        total += count(line + "\n")
+        used.append(total)
+    fits = [n for n in _boundaries(lines) if used[n - 1] <= budget]
+    if not fits:
+        fits = [n for n in range(1, len(lines) + 1) if used[n - 1] <= budget]
+    if not fits:
+        return ""
+    return "\n".join(lines[:fits[-1]]).rstrip() + TRUNCATION_MARKER
+
+
+def format_example(number, instruction, output):
+    """One context example as it appears in the prompt."""
+    return f"\nContext Example {number}:\nInstruction: {instruction}\nResponse:\n{output}\n"
+
+
+def pack_examples(samples, budget=CONTEXT_TOKEN_BUDGET, count=count_tokens):
+    """
+    Picks and trims `samples` (best first) to fit `budget` tokens.
+
+    Returns (packed, tokens): (instruction, output) pairs in relevance order, with
+    outputs possibly truncated, and the tokens their formatted examples use.
+    """
+    packed = []
+    tokens = 0
+    for sample in samples:
+        instruction, output = sample.get("instruction", "N/A"), sample.get("output", "N/A")
+        cost = count(format_example(len(packed) + 1, instruction, output))
+        if tokens + cost > budget:
+            overhead = count(format_example(len(packed) + 1, instruction, ""))
+            room = budget - tokens - overhead
+            if room < CONTEXT_MIN_EXAMPLE_TOKENS:
+                continue
+            output = truncate_code(output, room, count)
+            cost = count(format_example(len(packed) + 1, instruction, output))
+            if tokens + cost > budget:
+                continue
+        packed.append((instruction, output))
+        tokens += cost
+    return packed, tokens
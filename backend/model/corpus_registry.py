@@ -0,0 +1,139 @@
+"""
+Registry of named corpora.
+
+Without a manifest there is one corpus, "default": the vector_samples store (or
+vector_samples.jsonl) llm.py has always used. With CORPORA_MANIFEST pointing at a
+JSON file (model/data/corpora.json by default, see corpora.example.json), every
+corpus gets its own store, ANN parameters and memory budget:
+
+    {"corpora": [
+        {"name": "agentkit", "store": "agentkit", "source": "agentKitContext.jsonl",
+         "keywords": ["agentkit", "transfer", "balance"], "ann": {"index": "exact"}},
+        {"name": "solidity", "store": "solidity", "source": "solidity_rag_dataset.jsonl",
+         "keywords": ["solidity", "contract", "erc20"], "ann": {"index": "ivf", "nprobe": 12},
+         "memory_budget_mb": 256}
+    ]}
+
+Paths are relative to the manifest. A request may name the corpora to search;
+otherwise route() picks the corpora whose keywords occur in the instruction and
+leaves the rest to the engine's embedding router. Kept free of numpy so the API
+server can validate corpus names and compute cache versions cheaply.
+"""
+import os
+import re
+import json
+
+from versioning import file_version
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(MODEL_DIR, "data")
+CORPORA_MANIFEST = os.getenv("CORPORA_MANIFEST", os.path.join(DATA_DIR, "corpora.json"))
+DEFAULT_CORPUS = "default"
+WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+class CorpusSpec:
+    """
+    Configuration of one named corpus.
+
+    Parameters:
+        name (str): Name used in requests.
+        store_base (str): Binary store base path (vector_store.py).
+        samples_file (str): JSONL fallback with inline embeddings, if any.
+        source (str): Raw data create_embeddings.py builds the store from (.jsonl or scraped .txt).
+        keywords (tuple): Words that route an instruction to this corpus.
+        ann (dict): ANN index parameters: "index" (auto | ivf | exact), "n_lists", "nprobe".
+        memory_budget_mb (float): Most memory the scoring matrix may take (0: unlimited); larger
+            float32 stores are quantized to int8 on load.
+        routable (bool): Whether automatic routing may pick this corpus.
+    """
+
+    def __init__(self, name, store_base, samples_file=None, source=None, keywords=(), ann=None,
+                 memory_budget_mb=0, routable=True):
+        self.name = name
+        self.store_base = store_base
+        self.samples_file = samples_file
+        self.source = source
+        self.keywords = tuple(keyword.lower() for keyword in keywords)
+        self.ann = dict(ann or {})
+        self.memory_budget_mb = memory_budget_mb
+        self.routable = routable
+
+    def __repr__(self):
+        return f"CorpusSpec({self.name!r}, {self.store_base!r})"
+
+
+def default_registry():
+    """The single corpus used when there is no manifest."""
+    return {DEFAULT_CORPUS: CorpusSpec(
+        DEFAULT_CORPUS, os.path.join(DATA_DIR, "vector_samples"), os.path.join(DATA_DIR, "vector_samples.jsonl"))}
+
+
+def load_registry(manifest_path=CORPORA_MANIFEST):
+    """Returns {name: CorpusSpec} from the manifest, or the default registry if it does not exist."""
+    if not manifest_path or not os.path.exists(manifest_path):
+        return default_registry()
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    registry = {}
+    for entry in manifest.get("corpora", []):
+        name = entry["name"]
+        if name in registry:
+            raise ValueError(f"Duplicate corpus name in {manifest_path}: {name}")
+        resolve = lambda path: os.path.join(root, path) if path else None
+        registry[name] = CorpusSpec(
+            name, resolve(entry.get("store", name)), resolve(entry.get("samples_file")), resolve(entry.get("source")),
+            entry.get("keywords", ()), entry.get("ann"), float(entry.get("memory_budget_mb", 0)),
+            bool(entry.get("routable", True)))
+    if not registry:
+        raise ValueError(f"No corpora defined in {manifest_path}")
+    return registry
+
+
+def corpus_version(spec):
+    """Changes whenever the corpus' store (or, without one, its JSONL file) is rewritten."""
+    meta_path = spec.store_base + ".meta.json"  # vector_store.store_paths(); written last
+    if os.path.exists(meta_path):
+        return "store-" + file_version(meta_path)
+    return file_version(spec.samples_file) if spec.samples_file else "missing"
+
+
+def registry_version(versions):
+    """
+    One version string for {name: version} of every corpus. A lone default corpus
+    keeps its plain store version.
+    """
+    if list(versions) == [DEFAULT_CORPUS]:
+        return versions[DEFAULT_CORPUS]
+    return "|".join(f"{name}:{version}" for name, version in sorted(versions.items()))
+
+
+def parse_corpora(value, registry):
+    """
+    Validates a request's corpus selection: a name, a list of names or None.
+    Returns a tuple of names, or None for automatic routing. Raises ValueError.
+    """
+    if value is None or value == "" or value == []:
+        return None
+    names = [value] if isinstance(value, str) else value
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ValueError("corpus must be a corpus name or a list of names")
+    unknown = [name for name in names if name not in registry]
+    if unknown:
+        raise ValueError(f"Unknown corpus: {', '.join(unknown)} (available: {', '.join(registry)})")
+    return tuple(dict.fromkeys(names))
+
+
+def route(registry, instruction, requested=None):
+    """
+    Corpora to search: the requested ones, else the routable corpora with a keyword
+    in the instruction. Returns None when no keyword matches, leaving the choice to
+    the engine's embedding router.
+    """
+    if requested:
+        return tuple(requested)
+    words = set(WORD_PATTERN.findall(instruction.lower()))
+    matched = tuple(name for name, spec in registry.items()
+                    if spec.routable and any(keyword in words for keyword in spec.keywords))
+    return matched or None
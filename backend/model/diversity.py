@@ -0,0 +1,55 @@
+"""
+Maximal marginal relevance (MMR) selection of context samples.
+
+The nearest samples to an instruction are often near-duplicates of each other
+(five variations of transfer_eth), which cost prompt tokens without telling
+Gemini anything new. mmr_select() picks the context greedily by
+
+    lambda * relevance - (1 - lambda) * max similarity to the samples already picked
+
+over the candidates' cosine similarity matrix, and drops every candidate at
+least MMR_DUPLICATE_THRESHOLD similar to a picked one, so a prompt can end up
+with fewer than NUM_CONTEXT_SAMPLES examples. Each step is one vectorized
+update of the per-candidate penalty, so selecting k of n candidates costs one
+(n, n) matrix product plus O(k * n).
+"""
+import os
+
+import numpy as np
+
+from vector_store import normalize_rows
+
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1: relevance only, 0: diversity only
+MMR_DUPLICATE_THRESHOLD = float(os.getenv("MMR_DUPLICATE_THRESHOLD", "0.95"))  # 1 or more keeps duplicates
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))  # first-pass candidates MMR chooses from
+
+
+def mmr_select(relevance, vectors, top_n, lambda_=MMR_LAMBDA, duplicate_threshold=MMR_DUPLICATE_THRESHOLD):
+    """
+    Indices of up to `top_n` candidates in selection order.
+
+    Parameters:
+        relevance (np.ndarray): (n,) relevance of each candidate to the query.
+        vectors (np.ndarray): (n, dim) candidate embeddings; normalized here.
+        top_n (int): Most candidates to select.
+        lambda_ (float): Trade-off between relevance (1) and diversity (0).
+        duplicate_threshold (float): Candidates this similar to a selected one are dropped.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    if not len(relevance) or top_n <= 0:
+        return []
+    vectors = normalize_rows(vectors)
+    similarity = vectors @ vectors.T
+
+    # Cosine similarity is at least -1, so this penalizes nothing before the first pick
+    max_similarity = np.full(len(relevance), -1.0, dtype=np.float32)
+    available = np.ones(len(relevance), dtype=bool)
+    selected = []
+    while len(selected) < top_n and available.any():
+        scores = lambda_ * relevance - (1 - lambda_) * max_similarity
+        best = int(np.argmax(np.where(available, scores, -np.inf)))
+        selected.append(best)
+        available[best] = False
+        available &= similarity[best] < duplicate_threshold
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
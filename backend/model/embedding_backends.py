@@ -0,0 +1,129 @@
+"""
+Selectable backends for the MiniLM embedding model.
+
+    torch   SentenceTransformer on PyTorch (the default)
+    onnx    ONNX Runtime session plus a Hugging Face `tokenizers` tokenizer; no torch
+            import at serving time. Optionally int8 dynamically quantized.
+
+Both expose encode(sentences, normalize_embeddings=False) -> float32 array, so
+llm.py and create_embeddings.py can use either. The ONNX files are produced once,
+where torch is installed, with:
+
+    python embedding_backends.py export model/data/minilm-onnx [--int8]
+
+and picked up with EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_DIR=model/data/minilm-onnx.
+"""
+import os
+import sys
+
+import numpy as np
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch | onnx
+EMBEDDING_ONNX_DIR = os.getenv(
+    "EMBEDDING_ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "minilm-onnx"))
+EMBEDDING_ONNX_INT8 = os.getenv("EMBEDDING_ONNX_INT8", "0") == "1"
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))  # 0: onnxruntime default
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2's max_seq_length
+
+
+def mean_pool(token_embeddings, attention_mask):
+    """Averages the token embeddings of each sentence, ignoring padding (sentence-transformers' pooling)."""
+    mask = attention_mask[..., None].astype(np.float32)
+    return (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def l2_normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class OnnxEmbeddingModel:
+    """
+    MiniLM on ONNX Runtime.
+
+    Parameters:
+        model_dir (str): Directory with model.onnx (and/or model_int8.onnx) and tokenizer.json.
+        int8 (bool): Use the int8 dynamically quantized model.
+        batch_size (int): Sentences per session run.
+    """
+
+    def __init__(self, model_dir=EMBEDDING_ONNX_DIR, int8=EMBEDDING_ONNX_INT8, batch_size=32,
+                 max_seq_length=MAX_SEQ_LENGTH, threads=EMBEDDING_ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, ONNX_INT8_MODEL_FILE if int8 else ONNX_MODEL_FILE)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        batches = []
+        for start in range(0, len(sentences), self.batch_size):
+            encodings = self.tokenizer.encode_batch(list(sentences[start:start + self.batch_size]))
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            token_embeddings = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+            batches.append(mean_pool(token_embeddings, inputs["attention_mask"]))
+        vectors = np.concatenate(batches).astype(np.float32) if batches else np.zeros((0, 0), dtype=np.float32)
+        return l2_normalize(vectors) if normalize_embeddings else vectors
+
+
+def load_embedding_model(model_name, backend=EMBEDDING_BACKEND, **kwargs):
+    """Returns an embedding model with an encode() method for `backend` ("torch" or "onnx")."""
+    if backend == "onnx":
+        return OnnxEmbeddingModel(**kwargs)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def export_onnx(model_name, out_dir, int8=False):
+    """Exports `model_name`'s transformer and tokenizer for OnnxEmbeddingModel (needs torch)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, TOKENIZER_FILE))
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(out_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, tuple(sample[name] for name in names), model_path,
+            input_names=names, output_names=["last_hidden_state"], dynamic_axes=dynamic_axes, opset_version=14)
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(out_dir, ONNX_INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+    return out_dir
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "export":
+        print("Usage: python embedding_backends.py export <out_dir> [--int8]", file=sys.stderr)
+        sys.exit(1)
+    export_onnx("sentence-transformers/all-MiniLM-L6-v2", sys.argv[2], int8="--int8" in sys.argv[3:])
+    print(f"Exported ONNX model and tokenizer to {sys.argv[2]}")
@@ -0,0 +1,160 @@
+"""
+LRU cache of query embeddings.
+
+Chat prompts repeat a lot, so LLMEngine wraps its embedding model in a
+CachedEmbeddingModel: already-seen instructions are answered from memory and
+only the misses of a call are sent to the model, as one batch. Vectors are kept
+as float16 by default (768 bytes for MiniLM's 384 dims) and returned as float32.
+
+With EMBEDDING_CACHE_PATH set, the cache is saved every EMBEDDING_CACHE_SAVE_EVERY
+new entries and when the engine closes, and reloaded on startup, so a restarted
+worker starts with the popular queries already embedded.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")  # float16 | float32
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_SAVE_EVERY = int(os.getenv("EMBEDDING_CACHE_SAVE_EVERY", "500"))
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU map from text to embedding vector.
+
+    Parameters:
+        max_entries (int): Maximum number of cached vectors (0 disables the cache).
+        dtype (str): Storage dtype, "float16" or "float32".
+        namespace (str): Identifies the embedding model; a persisted cache from another model is ignored.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, dtype=EMBEDDING_CACHE_DTYPE, namespace=""):
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, texts):
+        """Returns a list with the cached float32 vector or None for each text."""
+        results = []
+        with self._lock:
+            for text in texts:
+                vector = self._entries.get(text)
+                if vector is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self._entries.move_to_end(text)
+                    self.hits += 1
+                    results.append(vector.astype(np.float32))
+        return results
+
+    def put_many(self, texts, vectors):
+        """Stores vectors, evicting the least recently used entries. Returns the number added."""
+        if self.max_entries <= 0:
+            return 0
+        added = 0
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                if text not in self._entries:
+                    added += 1
+                self._entries[text] = np.asarray(vector, dtype=self.dtype)
+                self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return added
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Hit/miss counters, hit ratio and memory used by the vectors."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(vector.nbytes for vector in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def save(self, path):
+        """Writes the cache, least recently used first, to an .npz file (atomically)."""
+        with self._lock:
+            texts = list(self._entries)
+            vectors = list(self._entries.values())
+        dim = len(vectors[0]) if vectors else 0
+        matrix = np.stack(vectors) if vectors else np.zeros((0, dim), dtype=self.dtype)
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(tmp_path, namespace=self.namespace, texts=np.array(texts, dtype=str), vectors=matrix)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Loads entries saved by save(). Returns the number loaded (0 if missing or for another model)."""
+        try:
+            with np.load(path) as data:
+                if str(data["namespace"]) != self.namespace:
+                    return 0
+                texts, vectors = data["texts"].tolist(), data["vectors"]
+        except (OSError, KeyError, ValueError):
+            return 0
+        # Keep the most recently used entries if the file holds more than fit
+        keep = slice(max(0, len(texts) - self.max_entries), None)
+        return self.put_many(texts[keep], vectors[keep])
+
+
+class CachedEmbeddingModel:
+    """
+    Wraps a SentenceTransformer-like model so encode() is served from an EmbeddingCache.
+
+    Only `sentences` and `normalize_embeddings` are supported, which is how llm.py
+    calls the model; the result is a float32 (len(sentences), dim) array.
+    """
+
+    def __init__(self, model, cache, persist_path=EMBEDDING_CACHE_PATH, save_every=EMBEDDING_CACHE_SAVE_EVERY):
+        self.model = model
+        self.cache = cache
+        self.persist_path = persist_path
+        self.save_every = save_every
+        self._unsaved = 0
+        if persist_path:
+            cache.load(persist_path)
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        keys = [f"{int(normalize_embeddings)}:{sentence}" for sentence in sentences]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Duplicates within the call are encoded once
+            unique = list(dict.fromkeys(sentences[i] for i in missing))
+            encoded = np.asarray(
+                self.model.encode(unique, normalize_embeddings=normalize_embeddings, **kwargs), dtype=np.float32)
+            by_sentence = dict(zip(unique, encoded))
+            for i in missing:
+                vectors[i] = by_sentence[sentences[i]]
+            self._unsaved += self.cache.put_many([f"{int(normalize_embeddings)}:{s}" for s in unique], encoded)
+            if self.persist_path and self._unsaved >= self.save_every:
+                self.save()
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def save(self):
+        """Persists the cache if a path is configured."""
+        if self.persist_path:
+            self._unsaved = 0
+            self.cache.save(self.persist_path)
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,557 @@
+"""
+The warm RAG + Gemini pipeline behind llm.py.
+
+Importing this module pulls in numpy and the retrieval stack but nothing
+heavier: the Gemini client (gemini_client.py) is created when an LLMEngine is built and the
+embedding model (torch or ONNX Runtime) on first use, through
+default_embedding_model().
+"""
+import sys
+import json
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import numpy as np
+from prompting import (
+    GEMINI_MODEL_NAME, CodeFenceExtractor,
+    build_full_prompt, extract_code, format_context_chunks, normalize_instruction,
+)
+from context_packer import count_tokens
+from gemini_client import GeminiClient
+from semantic_cache import SemanticCache
+from stage_timing import record_stage, timed_stage
+from vector_store import QuantizedMatrix, VectorStore, load_store, normalize_rows, store_exists
+from ann_index import ANN_INDEX, INDEX_SUFFIX, load_or_build_index
+from corpus_registry import CorpusSpec, DEFAULT_CORPUS, corpus_version, load_registry, registry_version, route
+from retriever import RRF_K, Retriever
+from lexical_index import LEXICAL_SUFFIX, load_or_build_lexical_index
+from embedding_cache import CachedEmbeddingModel, EmbeddingCache
+from micro_batcher import BatchingEmbeddingModel
+from reranker import RERANK_CANDIDATES, load_reranker
+from diversity import MMR_CANDIDATES, mmr_select
+from embedding_backends import EMBEDDING_BACKEND, EMBEDDING_ONNX_INT8, load_embedding_model
+
+# Set default model globally (PyTorch, or ONNX Runtime with EMBEDDING_BACKEND=onnx)
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Identifies which vectors the query embedding cache holds
+EMBEDDING_MODEL_ID = f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}" + (
+    ":int8" if EMBEDDING_BACKEND == "onnx" and EMBEDDING_ONNX_INT8 else "")
+_default_embedding_model = None
+_default_embedding_model_lock = threading.Lock()
+
+# Configure your API key
+load_dotenv()  # Load environment variables from .env file
+
+GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# --- Context Injection Setup ---
+# Get the directory of the current script
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_FILE = os.path.join(SCRIPT_DIR, "data", "vector_samples.jsonl")
+# Binary store (vector_samples.npy + vector_samples.meta.json), preferred over the JSONL file
+STORE_BASE = os.path.join(SCRIPT_DIR, "data", "vector_samples")
+NUM_CONTEXT_SAMPLES = 5  # Number of top matching samples to include as context
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "1") == "1"  # micro-batch concurrent query embeddings
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"  # fuse BM25 with vector search
+CONTEXT_DIVERSITY = os.getenv("CONTEXT_DIVERSITY", "1") == "1"  # MMR selection, near-duplicates dropped
+GEMINI_BATCH_CONCURRENCY = int(os.getenv("GEMINI_BATCH_CONCURRENCY", "8"))  # Parallel Gemini calls per batch
+STORE_RELOAD_INTERVAL = float(os.getenv("STORE_RELOAD_INTERVAL", "5"))  # seconds between store checks, 0: never
+# Automatic routing searches every corpus whose centroid is this close to the best one's
+CORPUS_ROUTER_MARGIN = float(os.getenv("CORPUS_ROUTER_MARGIN", "0.05"))
+
+def default_embedding_model():
+    """The shared embedding model, loaded on first call."""
+    global _default_embedding_model
+    with _default_embedding_model_lock:
+        if _default_embedding_model is None:
+            with timed_stage("embedding_model_load"):
+                _default_embedding_model = load_embedding_model(EMBEDDING_MODEL_NAME)
+        return _default_embedding_model
+
+def load_samples(filepath):
+    """Loads instructions and outputs from a .jsonl file."""
+    samples = []
+    if not os.path.exists(filepath):
+
+        print(f"Warning: Samples file not found at {filepath}. No context will be injected.", file=sys.stderr)
+        return samples
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                samples.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON from line: {line.strip()} - {e}", file=sys.stderr)
+    return samples
+
+def load_vector_store(store_base=STORE_BASE, samples_file=SAMPLES_FILE):
+    """
+    Loads the binary vector store, falling back to the JSONL samples file
+    (embeddings parsed from JSON once) when no binary store has been built.
+    """
+    if store_exists(store_base):
+        return load_store(store_base)
+    samples = load_samples(samples_file)
+    if not samples:
+        return VectorStore([], np.zeros((0, 0), dtype=np.float32))
+    return VectorStore(samples, sample_matrix(samples))
+
+class Corpus:
+    """One loaded version of a named corpus and its indexes. Never modified, only replaced."""
+
+    def __init__(self, name, version, samples, retriever, centroid=None):
+        self.name = name
+        self.version = version
+        self.samples = samples
+        self.retriever = retriever
+        self.centroid = centroid  # normalized mean embedding, for routing
+
+class CorpusSet:
+    """The loaded corpora by name and their combined version; replaced as a whole on reload."""
+
+    def __init__(self, corpora):
+        self.corpora = corpora
+        self.version = registry_version({name: corpus.version for name, corpus in corpora.items()})
+
+def _centroid(matrix, chunk=16384):
+    if not len(matrix):
+        return None
+    total = np.zeros(matrix.shape[1], dtype=np.float64)
+    for start in range(0, len(matrix), chunk):
+        total += np.asarray(matrix[start:start + chunk], dtype=np.float32).sum(axis=0)
+    return normalize_rows(total[None, :])[0]
+
+def _merge_hits(dense, lexical, depth, k=RRF_K):
+    """
+    The top `depth` (score, corpus, id) hits of several corpora. Without BM25 rankings
+    the cosine hits are merged by score. With them, the cosine ranking over every
+    corpus (comparable: one embedding model) and each corpus' own BM25 ranking (not
+    comparable: IDF is per corpus) are fused by reciprocal rank, as Retriever.search()
+    does for one corpus.
+    """
+    dense = sorted(dense, key=lambda hit: -hit[0])
+    if not lexical:
+        return dense[:depth]
+    fused = {}
+    for ranking in [[(corpus, j) for _, corpus, j in dense]] + lexical:
+        for rank, (corpus, j) in enumerate(ranking, 1):
+            score = fused.get((corpus.name, j), (0.0,))[0]
+            fused[corpus.name, j] = (score + 1.0 / (k + rank), corpus, j)
+    return sorted(fused.values(), key=lambda hit: -hit[0])[:depth]
+
+def _fit_memory_budget(spec, store):
+    """
+    Quantizes a float32 matrix over the corpus' memory budget to int8, which scores
+    faster than float16 as well as taking half the memory (see
+    retriever.benchmark_quantization()). Returns (matrix, rescore).
+    """
+    budget = spec.memory_budget_mb * 2 ** 20
+    matrix, rescore = store.matrix, store.rescore_matrix
+    if not budget or matrix.nbytes <= budget:
+        return matrix, rescore
+    if isinstance(matrix, np.ndarray):
+        quantized = QuantizedMatrix.quantize(matrix, "int8")
+        if quantized.nbytes <= budget:
+            rescore = matrix if rescore is None else rescore
+            if not isinstance(rescore, np.memmap):
+                # Resident float32 rows would blow the budget (JSONL fallback): no rescoring
+                print(f"Warning: corpus {spec.name!r} is scored on int8 embeddings without float32 "
+                      f"rescoring; build its binary store to rescore from disk.", file=sys.stderr)
+                rescore = None
+            # Memory-mapped float32 rows are only paged in to rescore candidates
+            return quantized, rescore
+    raise ValueError(f"Corpus {spec.name!r} needs {matrix.nbytes / 2 ** 20:.1f} MiB, "
+                     f"over its {spec.memory_budget_mb:g} MiB budget")
+
+def load_corpus(spec):
+    """Loads a corpus' current store and builds (or loads) its ANN and BM25 indexes."""
+    # Read the version first: a store rewritten mid-load then shows up as a newer version
+    version = corpus_version(spec)
+    with timed_stage("load_samples"):
+        store = load_vector_store(spec.store_base, spec.samples_file)
+    model = store.meta.get("model")
+    if model and model != EMBEDDING_MODEL_NAME:
+        raise ValueError(f"Corpus {spec.name!r} was embedded with {model}, queries use {EMBEDDING_MODEL_NAME}")
+    matrix, rescore = _fit_memory_budget(spec, store)
+    built = version.startswith("store-")
+    index_version = version[len("store-"):] if built else ""
+    with timed_stage("ann_index_load"):
+        index = load_or_build_index(
+            matrix, spec.store_base + INDEX_SUFFIX if built else None, index_version,
+            spec.ann.get("index", ANN_INDEX), spec.ann.get("n_lists"), spec.ann.get("nprobe"))
+    lexical = None
+    if HYBRID_RETRIEVAL:
+        with timed_stage("lexical_index_load"):
+            lexical = load_or_build_lexical_index(
+                store.samples, spec.store_base + LEXICAL_SUFFIX if built else None, index_version)
+    retriever = Retriever(store.samples, matrix, index, rescore_matrix=rescore, lexical=lexical)
+    return Corpus(spec.name, version, store.samples, retriever, _centroid(matrix))
+
+def find_matching_samples(user_instruction, samples, model=None, top_n=5, threshold=0.5,
+                          retriever=None):
+    """
+    Finds the top-N samples most similar to the user's instruction
+    using cosine similarity of precomputed embeddings.
+
+    Only returns samples with similarity >= `threshold`.
+
+    Parameters:
+        user_instruction (str): The input prompt or query.
+        samples (list): List of dicts with 'embedding' keys.
+        model: SentenceTransformer or similar embedding model; default_embedding_model() if omitted.
+        top_n (int): Max number of similar samples to return.
+        threshold (float): Minimum similarity score to accept a sample.
+        retriever (Retriever): Prebuilt retriever over `samples`; built from their embeddings if omitted.
+    """
+    return find_matching_samples_batch([user_instruction], samples, model, top_n, threshold, retriever)[0]
+
+def sample_matrix(samples):
+    """Stacks the sample embeddings into a row-normalized float32 matrix."""
+    return normalize_rows(np.array([sample["embedding"] for sample in samples], dtype=np.float32))
+
+def find_matching_samples_batch(user_instructions, samples, model=None, top_n=5,
+                                threshold=0.5, retriever=None):
+    """
+    Batched find_matching_samples(): encodes every instruction in one model call
+    and scores the whole batch with a single matrix multiply.
+
+    Parameters:
+        user_instructions (list): The input prompts or queries.
+        samples (list): List of dicts with 'embedding' keys.
+        model: SentenceTransformer or similar embedding model; default_embedding_model() if omitted.
+        top_n (int): Max number of similar samples to return per instruction.
+        threshold (float): Minimum similarity score to accept a sample.
+        retriever (Retriever): Prebuilt retriever over `samples`; built from their embeddings if omitted.
+
+    Returns one list of samples per instruction.
+    """
+    if retriever is None:
+        retriever = Retriever.from_samples(samples)
+    model = model or default_embedding_model()
+    with timed_stage("query_embedding"):
+        query_embeddings = np.asarray(model.encode(user_instructions, normalize_embeddings=True), dtype=np.float32)
+    with timed_stage("similarity"):
+        return retriever.retrieve(query_embeddings, top_n, threshold)
+
+
+class LLMEngine:
+    """
+    Warm RAG + Gemini pipeline.
+
+    Loads the embedding model, the vector samples and the Gemini client once so
+    that long-lived workers can answer many prompts without paying the cold start.
+
+    Samples come from the named corpora of corpus_registry.py. A request searches
+    the corpora it names, else those its keywords route to, else those whose
+    centroid is within CORPUS_ROUTER_MARGIN of the closest one; the hits are
+    merged by cosine score, or fused by reciprocal rank with hybrid retrieval.
+
+    Corpora are hot-reloaded: a background thread checks their store versions every
+    `reload_interval` seconds and loads and indexes a new version next to the old
+    one. Each request reads self.corpus_set once, so in-flight requests finish on
+    the versions they started with while new ones see a reloaded corpus as soon as
+    the reference is swapped.
+    """
+
+    def __init__(self, samples_file=SAMPLES_FILE, embedding_model=None, api_key=None, store_base=STORE_BASE,
+                 reload_interval=STORE_RELOAD_INTERVAL, registry=None):
+        api_key = api_key or GOOGLE_API_KEY
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY environment variable not set")
+
+        # Repeated instructions are answered from the query embedding cache; the
+        # misses of concurrent requests are encoded together by the micro-batcher
+        embedding_model = embedding_model or default_embedding_model()
+        self.embedding_batcher = BatchingEmbeddingModel(embedding_model) if EMBEDDING_BATCHING else None
+        self.embedding_model = CachedEmbeddingModel(
+            self.embedding_batcher or embedding_model, EmbeddingCache(namespace=EMBEDDING_MODEL_ID))
+        if registry is None:
+            # Explicit paths mean a single corpus; the defaults defer to the manifest, if any
+            registry = (load_registry() if (store_base, samples_file) == (STORE_BASE, SAMPLES_FILE)
+                        else {DEFAULT_CORPUS: CorpusSpec(DEFAULT_CORPUS, store_base, samples_file)})
+        self.registry = registry
+        self.corpus_set = CorpusSet({name: load_corpus(spec) for name, spec in registry.items()})
+        self.reloads = 0
+        self.reload_failures = 0
+        # Concurrency limit, timeouts, retries and hedging for every Gemini call of this worker
+        self.gemini = GeminiClient.from_env(api_key, GEMINI_MODEL_NAME)
+        # Completions of paraphrased prompts with identical parameters are reused
+        self.completion_cache = SemanticCache()
+        # Optional second pass over the top candidates, capped at RERANK_BUDGET_MS per request
+        self.reranker = load_reranker()
+
+        self._closed = threading.Event()
+        self._watcher = None
+        if reload_interval > 0:
+            self._watcher = threading.Thread(
+                target=self._watch_store, args=(reload_interval,), name="store-watcher", daemon=True)
+            self._watcher.start()
+
+    @property
+    def samples(self):
+        return [sample for corpus in self.corpus_set.corpora.values() for sample in corpus.samples]
+
+    def reload_if_changed(self, skip=None):
+        """
+        Loads every corpus whose store version changed and swaps in the new corpus set.
+        Versions in `skip` ({name: version}) are not retried; failed ones are added to it.
+        Returns True if a corpus was replaced.
+        """
+        current = self.corpus_set.corpora
+        corpora = dict(current)
+        for name, spec in self.registry.items():
+            version = corpus_version(spec)
+            if version == current[name].version or (skip is not None and skip.get(name) == version):
+                continue
+            try:
+                with timed_stage("store_reload"):
+                    corpora[name] = load_corpus(spec)
+            except Exception as e:
+                self.reload_failures += 1
+                if skip is not None:
+                    skip[name] = version
+                print(f"Error: failed to reload corpus {name} ({version}): {e}", file=sys.stderr)
+        if all(corpora[name] is current[name] for name in corpora):
+            return False
+        self.corpus_set = CorpusSet(corpora)
+        # Cached completions were generated with the old context
+        self.completion_cache.clear()
+        self.reloads += 1
+        return True
+
+    def _watch_store(self, interval):
+        # A store that failed to load is retried only once it is rewritten again
+        failed = {}
+        while not self._closed.wait(interval):
+            self.reload_if_changed(skip=failed)
+
+    def stats(self):
+        """Counters reported to the server's /metrics through the worker pool."""
+        stats = {
+            "embedding_cache": self.embedding_model.stats(),
+            "gemini": self.gemini.stats(),
+            "semantic_cache": self.completion_cache.stats(),
+            "store": {"reloads": self.reloads, "reload_failures": self.reload_failures},
+        }
+        if self.embedding_batcher is not None:
+            stats["embedding_batcher"] = self.embedding_batcher.stats()
+        if self.reranker is not None:
+            stats["reranker"] = self.reranker.stats()
+        return stats
+
+    def close(self):
+        """Persists the query embedding cache (if EMBEDDING_CACHE_PATH is set) and closes the Gemini client."""
+        self._closed.set()
+        self.embedding_model.save()
+        self.gemini.close()
+
+    def embed(self, instructions):
+        """Normalized query embeddings of the instructions (cached and micro-batched)."""
+        with timed_stage("query_embedding"):
+            return np.asarray(self.embedding_model.encode(instructions, normalize_embeddings=True), dtype=np.float32)
+
+    def select_corpora(self, instruction, query_embedding, corpora=None, corpus_set=None):
+        """Names of the corpora to search: requested, keyword-routed or closest by centroid."""
+        corpus_set = corpus_set or self.corpus_set
+        names = route(self.registry, instruction, corpora)
+        if names is not None:
+            return names
+        candidates = [corpus for name, corpus in corpus_set.corpora.items()
+                      if self.registry[name].routable and corpus.centroid is not None]
+        if len(candidates) <= 1:
+            return tuple(corpus.name for corpus in candidates) or tuple(corpus_set.corpora)
+        similarities = np.array([corpus.centroid @ query_embedding for corpus in candidates])
+        close = similarities >= similarities.max() - CORPUS_ROUTER_MARGIN
+        return tuple(corpus.name for corpus, keep in zip(candidates, close) if keep)
+
+    def _search(self, corpus_set, instructions, query_embeddings, selections, top_n):
+        """
+        Top `top_n` samples per instruction over its selected corpora, merged by
+        cosine score or, with hybrid retrieval, fused across corpora (_merge_hits).
+        With a reranker the top RERANK_CANDIDATES are reordered first; with
+        CONTEXT_DIVERSITY the samples are then picked from the top MMR_CANDIDATES by MMR,
+        with relevance taken from the reranked or fused order when there is one.
+        """
+        depth = top_n
+        if self.reranker is not None:
+            depth = max(depth, RERANK_CANDIDATES)
+        if CONTEXT_DIVERSITY:
+            depth = max(depth, MMR_CANDIDATES)
+        hits = [[] for _ in instructions]  # (cosine, corpus, id)
+        lexical = [[] for _ in instructions]  # one BM25 ranking of (corpus, id) per hybrid corpus
+        with timed_stage("similarity"):
+            for name in dict.fromkeys(name for selection in selections for name in selection):
+                corpus = corpus_set.corpora[name]
+                rows = [i for i, selection in enumerate(selections) if name in selection]
+                if not corpus.samples:
+                    continue
+                rankings = corpus.retriever.rankings(
+                    query_embeddings[rows], depth, texts=[instructions[i] for i in rows])
+                for i, (ids, scores, lexical_ids) in zip(rows, rankings):
+                    hits[i].extend((float(score), corpus, int(j)) for j, score in zip(ids, scores))
+                    if lexical_ids is not None:
+                        lexical[i].append([(corpus, int(j)) for j in lexical_ids])
+            candidates = [_merge_hits(found, ranked, depth) for found, ranked in zip(hits, lexical)]
+        if self.reranker is not None:
+            with timed_stage("rerank"):
+                orders = self.reranker.rerank(
+                    instructions, [[corpus.samples[j] for _, corpus, j in found] for found in candidates])
+            candidates = [[found[k] for k in order] for found, order in zip(candidates, orders)]
+        if not CONTEXT_DIVERSITY:
+            return [[corpus.samples[j] for _, corpus, j in found[:top_n]] for found in candidates]
+        with timed_stage("diversity"):
+            return [self._diversify(query, found, top_n) for query, found in zip(query_embeddings, candidates)]
+
+    def _diversify(self, query_embedding, candidates, top_n):
+        """MMR selection of up to `top_n` of the (score, corpus, id) candidates, duplicates dropped."""
+        if not candidates:
+            return []
+        vectors = np.concatenate([corpus.retriever.vectors([j]) for _, corpus, j in candidates])
+        fused = any(corpus.retriever.lexical is not None for _, corpus, _ in candidates)
+        if self.reranker is not None or fused:
+            # Relevance follows the reranked or BM25-fused order, which cosine similarity would undo
+            relevance = 1 - np.arange(len(candidates), dtype=np.float32) / len(candidates)
+        else:
+            relevance = normalize_rows(vectors) @ np.asarray(query_embedding, dtype=np.float32)
+        return [candidates[k][1].samples[candidates[k][2]] for k in mmr_select(relevance, vectors, top_n)]
+
+    def retrieve(self, instruction, top_n=NUM_CONTEXT_SAMPLES, query_embedding=None, corpora=None,
+                 corpus_set=None):
+        """Returns the context samples that best match the normalized instruction."""
+        corpus_set = corpus_set or self.corpus_set
+        if query_embedding is None:
+            query_embedding = self.embed([instruction])[0]
+        selection = self.select_corpora(instruction, query_embedding, corpora, corpus_set)
+        matching_samples = self._search(corpus_set, [instruction], query_embedding[None, :], [selection], top_n)[0]
+        if not matching_samples:
+            print("No matching samples found for context injection.", file=sys.stderr)
+        return matching_samples
+
+    def retrieve_batch(self, instructions, top_n=NUM_CONTEXT_SAMPLES, query_embeddings=None, corpora=None,
+                       corpus_set=None):
+        """retrieve() for many instructions with one encode call and one search per corpus."""
+        corpus_set = corpus_set or self.corpus_set
+        if query_embeddings is None:
+            query_embeddings = self.embed(instructions)
+        selections = [self.select_corpora(instruction, embedding, corpora, corpus_set)
+                      for instruction, embedding in zip(instructions, query_embeddings)]
+        return self._search(corpus_set, instructions, query_embeddings, selections, top_n)
+
+    def _cached(self, corpus_set, selection, query_embedding, instruction):
+        cached = self.completion_cache.get(query_embedding, instruction)
+        # Entries from other corpora, or from a request still finishing on a previous version, are ignored
+        if (cached is None or cached.get("store_version") != corpus_set.version
+                or tuple(cached.get("corpora", ())) != selection):
+            return None
+        return dict(cached, semantic_cache_hit=True)
+
+    def _remember(self, corpus_set, selection, query_embedding, instruction, result):
+        result["store_version"] = corpus_set.version
+        result["corpora"] = list(selection)
+        if "error" not in result and corpus_set is self.corpus_set:
+            self.completion_cache.put(query_embedding, instruction, result)
+        return result
+
+    def generate(self, prompt, corpora=None):
+        """
+        Runs retrieval and generation for one prompt and returns the response dict.
+        `corpora` names the corpora to search (default: routed automatically).
+        """
+        corpus_set = self.corpus_set  # this request's versions, even if a reload swaps them meanwhile
+        instruction = normalize_instruction(prompt)
+        query_embedding = self.embed([instruction])[0]
+        selection = self.select_corpora(instruction, query_embedding, corpora, corpus_set)
+        cached = self._cached(corpus_set, selection, query_embedding, instruction)
+        if cached is not None:
+            return cached
+        matching_samples = self._search(corpus_set, [instruction], query_embedding[None, :], [selection],
+                                        NUM_CONTEXT_SAMPLES)[0]
+        return self._remember(corpus_set, selection, query_embedding, instruction,
+                              self._complete(*build_full_prompt(instruction, matching_samples)))
+
+    def generate_batch(self, prompts, corpora=None):
+        """
+        Runs generate() for many prompts: retrieval is batched and the Gemini calls
+        run concurrently. Returns the response dicts in prompt order.
+        """
+        corpus_set = self.corpus_set
+        instructions = [normalize_instruction(prompt) for prompt in prompts]
+        query_embeddings = self.embed(instructions)
+        selections = [self.select_corpora(instruction, embedding, corpora, corpus_set)
+                      for instruction, embedding in zip(instructions, query_embeddings)]
+        results = [self._cached(corpus_set, selection, embedding, instruction)
+                   for selection, embedding, instruction in zip(selections, query_embeddings, instructions)]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if not misses:
+            return results
+        matches = self._search(corpus_set, [instructions[i] for i in misses], query_embeddings[misses],
+                               [selections[i] for i in misses], NUM_CONTEXT_SAMPLES)
+        full_prompts = [build_full_prompt(instructions[i], matching_samples)
+                        for i, matching_samples in zip(misses, matches)]
+        with ThreadPoolExecutor(max_workers=max(1, min(GEMINI_BATCH_CONCURRENCY, len(full_prompts)))) as executor:
+            for i, result in zip(misses, executor.map(lambda args: self._complete(*args), full_prompts)):
+                results[i] = self._remember(corpus_set, selections[i], query_embeddings[i], instructions[i], result)
+        return results
+
+    def _complete(self, full_prompt, context_chunks):
+        try:
+            with timed_stage("gemini"):
+                completion = self.gemini.generate(full_prompt)
+            return {
+                "response": extract_code(completion),
+                "context_chunks": format_context_chunks(context_chunks),  # Now a formatted string
+                "prompt_tokens": count_tokens(full_prompt)
+            }
+        except Exception as e:
+            error_msg = f"Inference error: {str(e)}"
+            print(f"Error: {error_msg}", file=sys.stderr)
+            return {"error": error_msg}
+
+    def generate_stream(self, prompt, corpora=None):
+        """
+        Streams one prompt as events.
+
+        Yields ("context", {...}) as soon as retrieval is done, then ("token", {...})
+        for every Gemini delta and ("code", {...}) for every new piece of the fenced
+        code block. Returns the same response dict generate() would.
+        """
+        corpus_set = self.corpus_set
+        instruction = normalize_instruction(prompt)
+        query_embedding = self.embed([instruction])[0]
+        selection = self.select_corpora(instruction, query_embedding, corpora, corpus_set)
+        cached = self._cached(corpus_set, selection, query_embedding, instruction)
+        if cached is not None:
+            yield "context", {"context_chunks": cached.get("context_chunks", "")}
+            yield "code", {"text": cached.get("response", "")}
+            return cached
+        matching_samples = self._search(corpus_set, [instruction], query_embedding[None, :], [selection],
+                                        NUM_CONTEXT_SAMPLES)[0]
+        full_prompt, context_chunks = build_full_prompt(instruction, matching_samples)
+        context_display = format_context_chunks(context_chunks)
+        yield "context", {"context_chunks": context_display}
+
+        extractor = CodeFenceExtractor()
+        completion = ""
+        started = time.perf_counter()
+        try:
+            for text in self.gemini.stream(full_prompt):
+                if not completion:
+                    record_stage("gemini_first_token", time.perf_counter() - started)
+                completion += text
+                yield "token", {"text": text}
+                code = extractor.feed(text)
+                if code:
+                    yield "code", {"text": code}
+        except Exception as e:
+            error_msg = f"Inference error: {str(e)}"
+            print(f"Error: {error_msg}", file=sys.stderr)
+            return {"error": error_msg}
+        record_stage("gemini", time.perf_counter() - started)
+
+        return self._remember(corpus_set, selection, query_embedding, instruction, {
+            "response": extract_code(completion),
+            "context_chunks": context_display,
+            "prompt_tokens": count_tokens(full_prompt)
+        })
+
@@ -0,0 +1,280 @@
+"""
+Shared Gemini client: bounded concurrency, timeouts, retries and hedged requests.
+
+One GeminiClient per process wraps a transport:
+
+    sdk    google.generativeai GenerativeModel (the default)
+    rest   generativelanguage REST API over a pooled httpx.Client; GEMINI_API_BASE
+           can point it at gemini_stub.py for tests and local runs
+
+Every call holds a slot of a GEMINI_MAX_CONCURRENCY semaphore and has a
+GEMINI_TIMEOUT. 429 and 5xx responses, timeouts and connection errors are retried
+up to GEMINI_MAX_RETRIES times with full-jitter exponential backoff (or the
+server's Retry-After). With GEMINI_HEDGE=1, a generate() call still running after
+the p95 of recent latencies sends a second identical request when a slot is free
+and returns whichever answer comes first. Streams are retried only until their
+first token and are never hedged.
+"""
+import os
+import json
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "sdk")  # sdk | rest
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "0") == "1"
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))  # latencies needed before hedging
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+LATENCY_WINDOW = 200
+
+
+class GeminiError(Exception):
+    """A failed Gemini call. `status` is the HTTP status, or None for timeouts and connection errors."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status in RETRYABLE_STATUSES
+
+
+class SdkTransport:
+    """google.generativeai GenerativeModel."""
+
+    def __init__(self, api_key, model_name):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    @staticmethod
+    def _error(e):
+        code = getattr(e, "code", None)
+        status = code if isinstance(code, int) else getattr(code, "value", None)
+        if isinstance(e, (TimeoutError, ConnectionError)) or isinstance(status, int):
+            return GeminiError(str(e), status if isinstance(status, int) else None)
+        return None
+
+    def generate(self, prompt, timeout):
+        try:
+            return self.model.generate_content(prompt, request_options={"timeout": timeout}).text
+        except Exception as e:
+            raise self._error(e) or e
+
+    def stream(self, prompt, timeout):
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+                try:
+                    text = chunk.text
+                except ValueError:  # chunk without text parts (e.g. safety metadata)
+                    continue
+                yield text
+        except Exception as e:
+            raise self._error(e) or e
+
+
+class RestTransport:
+    """generateContent / streamGenerateContent over a pooled httpx.Client."""
+
+    def __init__(self, api_key, model_name, base_url=GEMINI_API_BASE, max_connections=GEMINI_MAX_CONCURRENCY * 2):
+        import httpx
+        self._httpx = httpx
+        self.client = httpx.Client(
+            base_url=base_url, headers={"x-goog-api-key": api_key},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+        self.path = f"/v1beta/models/{model_name}"
+
+    @staticmethod
+    def _body(prompt):
+        return {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+
+    @staticmethod
+    def _text(response_json):
+        parts = [part.get("text", "")
+                 for candidate in response_json.get("candidates", [])[:1]
+                 for part in candidate.get("content", {}).get("parts", [])]
+        return "".join(parts)
+
+    @staticmethod
+    def _check(response):
+        if response.status_code >= 400:
+            retry_after = response.headers.get("Retry-After")
+            raise GeminiError(f"Gemini returned HTTP {response.status_code}", response.status_code,
+                              float(retry_after) if retry_after and retry_after.isdigit() else None)
+
+    def generate(self, prompt, timeout):
+        try:
+            response = self.client.post(f"{self.path}:generateContent", json=self._body(prompt), timeout=timeout)
+        except self._httpx.TransportError as e:
+            raise GeminiError(f"Gemini request failed: {e!r}")
+        self._check(response)
+        return self._text(response.json())
+
+    def stream(self, prompt, timeout):
+        try:
+            with self.client.stream("POST", f"{self.path}:streamGenerateContent", params={"alt": "sse"},
+                                    json=self._body(prompt), timeout=timeout) as response:
+                if response.status_code >= 400:
+                    response.read()
+                self._check(response)
+                for line in response.iter_lines():
+                    if line.startswith("data:"):
+                        text = self._text(json.loads(line[5:]))
+                        if text:
+                            yield text
+        except self._httpx.TransportError as e:
+            raise GeminiError(f"Gemini request failed: {e!r}")
+
+    def close(self):
+        self.client.close()
+
+
+class GeminiClient:
+    """
+    Concurrency-limited, retrying, optionally hedging front of a transport.
+
+    Parameters:
+        transport: Object with generate(prompt, timeout) -> str and stream(prompt, timeout) -> iterator of str.
+        max_concurrency (int): Calls (hedges included) in flight at once.
+        timeout (float): Seconds per attempt.
+        max_retries (int): Retries after the first attempt.
+        hedge (bool): Send a second request when the first outlives the p95 latency.
+    """
+
+    def __init__(self, transport, max_concurrency=GEMINI_MAX_CONCURRENCY, timeout=GEMINI_TIMEOUT,
+                 max_retries=GEMINI_MAX_RETRIES, backoff_base=GEMINI_BACKOFF_BASE, backoff_max=GEMINI_BACKOFF_MAX,
+                 hedge=GEMINI_HEDGE, hedge_min_samples=GEMINI_HEDGE_MIN_SAMPLES, sleep=time.sleep):
+        self.transport = transport
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self._sleep = sleep
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="gemini")
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, api_key, model_name, backend=GEMINI_BACKEND, **kwargs):
+        """Builds a client for `backend` ("sdk" or "rest") configured from the GEMINI_* variables."""
+        if backend == "rest":
+            return cls(RestTransport(api_key, model_name), **kwargs)
+        if backend != "sdk":
+            raise ValueError(f"Unknown Gemini backend: {backend}")
+        return cls(SdkTransport(api_key, model_name), **kwargs)
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counters[key] += n
+
+    def p95(self):
+        """p95 of recent successful call latencies, or None until enough have been seen."""
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def _backoff(self, attempt, error):
+        if error.retry_after is not None:
+            return min(error.retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _with_retries(self, call):
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except GeminiError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    self._count("errors")
+                    raise
+                self._count("retries")
+                self._sleep(self._backoff(attempt, e))
+
+    def _attempt(self, prompt):
+        """One request holding a concurrency slot (taken by the caller); releases the slot."""
+        started = time.perf_counter()
+        try:
+            self._count("attempts")
+            text = self.transport.generate(prompt, self.timeout)
+        finally:
+            self._slots.release()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._latencies.append(elapsed)
+        return text
+
+    def _hedged(self, prompt):
+        self._slots.acquire()
+        threshold = self.p95() if self.hedge else None
+        if threshold is None:
+            return self._attempt(prompt)
+        futures = [self._executor.submit(self._attempt, prompt)]
+        done, _ = wait(futures, timeout=threshold)
+        # Only hedge with a free slot, so hedges never push past the concurrency limit
+        if not done and self._slots.acquire(blocking=False):
+            self._count("hedges")
+            futures.append(self._executor.submit(self._attempt, prompt))
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def generate(self, prompt):
+        """Returns the completion text. Raises GeminiError once retries are exhausted."""
+        return self._with_retries(lambda: self._hedged(prompt))
+
+    def stream(self, prompt):
+        """Yields completion deltas. Failures before the first delta are retried like generate()."""
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            started = False
+            self._slots.acquire()
+            try:
+                self._count("attempts")
+                for text in self.transport.stream(prompt, self.timeout):
+                    started = True
+                    yield text
+                return
+            except GeminiError as e:
+                if started or not e.retryable or attempt == self.max_retries:
+                    self._count("errors")
+                    raise
+                self._count("retries")
+                delay = self._backoff(attempt, e)
+            finally:
+                self._slots.release()
+            self._sleep(delay)
+
+    def stats(self):
+        """Call, retry, hedge and error counters."""
+        with self._lock:
+            return dict(self._counters)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        if hasattr(self.transport, "close"):
+            self.transport.close()
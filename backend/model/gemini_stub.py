@@ -0,0 +1,129 @@
+"""
+Local stand-in for the Gemini REST API, for tests and load runs without quota.
+
+Serves generateContent and streamGenerateContent (?alt=sse) for any model. Each
+request takes the next step of `plan`, a list of (status, delay_seconds), and
+falls back to (200, delay) once the plan is used up, so tests can script 429s,
+5xx and slow responses:
+
+    with GeminiStubServer(plan=[(503, 0), (200, 0)]) as stub:
+        transport = RestTransport("key", "gemini-2.0-flash", base_url=stub.url)
+
+Or run it standalone and start the server with GEMINI_BACKEND=rest
+GEMINI_API_BASE=http://127.0.0.1:8089:
+
+    python gemini_stub.py [port] [delay_seconds]
+"""
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_REPLY = "```python\n# stub completion\nprint({prompt!r})\n```"
+
+
+class GeminiStubServer:
+    """
+    Threaded HTTP server answering like the Gemini API.
+
+    Parameters:
+        plan (list): (status, delay_seconds) per request, in arrival order.
+        delay (float): Delay of requests past the end of the plan.
+        reply (str): Completion template; {prompt} is the last 40 characters of the prompt.
+    """
+
+    def __init__(self, plan=None, delay=0.0, reply=STUB_REPLY, port=0):
+        self.plan = list(plan or [])
+        self.delay = delay
+        self.reply = reply
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _next_step(self):
+        with self._lock:
+            self.requests += 1
+            return self.plan.pop(0) if self.plan else (200, self.delay)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, delay = stub._next_step()
+                time.sleep(delay)
+                if status != 200:
+                    payload = json.dumps({"error": {"code": status, "message": "stub error"}}).encode()
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header("Retry-After", "0")
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                prompt = "".join(part.get("text", "") for content in body.get("contents", [])
+                                 for part in content.get("parts", []))
+                text = stub.reply.format(prompt=prompt[-40:])
+                if ":streamGenerateContent" in self.path:
+                    self._stream(text)
+                else:
+                    self._send_json({"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]})
+
+            def _send_json(self, data):
+                payload = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, text):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for start in range(0, len(text), 16):
+                    chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": text[start:start + 16]}]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode())
+                    self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="gemini-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8089
+    stub = GeminiStubServer(delay=float(sys.argv[2]) if len(sys.argv) > 2 else 0.0, port=port)
+    print(f"Gemini stub listening on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
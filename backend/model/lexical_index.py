@@ -0,0 +1,182 @@
+"""
+In-memory BM25 inverted index over the samples' instruction and output text.
+
+Exact identifiers (token symbols, "ERC20", "transferFrom", Solidity function
+names) are where MiniLM similarity is weakest, so the retriever can fuse this
+index's ranking with the vector ranking (see Retriever, reciprocal rank fusion).
+
+Posting lists are stored CSR-style as three flat arrays: for term t,
+doc_ids[offsets[t]:offsets[t + 1]] are the documents containing it and
+weights[...] their precomputed BM25 term weights, so scoring a query is one
+np.bincount over the concatenated postings of its terms. Terms that occur in
+more than `max_df` of the documents (the "generate code to" every instruction
+starts with) are skipped when the query has rarer terms.
+
+Built indexes are saved next to the vector store and reused while it is
+unchanged. Benchmark with:
+    python lexical_index.py [num_samples] [num_queries]
+"""
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from ann_index import _top_k
+
+LEXICAL_SUFFIX = ".bm25.npz"  # saved next to the vector store it was built from
+LEXICAL_FORMAT_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?")
+
+
+def tokenize(text):
+    """Lowercased identifiers and numbers; `transferFrom` and `ERC20` stay whole tokens."""
+    return [token.lower() for token in TOKEN_PATTERN.findall(text or "")]
+
+
+def sample_text(sample):
+    return f"{sample.get('instruction', '')}\n{sample.get('output', '')}"
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed document set.
+
+    Parameters:
+        vocabulary (dict): term -> term id.
+        offsets (np.ndarray): int64 (len(vocabulary) + 1,) posting list boundaries.
+        doc_ids (np.ndarray): int32 document ids, grouped by term.
+        weights (np.ndarray): float32 BM25 weight of each posting.
+        num_docs (int): Number of indexed documents.
+        max_df (float): Document-frequency ratio above which query terms are skipped.
+    """
+
+    def __init__(self, vocabulary, offsets, doc_ids, weights, num_docs, max_df=0.5):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.num_docs = num_docs
+        self.max_df = max_df
+
+    def __len__(self):
+        return self.num_docs
+
+    @classmethod
+    def build(cls, texts, k1=BM25_K1, b=BM25_B, **kwargs):
+        """Indexes `texts` (one document each)."""
+        vocabulary = {}
+        term_ids, doc_ids, lengths = [], [], np.zeros(len(texts), dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc_id] = len(tokens)
+            ids = [vocabulary.setdefault(token, len(vocabulary)) for token in tokens]
+            term_ids.extend(ids)
+            doc_ids.extend([doc_id] * len(ids))
+        if not term_ids:
+            return cls(vocabulary, np.zeros(len(vocabulary) + 1, dtype=np.int64), np.empty(0, dtype=np.int32),
+                       np.empty(0, dtype=np.float32), len(texts), **kwargs)
+
+        # One (term, doc) key per token occurrence; unique keys with counts are the postings
+        keys = np.asarray(term_ids, dtype=np.int64) * len(texts) + np.asarray(doc_ids, dtype=np.int64)
+        keys, tfs = np.unique(keys, return_counts=True)
+        posting_terms, posting_docs = keys // len(texts), (keys % len(texts)).astype(np.int32)
+        df = np.bincount(posting_terms, minlength=len(vocabulary))
+        offsets = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+
+        idf = np.log1p((len(texts) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1e-9))
+        weights = (idf[posting_terms] * tfs * (k1 + 1) / (tfs + norm[posting_docs])).astype(np.float32)
+        return cls(vocabulary, offsets, posting_docs, weights, len(texts), **kwargs)
+
+    @classmethod
+    def from_samples(cls, samples, **kwargs):
+        return cls.build([sample_text(sample) for sample in samples], **kwargs)
+
+    def _query_terms(self, query):
+        terms = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        frequent = {t for t in terms if self.offsets[t + 1] - self.offsets[t] > self.max_df * self.num_docs}
+        return sorted(terms - frequent if frequent != terms else terms)
+
+    def scores(self, query):
+        """Dense float32 BM25 scores of every document for `query`."""
+        terms = self._query_terms(query)
+        if not terms:
+            return np.zeros(self.num_docs, dtype=np.float32)
+        postings = [slice(self.offsets[t], self.offsets[t + 1]) for t in terms]
+        doc_ids = np.concatenate([self.doc_ids[p] for p in postings])
+        weights = np.concatenate([self.weights[p] for p in postings])
+        return np.bincount(doc_ids, weights=weights, minlength=self.num_docs).astype(np.float32)
+
+    def search(self, queries, top_n):
+        """One (ids, scores) pair per query text, best first, matching documents only."""
+        results = []
+        for query in queries:
+            scores = self.scores(query)
+            ids = np.flatnonzero(scores)
+            best = _top_k(scores[ids], top_n)
+            results.append((ids[best], scores[ids[best]]))
+        return results
+
+    def save(self, path, version=""):
+        """Writes the index; `version` identifies the store it was built from."""
+        terms = np.empty(len(self.vocabulary), dtype=object)
+        for term, term_id in self.vocabulary.items():
+            terms[term_id] = term
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(tmp_path, format=LEXICAL_FORMAT_VERSION, version=version, num_docs=self.num_docs,
+                 terms=terms.astype(str), offsets=self.offsets, doc_ids=self.doc_ids, weights=self.weights)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, num_docs, version="", **kwargs):
+        """Loads a saved index. Returns None if it was built from another store."""
+        try:
+            with np.load(path) as data:
+                if (int(data["format"]) != LEXICAL_FORMAT_VERSION or str(data["version"]) != version
+                        or int(data["num_docs"]) != num_docs):
+                    return None
+                vocabulary = {term: term_id for term_id, term in enumerate(data["terms"].tolist())}
+                return cls(vocabulary, data["offsets"], data["doc_ids"], data["weights"], num_docs, **kwargs)
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def load_or_build_lexical_index(samples, index_path=None, version=""):
+    """Reuses the BM25 index saved at `index_path` for this store version, or builds (and saves) one."""
+    if index_path and os.path.exists(index_path):
+        index = BM25Index.load(index_path, len(samples), version)
+        if index is not None:
+            return index
+    index = BM25Index.from_samples(samples)
+    if index_path:
+        try:
+            index.save(index_path, version)
+        except OSError:
+            pass  # read-only deployment: keep the in-memory index
+    return index
+
+
+def benchmark(num_samples=100000, num_queries=200, vocabulary_size=50000, doc_length=60, seed=0):
+    """Prints build time and per-query latency on a synthetic Zipf-distributed corpus."""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocabulary_size)])
+    probabilities = 1 / np.arange(1, vocabulary_size + 1)
+    probabilities /= probabilities.sum()
+    texts = [" ".join(words[rng.choice(vocabulary_size, doc_length, p=probabilities)]) for _ in range(num_samples)]
+
+    start = time.perf_counter()
+    index = BM25Index.build(texts)
+    print(f"Built BM25 index over {num_samples} docs in {time.perf_counter() - start:.1f}s "
+          f"({len(index.vocabulary)} terms, {len(index.doc_ids)} postings)")
+    queries = [" ".join(words[rng.choice(vocabulary_size, 5, p=probabilities)]) for _ in range(num_queries)]
+    start = time.perf_counter()
+    index.search(queries, 50)
+    print(f"BM25 search: {(time.perf_counter() - start) / num_queries * 1e3:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,132 @@
+"""
+Cross-request micro-batching.
+
+A MicroBatcher collects items submitted from many threads and hands them to a
+batch function together: it waits at most `max_wait` seconds after the first
+item, or until `max_batch_size` items are queued, then calls fn(items) once and
+resolves every caller's Future with its own result. LLMEngine uses it so that
+concurrent chat requests share one SentenceTransformer.encode() call instead of
+each running a single-sentence batch.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Batches submit() calls into fn(list_of_items) -> list_of_results.
+
+    Parameters:
+        fn (callable): Processes a list of items and returns one result per item, in order.
+        max_batch_size (int): Most items passed to one fn call.
+        max_wait (float): Seconds to wait for more items after the first one arrives.
+    """
+
+    def __init__(self, fn, max_batch_size=EMBEDDING_BATCH_MAX_SIZE, max_wait=EMBEDDING_BATCH_MAX_WAIT_MS / 1000,
+                 name="micro-batcher"):
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._name = name
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """Queues one item and returns a Future of its result."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def submit_many(self, items):
+        return [self.submit(item) for item in items]
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            live = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            try:
+                results = self.fn([item for item, _ in live])
+            except Exception as e:
+                for _, future in live:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self.batches += 1
+                self.items += len(live)
+            for (_, future), result in zip(live, results):
+                future.set_result(result)
+
+    def stats(self):
+        """Number of batches run and items processed."""
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            }
+
+
+class BatchingEmbeddingModel:
+    """
+    Wraps a SentenceTransformer-like model so concurrent encode() calls are
+    micro-batched. Returns float32 (len(sentences), dim) arrays.
+    """
+
+    def __init__(self, model, max_batch_size=EMBEDDING_BATCH_MAX_SIZE, max_wait=EMBEDDING_BATCH_MAX_WAIT_MS / 1000):
+        self.model = model
+        # One batcher per normalize flag, since it is a per-call encode() option
+        self._batchers = {
+            normalize: MicroBatcher(
+                lambda sentences, normalize=normalize: self._encode(sentences, normalize),
+                max_batch_size, max_wait, name=f"embedding-batcher-{int(normalize)}")
+            for normalize in (False, True)
+        }
+
+    def _encode(self, sentences, normalize):
+        return list(np.asarray(self.model.encode(sentences, normalize_embeddings=normalize), dtype=np.float32))
+
+    def encode(self, sentences, normalize_embeddings=False):
+        futures = self._batchers[bool(normalize_embeddings)].submit_many(sentences)
+        vectors = [future.result() for future in futures]
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self):
+        merged = {"batches": 0, "items": 0}
+        for batcher in self._batchers.values():
+            stats = batcher.stats()
+            merged["batches"] += stats["batches"]
+            merged["items"] += stats["items"]
+        merged["avg_batch_size"] = round(merged["items"] / merged["batches"], 2) if merged["batches"] else 0.0
+        return merged
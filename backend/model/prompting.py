@@ -0,0 +1,124 @@
+"""
+Prompt construction and completion post-processing for the RAG pipeline.
+
+Kept free of heavy dependencies so the API server can normalize instructions
+(e.g. for cache keys) without importing the embedding model or Gemini SDK.
+"""
+import re
+
+from context_packer import CONTEXT_TOKEN_BUDGET, format_example, pack_examples
+
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+
+# === System Prompt ===
+SYSTEM_PROMPT = """You are a helpful AI assistant that generates structured instructions for performing blockchain actions using Coinbase AgentKit.
+
+- Always respond with valid JSON or Python code that can be executed with AgentKit.
+- Never include explanations, comments, or extra text.
+- Supported actions include:
+  - transfer_eth
+  - transfer_token
+  - deploy_contract
+  - query_balance
+- If asked to perform an unsupported action, respond with a JSON error object: {"error": "Unsupported action"}.
+- When splitting amounts among multiple recipients, output them in a "recipients" array with address and amount fields.
+- When scheduling actions, use fields: {"interval": "<Xd>", "recipient": "...", "amount": N, "token": "..."}.
+- Do use AgentKit actions only.
+
+"""
+
+CODE_FENCE_PATTERN = re.compile(r"```(?:[Pp]ython)?\s*([\s\S]+?)```")
+
+
+def normalize_instruction(prompt):
+    """Lowercases the prompt and prefixes it the way the context samples are phrased."""
+    instruction = prompt.lower().strip()
+    if not instruction.startswith('generate') and not instruction.startswith('write'):
+        instruction = f'generate code to {instruction}'
+    return instruction
+
+
+def build_full_prompt(instruction, matching_samples, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Combines the system prompt, retrieved context examples and the instruction.
+    Examples are packed into `token_budget` tokens in relevance order (see context_packer).
+
+    Returns:
+        (full_prompt, context_chunks) where context_chunks holds the top two examples.
+    """
+    context_examples_str = ""
+    context_chunks = []
+    packed, _ = pack_examples(matching_samples or [], token_budget)
+    if packed:
+        context_examples_str = "\n\nHere are some relevant examples:\n"
+        for i, (example_instruction, output) in enumerate(packed):
+            context_examples_str += format_example(i + 1, example_instruction, output)
+            if i < 2:  # Store top two chunks
+                context_chunks.append({
+                    "instruction": example_instruction,
+                    "output": output
+                })
+
+    full_prompt = f"{SYSTEM_PROMPT}{context_examples_str}\n\nInstruction: {instruction}\nResponse:\n"
+    return full_prompt, context_chunks
+
+
+def extract_code(completion):
+    """Returns the body of the first fenced code block, or the completion itself."""
+    completion = completion.strip()
+    match = CODE_FENCE_PATTERN.search(completion)
+    if match:
+        completion = match.group(1).strip()
+    return completion
+
+
+class CodeFenceExtractor:
+    """
+    Incremental version of extract_code() for streamed completions.
+
+    feed() takes raw completion deltas and returns the part of the fenced code
+    block that can already be shown. Trailing backticks are held back until it is
+    clear whether they close the fence.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "search"  # search -> header -> code -> done
+
+    def feed(self, text):
+        self._buffer += text
+        if self._state == "search":
+            idx = self._buffer.find("```")
+            if idx < 0:
+                self._buffer = self._buffer[-2:]
+                return ""
+            self._buffer = self._buffer[idx + 3:]
+            self._state = "header"
+        if self._state == "header":
+            # Wait until the optional language tag and the whitespace after it are complete
+            if len(self._buffer) < 6 and "python".startswith(self._buffer.lower()):
+                return ""
+            match = re.match(r"(?:[Pp]ython)?\s*", self._buffer)
+            if match.end() == len(self._buffer):
+                return ""
+            self._buffer = self._buffer[match.end():]
+            self._state = "code"
+        if self._state == "code":
+            idx = self._buffer.find("```")
+            if idx >= 0:
+                code, self._buffer, self._state = self._buffer[:idx], "", "done"
+                return code
+            safe = len(self._buffer.rstrip("`"))
+            code, self._buffer = self._buffer[:safe], self._buffer[safe:]
+            return code
+        return ""
+
+
+def format_context_chunks(context_chunks):
+    """Formats the top context chunks into the display string sent to the frontend."""
+    context_display = ""
+    for i, chunk in enumerate(context_chunks[:2]):  # Only show top 2
+        context_display += f"=== Example {i+1} ===\n"
+        context_display += f"Instruction: {chunk['instruction']}\n"
+        context_display += f"Code:\n{chunk['output']}\n\n"
+    return context_display.strip()
@@ -0,0 +1,150 @@
+"""
+Latency-capped reranking of first-pass retrieval candidates.
+
+Cosine similarity puts near-miss examples ("transfer eth with a memo" for
+"transfer eth") in the top 5 often enough to steer Gemini wrong. With RERANKER
+set, LLMEngine retrieves RERANK_CANDIDATES candidates per request and reorders
+them with a finer scorer before keeping the top NUM_CONTEXT_SAMPLES:
+
+    lexical         Jaccard overlap of instruction tokens (no model, microseconds)
+    cross-encoder   sentence-transformers CrossEncoder over (query, sample) pairs
+
+(query, sample) pairs from concurrent requests are scored together through a
+MicroBatcher. Each request waits at most RERANK_BUDGET_MS for its scores; if
+they are not ready it keeps the first-pass order, so a slow or overloaded
+scorer never adds more than the budget to a request. Scorers that are not
+models (inline = True, the lexical one) are called directly instead: batching
+would only add its wait window to microseconds of work. The time spent is
+reported as the "rerank" stage.
+"""
+import os
+import threading
+import time
+from concurrent.futures import wait
+
+import numpy as np
+
+from lexical_index import sample_text, tokenize
+from micro_batcher import MicroBatcher
+
+RERANKER = os.getenv("RERANKER", "off")  # off | lexical | cross-encoder
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # first-pass candidates per request
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "50"))  # wait for scores at most this long
+# Bonus of the first-pass rank (1 for the best candidate, 0 for the last), so near-ties keep their order
+RERANK_FIRST_PASS_WEIGHT = float(os.getenv("RERANK_FIRST_PASS_WEIGHT", "0.1"))
+RERANK_BATCH_MAX_SIZE = int(os.getenv("RERANK_BATCH_MAX_SIZE", "64"))  # pairs per scorer call
+RERANK_BATCH_MAX_WAIT_MS = float(os.getenv("RERANK_BATCH_MAX_WAIT_MS", "2"))
+
+# Words every instruction shares; they say nothing about which example fits
+STOP_WORDS = {"generate", "code", "to", "a", "an", "the", "of", "for", "and", "in", "on", "my", "me", "i",
+              "please", "that", "this", "it", "using", "use", "write", "python"}
+
+
+def _terms(text):
+    return {token for token in tokenize(text) if token not in STOP_WORDS}
+
+
+class LexicalOverlapScorer:
+    """Jaccard similarity of the query's and the sample instruction's content words."""
+
+    inline = True  # no model: scored in the request thread, not batched
+
+    def score(self, pairs):
+        scores = []
+        for query, sample in pairs:
+            query_terms, sample_terms = _terms(query), _terms(sample.get("instruction", ""))
+            union = query_terms | sample_terms
+            scores.append(len(query_terms & sample_terms) / len(union) if union else 0.0)
+        return scores
+
+
+class CrossEncoderScorer:
+    """sentence-transformers CrossEncoder relevance logits of (query, instruction + output) pairs."""
+
+    def __init__(self, model_name=RERANK_MODEL):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name)
+
+    def score(self, pairs):
+        return [float(score) for score in self.model.predict([(query, sample_text(sample)) for query, sample in pairs])]
+
+
+class Reranker:
+    """
+    Reorders candidate samples with a batched scorer under a per-request time budget.
+
+    Parameters:
+        scorer: Object with score(list of (query, sample)) -> list of float; scored
+            inline, without batching or budget, if it has inline = True.
+        budget (float): Seconds a request waits for its scores before keeping the first-pass order.
+        first_pass_weight (float): Weight of the first-pass rank bonus added to the scores.
+    """
+
+    def __init__(self, scorer, budget=RERANK_BUDGET_MS / 1000, first_pass_weight=RERANK_FIRST_PASS_WEIGHT,
+                 max_batch_size=RERANK_BATCH_MAX_SIZE, max_wait=RERANK_BATCH_MAX_WAIT_MS / 1000):
+        self.scorer = scorer
+        self.budget = budget
+        self.first_pass_weight = first_pass_weight
+        self.batcher = None if getattr(scorer, "inline", False) else MicroBatcher(
+            scorer.score, max_batch_size, max_wait, name="rerank-batcher")
+        self._lock = threading.Lock()
+        self.reranked = 0
+        self.fallbacks = 0
+
+    def rerank(self, queries, candidates):
+        """
+        Returns, for each query, the indices of its candidates (given in first-pass
+        order) best first. Queries whose scores miss the budget keep their order.
+        """
+        if self.batcher is None:
+            orders = [self._order(self.scorer.score([(query, sample) for sample in samples]))
+                      for query, samples in zip(queries, candidates)]
+            with self._lock:
+                self.reranked += len(orders)
+            return orders
+
+        deadline = time.monotonic() + self.budget
+        futures = [self.batcher.submit_many([(query, sample) for sample in samples])
+                   for query, samples in zip(queries, candidates)]
+        wait([future for group in futures for future in group], timeout=max(0.0, deadline - time.monotonic()))
+
+        orders, fallbacks = [], 0
+        for group in futures:
+            if not all(future.done() and not future.cancelled() and future.exception() is None for future in group):
+                # Over budget (or failed): unscored pairs are dropped from the batcher's queue
+                for future in group:
+                    future.cancel()
+                orders.append(list(range(len(group))))
+                fallbacks += bool(group)
+                continue
+            orders.append(self._order([future.result() for future in group]))
+        with self._lock:
+            self.reranked += len(futures) - fallbacks
+            self.fallbacks += fallbacks
+        return orders
+
+    def _order(self, scores):
+        """Candidate indices by score plus the first-pass rank bonus (1 for the first, 0 for the last)."""
+        scores = np.array(scores, dtype=np.float64)
+        if len(scores) > 1:
+            scores += self.first_pass_weight * (len(scores) - 1 - np.arange(len(scores))) / (len(scores) - 1)
+        return np.argsort(-scores, kind="stable").tolist()
+
+    def stats(self):
+        """Reranked and fallen-back requests, and scorer batches (none when scored inline)."""
+        with self._lock:
+            stats = {"reranked": self.reranked, "fallbacks": self.fallbacks}
+        stats.update(self.batcher.stats() if self.batcher else {"batches": 0, "items": 0, "avg_batch_size": 0.0})
+        return stats
+
+
+def load_reranker(kind=RERANKER):
+    """The configured Reranker, or None when reranking is off."""
+    if kind in ("", "off"):
+        return None
+    if kind == "lexical":
+        return Reranker(LexicalOverlapScorer())
+    if kind == "cross-encoder":
+        return Reranker(CrossEncoderScorer())
+    raise ValueError(f"Unknown reranker: {kind}")
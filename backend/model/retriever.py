@@ -0,0 +1,228 @@
+"""
+Exact (or ANN-backed) top-k retrieval over pre-normalized sample embeddings.
+
+Sample vectors are L2-normalized once, when the store is built or loaded, and
+queries come out of the embedding model normalized, so cosine similarity is a
+single matrix-vector product. The threshold is applied as a NumPy mask and the
+top-k is picked with np.argpartition, so no per-sample Python work is done.
+
+With a quantized (float16/int8) store, the compact matrix is searched for
+`rescore_factor` times more candidates than asked for, which are then rescored
+exactly against the float32 vectors before the threshold and final top-k.
+
+Given a lexical (BM25) index and the query texts, the vector ranking (threshold
+applied) and the BM25 ranking are fused by reciprocal rank fusion: a sample
+scores sum(1 / (rrf_k + rank)) over the rankings it appears in, so exact
+identifier matches can surface even when their embedding is not the closest.
+Samples found only by BM25 skip the vector threshold, so they must earn their
+place lexically instead: they are fused only from the top HYBRID_LEXICAL_ONLY_DEPTH
+BM25 hits scoring at least HYBRID_LEXICAL_MIN_RATIO of the best BM25 score, and a
+query whose terms merely brush a sample adds nothing.
+
+Run this file for a micro-benchmark against the old sklearn + sorted() path, or
+for recall@k and memory of the float16/int8 stores against float32:
+    python retriever.py [num_samples] [num_queries]
+    python retriever.py quantization [num_samples] [num_queries]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from ann_index import ExactIndex, _select, _top_k
+from vector_store import QuantizedMatrix, normalize_rows
+
+DEFAULT_THRESHOLD = 0.5
+RETRIEVER_RESCORE_FACTOR = int(os.getenv("RETRIEVER_RESCORE_FACTOR", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))  # depth of each ranking fused by RRF
+# Cutoff for samples only BM25 found (they are exempt from the vector threshold)
+HYBRID_LEXICAL_ONLY_DEPTH = int(os.getenv("HYBRID_LEXICAL_ONLY_DEPTH", "3"))
+HYBRID_LEXICAL_MIN_RATIO = float(os.getenv("HYBRID_LEXICAL_MIN_RATIO", "0.5"))
+
+
+def reciprocal_rank_fusion(rankings, top_n, k=RRF_K):
+    """Fuses id rankings (best first) into the top `top_n` (ids, scores) by reciprocal rank."""
+    rankings = [np.asarray(ranking, dtype=np.int64) for ranking in rankings]
+    ids = np.concatenate(rankings)
+    if not len(ids):
+        return ids, np.empty(0, dtype=np.float32)
+    contributions = np.concatenate([1.0 / (k + np.arange(1, len(ranking) + 1)) for ranking in rankings])
+    unique, inverse = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions)
+    best = _top_k(fused, top_n)
+    return unique[best], fused[best].astype(np.float32)
+
+
+class Retriever:
+    """
+    Returns the samples whose embeddings best match the query embeddings.
+
+    Parameters:
+        samples (list): Sample dicts, row i of `matrix` belongs to samples[i].
+        matrix: float32 np.ndarray or QuantizedMatrix (len(samples), dim), rows L2-normalized.
+        index: ann_index index over `matrix`; exact search if omitted.
+        threshold (float): Default minimum cosine similarity.
+        rescore_matrix (np.ndarray): float32 rows used to rescore candidates from a quantized `matrix`.
+        rescore_factor (int): Candidates fetched per requested result when rescoring.
+        lexical (BM25Index): Lexical index over the same samples, for hybrid search.
+        lexical_only_depth (int): BM25 ranks a sample missing from the vector ranking may come from.
+        lexical_min_ratio (float): Fraction of the best BM25 score such a sample needs.
+    """
+
+    def __init__(self, samples, matrix, index=None, threshold=DEFAULT_THRESHOLD, rescore_matrix=None,
+                 rescore_factor=RETRIEVER_RESCORE_FACTOR, lexical=None, rrf_k=RRF_K,
+                 hybrid_candidates=HYBRID_CANDIDATES, lexical_only_depth=HYBRID_LEXICAL_ONLY_DEPTH,
+                 lexical_min_ratio=HYBRID_LEXICAL_MIN_RATIO):
+        self.samples = samples
+        self.matrix = matrix
+        self.index = index if index is not None else ExactIndex(matrix)
+        self.threshold = threshold
+        self.rescore_matrix = rescore_matrix
+        self.rescore_factor = max(1, rescore_factor)
+        self.lexical = lexical
+        self.rrf_k = rrf_k
+        self.hybrid_candidates = hybrid_candidates
+        self.lexical_only_depth = lexical_only_depth
+        self.lexical_min_ratio = lexical_min_ratio
+
+    @classmethod
+    def from_samples(cls, samples, **kwargs):
+        """Builds a retriever from sample dicts carrying raw 'embedding' lists."""
+        matrix = normalize_rows(np.array([sample["embedding"] for sample in samples], dtype=np.float32))
+        return cls(samples, matrix.reshape(len(samples), -1), **kwargs)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def search(self, query_embeddings, top_n, threshold=None, texts=None):
+        """
+        Returns one (ids, scores) pair per normalized query embedding, best first.
+        With `texts` (one per query) and a lexical index, the scores are RRF scores.
+        """
+        rankings = self.rankings(query_embeddings, top_n, threshold, texts)
+        if self.lexical is None or texts is None:
+            return [(ids, scores) for ids, scores, _ in rankings]
+        return [reciprocal_rank_fusion([vector_ids, lexical_ids], top_n, self.rrf_k)
+                for vector_ids, _, lexical_ids in rankings]
+
+    def rankings(self, query_embeddings, top_n, threshold=None, texts=None):
+        """
+        The rankings search() fuses, one (vector ids, cosine scores, BM25 ids) triple per
+        query; the BM25 ids are None without `texts` or a lexical index. Lets callers
+        fuse the rankings of several retrievers themselves.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        if self.lexical is None or texts is None:
+            return [(ids, scores, None) for ids, scores in self._vector_search(query_embeddings, top_n, threshold)]
+        depth = max(top_n, self.hybrid_candidates)
+        vector = self._vector_search(query_embeddings, depth, threshold)
+        lexical = self.lexical.search(texts, depth)
+        return [(vector_ids, vector_scores, self._lexical_cutoff(vector_ids, lexical_ids, lexical_scores))
+                for (vector_ids, vector_scores), (lexical_ids, lexical_scores) in zip(vector, lexical)]
+
+    def _lexical_cutoff(self, vector_ids, lexical_ids, lexical_scores):
+        """The BM25 ranking without the weak hits that the vector ranking does not vouch for."""
+        if not len(lexical_ids):
+            return lexical_ids
+        ranks = np.arange(len(lexical_ids))
+        strong = (ranks < self.lexical_only_depth) & (lexical_scores >= self.lexical_min_ratio * lexical_scores[0])
+        return lexical_ids[strong | np.isin(lexical_ids, vector_ids)]
+
+    def _vector_search(self, query_embeddings, top_n, threshold):
+        if self.rescore_matrix is None:
+            return self.index.search(query_embeddings, top_n, threshold)
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        # Quantization error can push a true match just under the threshold, so filter after rescoring
+        candidates = self.index.search(queries, top_n * self.rescore_factor, None)
+        results = []
+        for query, (ids, _) in zip(queries, candidates):
+            ids = np.sort(ids)  # ascending ids read the memory-mapped float32 rows in file order
+            exact = np.asarray(self.rescore_matrix[ids], dtype=np.float32).reshape(len(ids), -1) @ query
+            results.append(_select(ids, exact, top_n, threshold))
+        return results
+
+    def vectors(self, ids):
+        """float32 embeddings of the given rows (the exact float32 ones when a quantized store keeps them)."""
+        matrix = self.matrix if self.rescore_matrix is None else self.rescore_matrix
+        return np.asarray(matrix[np.asarray(ids, dtype=np.int64)], dtype=np.float32).reshape(len(ids), -1)
+
+    def retrieve(self, query_embeddings, top_n, threshold=None, texts=None):
+        """Returns one list of matching samples per normalized query embedding."""
+        return [[self.samples[i] for i in ids] for ids, _ in self.search(query_embeddings, top_n, threshold, texts)]
+
+
+def _legacy_search(query, samples, top_n, threshold):
+    from sklearn.metrics.pairwise import cosine_similarity
+    similarities = cosine_similarity(query.reshape(1, -1), np.array([s["embedding"] for s in samples]))[0]
+    filtered = [(sim, sample) for sim, sample in zip(similarities, samples) if sim >= threshold]
+    return [sample for _, sample in sorted(filtered, key=lambda x: x[0], reverse=True)[:top_n]]
+
+
+def benchmark(num_samples=5000, num_queries=200, dim=384, top_n=5, threshold=0.1, seed=0):
+    """Prints per-query latency of the retriever and, if sklearn is installed, the old path."""
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(num_samples, dim)).astype(np.float32)
+    samples = [{"instruction": str(i), "embedding": row.tolist()} for i, row in enumerate(embeddings)]
+    queries = normalize_rows(embeddings[rng.integers(num_samples, size=num_queries)]
+                             + rng.normal(scale=0.5, size=(num_queries, dim)).astype(np.float32))
+    retriever = Retriever.from_samples(samples, threshold=threshold)
+
+    start = time.perf_counter()
+    for query in queries:
+        retriever.retrieve(query, top_n)
+    per_query = (time.perf_counter() - start) / num_queries
+    print(f"Retriever (exact, {num_samples} x {dim}): {per_query * 1e6:9.1f} us/query")
+
+    start = time.perf_counter()
+    retriever.retrieve(queries, top_n)
+    print(f"Retriever batch of {num_queries}:        {(time.perf_counter() - start) / num_queries * 1e6:9.1f} us/query")
+
+    try:
+        legacy_queries = queries[:max(1, num_queries // 10)]
+        start = time.perf_counter()
+        for query in legacy_queries:
+            _legacy_search(query, samples, top_n, threshold)
+        legacy = (time.perf_counter() - start) / len(legacy_queries)
+        print(f"sklearn cosine + sorted():         {legacy * 1e6:9.1f} us/query ({legacy / per_query:.0f}x slower)")
+    except ImportError:
+        print("sklearn not installed, skipping the legacy comparison")
+
+
+def _clustered_corpus(rng, num_samples, num_queries, dim):
+    """Sentence-embedding-like data: samples and queries scattered around shared topics."""
+    topics = rng.normal(size=(max(1, num_samples // 50), dim)).astype(np.float32)
+    matrix = normalize_rows(topics[rng.integers(len(topics), size=num_samples)]
+                            + rng.normal(scale=0.6, size=(num_samples, dim)).astype(np.float32))
+    queries = normalize_rows(topics[rng.integers(len(topics), size=num_queries)]
+                             + rng.normal(scale=0.6, size=(num_queries, dim)).astype(np.float32))
+    return matrix, queries
+
+
+def benchmark_quantization(num_samples=20000, num_queries=200, dim=384, top_n=5, seed=0):
+    """Prints memory, latency and recall@top_n (against float32) of the quantized matrices."""
+    rng = np.random.default_rng(seed)
+    matrix, queries = _clustered_corpus(rng, num_samples, num_queries, dim)
+    samples = [{"instruction": str(i)} for i in range(num_samples)]
+    exact = [set(ids) for ids, _ in Retriever(samples, matrix, threshold=None).search(queries, top_n)]
+
+    variants = [("float32", matrix, None)]
+    for dtype in ("float16", "int8"):
+        variants.append((dtype, QuantizedMatrix.quantize(matrix, dtype), None))
+        variants.append((f"{dtype} + rescore", variants[-1][1], matrix))
+    for name, stored, rescore in variants:
+        retriever = Retriever(samples, stored, threshold=None, rescore_matrix=rescore)
+        start = time.perf_counter()
+        results = [retriever.search(query, top_n)[0] for query in queries]
+        per_query = (time.perf_counter() - start) / num_queries
+        recall = np.mean([len(exact[i] & set(ids)) / top_n for i, (ids, _) in enumerate(results)])
+        print(f"{name:18} {stored.nbytes / 2 ** 20:8.1f} MiB  {per_query * 1e6:9.1f} us/query  "
+              f"recall@{top_n} {recall:.4f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["quantization"]:
+        benchmark_quantization(*(int(arg) for arg in sys.argv[2:4]))
+    else:
+        benchmark(*(int(arg) for arg in sys.argv[1:3]))
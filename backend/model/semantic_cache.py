@@ -0,0 +1,222 @@
+"""
+Semantic cache of completions keyed on the query embedding.
+
+Paraphrased prompts ("send 0.1 eth to 0xabc..." / "transfer 0.1 ETH to 0xabc...")
+embed almost identically, so LLMEngine looks the normalized query embedding up
+here before calling Gemini. A cached completion is reused only when
+
+    - its cosine similarity to the query is at least SEMANTIC_CACHE_THRESHOLD, and
+    - the parameters extracted from both instructions are identical.
+
+The parameters are every token of the instruction except a small allowlist of
+STOP_WORDS ("generate", "code", "the", "please", ...), in order: amounts with
+the word after them (unit or token), counterparties with their direction ("to
+0xabc", "from alice", "for usdc"; a direction carries across "and" and "," so
+"to alice and bob" names two recipients), chain names, negations, and any other
+word ("half", "tomorrow", "named foo"). Synonymous actions and asset names are
+normalized first (send/transfer/pay, eth/ether), so paraphrases still match.
+
+The parameter guard is what makes a high threshold safe: embeddings barely move
+when only an address, amount, chain or "not" changes, or when two recipients
+swap places, so similarity alone would happily return a transfer to the wrong
+recipient. Unknown words therefore count as parameters; a missed paraphrase
+costs one Gemini call, a false match a wrong transaction. Entries are evicted
+least recently used once SEMANTIC_CACHE_SIZE is reached.
+"""
+import os
+import re
+import threading
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))  # 0 disables the cache
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# One token per match, in order: address, ENS name, number, word or list separator
+TOKEN_PATTERN = re.compile(
+    r"(?P<address>\b0x[0-9a-f]{40}\b)"
+    r"|(?P<name>\b[a-z0-9-]+(?:\.[a-z0-9-]+)*\.eth\b)"
+    r"|(?P<number>(?<![\w.])(?:\d+(?:,\d{3})*(?:\.\d+)?|\.\d+))"
+    r"|(?P<word>[a-z][a-z0-9]*)"
+    r"|(?P<separator>,)")
+
+ASSETS = {"eth": "eth", "ether": "eth", "ethereum": "eth", "weth": "weth", "usdc": "usdc", "usdt": "usdt",
+          "dai": "dai", "btc": "btc", "wbtc": "wbtc", "cbbtc": "cbbtc", "matic": "matic", "pol": "pol",
+          "sol": "sol", "link": "link", "uni": "uni", "nft": "nft", "nfts": "nft", "erc20": "erc20",
+          "erc721": "erc721", "erc1155": "erc1155"}
+ACTIONS = {"send": "transfer", "transfer": "transfer", "pay": "transfer", "give": "transfer",
+           "split": "transfer", "swap": "swap", "trade": "swap", "exchange": "swap", "convert": "swap",
+           "deploy": "deploy", "create": "deploy", "mint": "mint", "burn": "burn", "stake": "stake",
+           "unstake": "unstake", "bridge": "bridge", "approve": "approve", "wrap": "wrap", "unwrap": "unwrap",
+           "balance": "query", "check": "query", "query": "query", "schedule": "schedule", "every": "schedule",
+           "daily": "schedule", "weekly": "schedule", "monthly": "schedule"}
+# Words that make the next address, name or word a counterparty
+DIRECTIONS = {"to": "to", "into": "to", "from": "from", "for": "for"}
+CHAINS = {"mainnet": "mainnet", "testnet": "testnet", "sepolia": "sepolia", "holesky": "holesky",
+          "goerli": "goerli", "base": "base", "arbitrum": "arbitrum", "arb": "arbitrum", "optimism": "optimism",
+          "op": "optimism", "polygon": "polygon", "bsc": "bsc", "bnb": "bsc", "avalanche": "avalanche",
+          "avax": "avalanche", "zksync": "zksync", "linea": "linea", "scroll": "scroll", "solana": "solana"}
+# "don't" and "can't" tokenize to ("don", "t") and ("can", "t")
+NEGATIONS = {"not", "no", "never", "without", "dont", "cant", "wont", "t"}
+# Words that say nothing about the transaction; every other token is a parameter
+STOP_WORDS = {"a", "an", "the", "please", "generate", "write", "code", "script", "python",
+              "function", "program", "snippet", "me", "i", "you", "can", "could", "would", "how", "do", "does",
+              "don", "want", "need", "like", "some", "that", "this", "it", "is", "on", "in", "at", "of",
+              "my", "our", "address", "user", "using", "use", "with", "via"}
+# Words that carry the last direction over to the next counterparty ("to alice and bob")
+CONNECTORS = {"and", ","}
+
+
+def _amount(text):
+    try:
+        return format(Decimal(text.replace(",", "")).normalize(), "f")
+    except InvalidOperation:
+        return text
+
+
+def extract_parameters(instruction):
+    """
+    The values a completion depends on, as a comparable tuple: the ordered
+    entries ("amount", value, unit), (direction, counterparty), ("chain", name),
+    ("not",) and ("word", word), then the sorted assets and actions.
+    """
+    tokens = [(match.lastgroup, match.group()) for match in TOKEN_PATTERN.finditer(instruction.lower())]
+    entries, assets, actions = [], set(), set()
+    direction = carried = None
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        i += 1
+        if value in CONNECTORS:
+            # "to alice and bob": bob is a recipient too
+            direction, carried = direction or carried, None
+            continue
+        if value in STOP_WORDS:
+            continue
+        if kind == "number":
+            unit = ""
+            following = tokens[i][1] if i < len(tokens) and tokens[i][0] == "word" else None
+            if following and following not in DIRECTIONS and following not in CONNECTORS:
+                unit = ASSETS.get(following, following)
+                assets.update({unit} & set(ASSETS.values()))
+                i += 1
+            entries.append(("amount", _amount(value), unit))
+            direction = carried = None
+        elif kind in ("address", "name"):
+            entries.append((direction or "", value))
+            direction, carried = None, direction
+        elif value in DIRECTIONS:
+            direction, carried = DIRECTIONS[value], None
+        elif value in ACTIONS:
+            actions.add(ACTIONS[value])
+            direction = carried = None
+        elif value in NEGATIONS:
+            entries.append(("not",))
+            direction = carried = None
+        elif value in CHAINS:
+            entries.append(("chain", CHAINS[value]))
+            direction = carried = None
+        else:
+            if value in ASSETS:
+                assets.add(ASSETS[value])
+            if direction:
+                # A recipient or source given by name ("to alice") or asset ("for usdc")
+                entries.append((direction, ASSETS.get(value, value)))
+                direction, carried = None, direction
+            else:
+                if value not in ASSETS:
+                    entries.append(("word", value))
+                direction = carried = None
+    return tuple(entries), tuple(sorted(assets)), tuple(sorted(actions))
+
+
+class SemanticCache:
+    """
+    Thread-safe completion cache searched by embedding similarity.
+
+    Parameters:
+        max_entries (int): Cached completions kept (0 disables the cache).
+        threshold (float): Minimum cosine similarity of a reusable entry.
+    """
+
+    def __init__(self, max_entries=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._matrix = None  # (max_entries, dim) float32, allocated on the first put
+        self._parameters = [None] * max(0, max_entries)
+        self._values = [None] * max(0, max_entries)
+        self._last_used = np.zeros(max(0, max_entries), dtype=np.int64)
+        self._count = 0
+        self._tick = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.guard_rejections = 0
+        self.evictions = 0
+
+    def get(self, embedding, instruction):
+        """Returns the cached completion for a paraphrase of `instruction`, or None."""
+        if self.max_entries <= 0:
+            return None
+        parameters = extract_parameters(instruction)
+        with self._lock:
+            if self._count:
+                scores = self._matrix[:self._count] @ np.asarray(embedding, dtype=np.float32)
+                candidates = np.flatnonzero(scores >= self.threshold)
+                rejected = False
+                for slot in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                    if self._parameters[slot] == parameters:
+                        self._tick += 1
+                        self._last_used[slot] = self._tick
+                        self.hits += 1
+                        return self._values[slot]
+                    rejected = True
+                self.guard_rejections += rejected
+            self.misses += 1
+            return None
+
+    def put(self, embedding, instruction, value):
+        """Caches `value` under the instruction's embedding, evicting the least recently used entry if full."""
+        if self.max_entries <= 0:
+            return
+        embedding = np.asarray(embedding, dtype=np.float32)
+        parameters = extract_parameters(instruction)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+            if self._count < self.max_entries:
+                slot = self._count
+                self._count += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._matrix[slot] = embedding
+            self._parameters[slot] = parameters
+            self._values[slot] = value
+            self._tick += 1
+            self._last_used[slot] = self._tick
+
+    def clear(self):
+        """Drops every entry (e.g. when the corpus the completions were built from changes)."""
+        with self._lock:
+            self._count = 0
+            self._parameters = [None] * len(self._parameters)
+            self._values = [None] * len(self._values)
+            self._last_used[:] = 0
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        """Hit/miss counters, parameter-guard rejections and evictions."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._count,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "guard_rejections": self.guard_rejections,
+                "evictions": self.evictions,
+            }
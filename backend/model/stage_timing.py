@@ -0,0 +1,35 @@
+"""
+Per-stage latency hooks for the llm.py pipeline.
+
+llm.py wraps each stage (model load, sample parsing, query embedding, similarity,
+Gemini call) in timed_stage(). Nothing is recorded unless a process installs an
+observer; the LLM worker pool does so to ship the timings to the server's
+/metrics endpoint.
+"""
+import time
+from contextlib import contextmanager
+
+_observer = None
+
+
+def set_observer(observer):
+    """Installs observer(stage, seconds), or removes it with None."""
+    global _observer
+    _observer = observer
+
+
+def record_stage(stage, seconds):
+    """Reports a duration measured by the caller."""
+    observer = _observer
+    if observer is not None:
+        observer(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage):
+    """Reports how long the enclosed block took to the installed observer."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
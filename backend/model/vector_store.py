@@ -0,0 +1,236 @@
+"""
+Binary vector store for the RAG samples.
+
+A store is two files next to each other:
+
+    vector_samples.npy        (count, dim) matrix of L2-normalized embeddings
+    vector_samples.meta.json  header (model, dim, count, dtype) and the sample records
+                              (instruction, output, ...) without their embeddings
+
+The matrix is memory-mapped on load, so opening a store costs a JSON parse of the
+text fields and no float conversion at all; rows are normalized at build time so
+cosine similarity is a plain dot product. The metadata file is written last and
+is what readers check, so a store is never seen half written.
+
+The matrix can be stored as float32, float16 (half the memory) or int8 (a
+quarter, scalar-quantized with one scale per dimension). Quantized stores are
+scored directly on the compact matrix and can keep a float32 copy
+(vector_samples.f32.npy) that is only read to rescore the top candidates.
+
+Convert an existing JSONL file with:
+    python vector_store.py data/vector_samples.jsonl data/vector_samples
+"""
+import os
+import sys
+import json
+
+import numpy as np
+
+from versioning import file_version
+
+FORMAT_VERSION = 1
+MATRIX_SUFFIX = ".npy"
+META_SUFFIX = ".meta.json"
+RESCORE_SUFFIX = ".f32.npy"
+STORE_DTYPES = ("float32", "float16", "int8")
+SCORE_CHUNK_ROWS = 16384  # rows converted to float32 at a time when scoring a quantized matrix
+
+
+def store_paths(base_path):
+    """Returns the (matrix, metadata) file paths of the store at `base_path`."""
+    return base_path + MATRIX_SUFFIX, base_path + META_SUFFIX
+
+
+def store_exists(base_path):
+    return all(os.path.exists(path) for path in store_paths(base_path))
+
+
+def store_version(base_path):
+    """Changes whenever the store is rewritten (the metadata file is replaced last)."""
+    return file_version(store_paths(base_path)[1])
+
+
+def normalize_rows(matrix):
+    """L2-normalizes each row of a float32 matrix (zero rows stay zero)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class QuantizedMatrix:
+    """
+    Row matrix kept as float16, or as int8 with per-dimension scales.
+
+    Indexing returns dequantized float32 rows. scores() computes query dot products
+    against the compact matrix, folding the int8 scales into the queries and
+    converting SCORE_CHUNK_ROWS rows at a time, so no full float32 copy is made.
+    """
+
+    ndim = 2
+
+    def __init__(self, data, scales=None):
+        self.data = data
+        self.scales = None if scales is None else np.asarray(scales, dtype=np.float32)
+
+    @classmethod
+    def quantize(cls, matrix, dtype):
+        """Quantizes a float32 matrix to "float16" or "int8"."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if dtype == "float16":
+            return cls(matrix.astype(np.float16))
+        if dtype != "int8":
+            raise ValueError(f"Unsupported quantized dtype: {dtype}")
+        scales = np.maximum(np.abs(matrix).max(axis=0) if len(matrix) else np.ones(matrix.shape[1]), 1e-12) / 127
+        data = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+        return cls(data, scales.astype(np.float32))
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        rows = np.asarray(self.data[key], dtype=np.float32)
+        return rows * self.scales if self.scales is not None else rows
+
+    def scores(self, queries):
+        """(len(queries), len(self)) dot products of float32 queries with every row."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.scales is not None:
+            queries = queries * self.scales
+        out = np.empty((len(queries), len(self.data)), dtype=np.float32)
+        for start in range(0, len(self.data), SCORE_CHUNK_ROWS):
+            chunk = np.asarray(self.data[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            out[:, start:start + len(chunk)] = queries @ chunk.T
+        return out
+
+
+class VectorStore:
+    """
+    Loaded store: `samples` are the metadata records, `matrix` the matching rows.
+
+    Parameters:
+        samples (list): Sample dicts without embeddings.
+        matrix: float32 np.ndarray or QuantizedMatrix (len(samples), dim), rows L2-normalized.
+        meta (dict): The store header.
+        rescore_matrix (np.ndarray): float32 copy of a quantized matrix, if the store kept one.
+    """
+
+    def __init__(self, samples, matrix, meta=None, rescore_matrix=None):
+        if len(samples) != len(matrix):
+            raise ValueError(f"Store has {len(samples)} samples but {len(matrix)} vectors")
+        self.samples = samples
+        self.matrix = matrix
+        self.meta = meta or {}
+        self.rescore_matrix = rescore_matrix
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def __len__(self):
+        return len(self.samples)
+
+
+def _atomic_write(path, write):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_store(base_path, samples, embeddings, model_name=None, dtype="float32", keep_float32=False):
+    """
+    Writes samples and their embeddings as a binary store. `samples` may still
+    carry an "embedding" key; it is dropped from the metadata.
+
+    `dtype` is the stored matrix type ("float32", "float16" or "int8"); with
+    `keep_float32` a quantized store also keeps float32 vectors for rescoring.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unsupported vector store dtype: {dtype}")
+    matrix = normalize_rows(embeddings)
+    if matrix.ndim != 2 or len(matrix) != len(samples):
+        raise ValueError(f"Expected {len(samples)} embedding rows, got shape {matrix.shape}")
+    records = [{k: v for k, v in sample.items() if k != "embedding"} for sample in samples]
+    stored = matrix if dtype == "float32" else QuantizedMatrix.quantize(matrix, dtype)
+    rescore = dtype != "float32" and keep_float32
+    meta = {
+        "format": FORMAT_VERSION,
+        "model": model_name,
+        "count": len(records),
+        "dim": int(matrix.shape[1]),
+        "dtype": dtype,
+        "normalized": True,
+        "rescore": rescore,
+        "samples": records,
+    }
+    if dtype == "int8":
+        meta["scales"] = stored.scales.tolist()
+
+    matrix_path, meta_path = store_paths(base_path)
+    data = stored if dtype == "float32" else stored.data
+    # Matrices first: readers only trust a store whose metadata matches its matrix
+    _atomic_write(matrix_path, lambda f: np.save(f, np.ascontiguousarray(data)))
+    if rescore:
+        _atomic_write(base_path + RESCORE_SUFFIX, lambda f: np.save(f, np.ascontiguousarray(matrix)))
+    _atomic_write(meta_path, lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8")))
+    return VectorStore(records, stored, meta, matrix if rescore else None)
+
+
+def load_store(base_path, mmap=True):
+    """Opens a store, memory-mapping the matrix unless `mmap` is False."""
+    matrix_path, meta_path = store_paths(base_path)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported vector store format: {meta.get('format')}")
+
+    mmap_mode = "r" if mmap else None
+    dtype = meta.get("dtype", "float32")
+    matrix = np.load(matrix_path, mmap_mode=mmap_mode)
+    if dtype not in STORE_DTYPES or matrix.dtype != np.dtype(dtype) or matrix.shape != (meta["count"], meta["dim"]):
+        raise ValueError(f"Vector store matrix {matrix.shape} {matrix.dtype} does not match its metadata")
+    if dtype != "float32":
+        matrix = QuantizedMatrix(matrix, meta.pop("scales", None))
+    elif not meta.get("normalized"):
+        matrix = normalize_rows(matrix)
+    rescore_matrix = np.load(base_path + RESCORE_SUFFIX, mmap_mode=mmap_mode) if meta.get("rescore") else None
+    return VectorStore(meta.pop("samples"), matrix, meta, rescore_matrix)
+
+
+def convert_jsonl(jsonl_path, base_path, model_name=None, dtype="float32", keep_float32=False):
+    """Builds a binary store from a vector_samples.jsonl file with inline embeddings."""
+    samples = []
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                samples.append(json.loads(line))
+    embeddings = np.array([sample["embedding"] for sample in samples], dtype=np.float32)
+    return write_store(base_path, samples, embeddings, model_name, dtype, keep_float32)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or (len(sys.argv) == 4 and sys.argv[3] not in STORE_DTYPES):
+        print("Usage: python vector_store.py <vector_samples.jsonl> <output base path> [float32|float16|int8]",
+              file=sys.stderr)
+        sys.exit(1)
+    dtype = sys.argv[3] if len(sys.argv) == 4 else "float32"
+    store = convert_jsonl(sys.argv[1], sys.argv[2], dtype=dtype, keep_float32=dtype != "float32")
+    print(f"Wrote {len(store)} samples ({store.dim} dims) to {sys.argv[2]}{MATRIX_SUFFIX} / {META_SUFFIX}")
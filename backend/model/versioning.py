@@ -0,0 +1,16 @@
+"""
+Cheap version tags of the files the caches key on.
+
+Shared by the vector store, the corpus registry and the response cache key.
+Imports nothing heavy, so the API server can compute versions without numpy.
+"""
+import os
+
+
+def file_version(path):
+    """Cheap version tag for a file: changes whenever it is rewritten."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
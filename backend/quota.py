@@ -0,0 +1,173 @@
+"""
+Per-identity request quotas shared across server processes.
+
+Each identity gets a token bucket of FREE_LIMIT requests that refills over
+QUOTA_WINDOW_SECONDS. State lives in a SQLite database in WAL mode so every
+Flask/uvicorn worker process sees the same counts, and each check-and-increment
+is a single UPSERT ... RETURNING statement: one O(1) write, no read-modify-write
+round trip and no global Python lock.
+"""
+import os
+import time
+import sqlite3
+import threading
+from typing import NamedTuple
+
+QUOTA_DB_PATH = os.getenv(
+    "QUOTA_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quota.db"))
+FREE_LIMIT = int(os.getenv("FREE_LIMIT", "1"))
+QUOTA_WINDOW_SECONDS = float(os.getenv("QUOTA_WINDOW_SECONDS", "86400"))
+QUOTA_IDLE_TTL_SECONDS = float(os.getenv("QUOTA_IDLE_TTL_SECONDS", str(7 * 86400)))
+PAID_TTL_SECONDS = float(os.getenv("PAID_TTL_SECONDS", str(30 * 86400)))
+PURGE_EVERY = 1000  # consume() calls between idle-entry sweeps
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota (
+    identity    TEXT PRIMARY KEY,
+    tokens      REAL    NOT NULL,
+    requests    INTEGER NOT NULL,
+    allowed     INTEGER NOT NULL,
+    updated_at  REAL    NOT NULL,
+    paid_until  REAL    NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS quota_updated_at ON quota (updated_at);
+"""
+
+# Refill the bucket for the time since the last request, then take `cost` tokens
+# if there are enough. All SET expressions see the row as it was before the update.
+_CONSUME = """
+INSERT INTO quota (identity, tokens, requests, allowed, updated_at, paid_until)
+VALUES (:identity, :new_tokens, :cost, :new_allowed, :now, 0)
+ON CONFLICT (identity) DO UPDATE SET
+    tokens = CASE
+        WHEN min(:capacity, tokens + (:now - updated_at) * :rate) >= :cost
+        THEN min(:capacity, tokens + (:now - updated_at) * :rate) - :cost
+        ELSE min(:capacity, tokens + (:now - updated_at) * :rate)
+    END,
+    allowed = min(:capacity, tokens + (:now - updated_at) * :rate) >= :cost,
+    requests = requests + :cost,
+    updated_at = :now
+RETURNING tokens, requests, allowed, paid_until
+"""
+
+
+class QuotaDecision(NamedTuple):
+    """Outcome of a quota check."""
+    identity: str
+    allowed: bool
+    requests_made: int
+    remaining: int
+    limit: int
+    paid: bool
+    retry_after: float
+
+
+class QuotaStore:
+    """
+    Token-bucket quotas keyed by identity, persisted in SQLite.
+
+    Parameters:
+        path (str): SQLite database file shared by all server processes.
+        limit (int): Bucket capacity, i.e. free requests per window.
+        window (float): Seconds for an empty bucket to refill completely.
+        idle_ttl (float): Entries untouched for this long are purged.
+    """
+
+    def __init__(self, path=QUOTA_DB_PATH, limit=FREE_LIMIT, window=QUOTA_WINDOW_SECONDS,
+                 idle_ttl=QUOTA_IDLE_TTL_SECONDS, paid_ttl=PAID_TTL_SECONDS):
+        self.path = path
+        self.limit = limit
+        self.window = window
+        self.rate = limit / window if window > 0 else 0.0
+        self.idle_ttl = idle_ttl
+        self.paid_ttl = paid_ttl
+        self._local = threading.local()
+        self._calls = 0
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _decision(self, identity, tokens, requests, allowed, paid_until, now):
+        missing = max(0.0, 1.0 - tokens)
+        return QuotaDecision(
+            identity=identity,
+            allowed=bool(allowed),
+            requests_made=int(requests),
+            remaining=int(tokens + 1e-9),
+            limit=self.limit,
+            paid=paid_until > now,
+            retry_after=missing / self.rate if self.rate and missing else 0.0,
+        )
+
+    def consume(self, identity, cost=1, now=None):
+        """Atomically refills, checks and charges `cost` requests. Returns a QuotaDecision."""
+        now = time.time() if now is None else now
+        fits = self.limit >= cost
+        params = {
+            "identity": identity,
+            "cost": cost,
+            "now": now,
+            "capacity": float(self.limit),
+            "rate": self.rate,
+            "new_tokens": float(self.limit - cost if fits else self.limit),
+            "new_allowed": int(fits),
+        }
+        row = self._connect().execute(_CONSUME, params).fetchone()
+
+        self._calls += 1
+        if self._calls % PURGE_EVERY == 0:
+            self.purge_expired(now)
+        return self._decision(identity, *row, now)
+
+    def refund(self, identity, cost=1):
+        """Gives back `cost` requests charged by consume() for a request the server did not serve."""
+        self._connect().execute(
+            "UPDATE quota SET tokens = min(:capacity, tokens + :cost), requests = max(0, requests - :cost) "
+            "WHERE identity = :identity",
+            {"identity": identity, "cost": cost, "capacity": float(self.limit)})
+
+    def peek(self, identity, now=None):
+        """Returns the current state of an identity without charging it."""
+        now = time.time() if now is None else now
+        row = self._connect().execute(
+            "SELECT tokens, requests, updated_at, paid_until FROM quota WHERE identity = ?",
+            (identity,)).fetchone()
+        if row is None:
+            return self._decision(identity, float(self.limit), 0, True, 0.0, now)
+        tokens, requests, updated_at, paid_until = row
+        tokens = min(float(self.limit), tokens + (now - updated_at) * self.rate)
+        return self._decision(identity, tokens, requests, tokens >= 1, paid_until, now)
+
+    def reset(self, identity=None, paid=False, now=None):
+        """Refills one identity (optionally marking it as paid), or clears every entry."""
+        now = time.time() if now is None else now
+        conn = self._connect()
+        if identity is None:
+            conn.execute("DELETE FROM quota")
+            return
+        conn.execute(
+            """
+            INSERT INTO quota (identity, tokens, requests, allowed, updated_at, paid_until)
+            VALUES (:identity, :capacity, 0, 1, :now, :paid_until)
+            ON CONFLICT (identity) DO UPDATE SET
+                tokens = :capacity, requests = 0, allowed = 1, updated_at = :now,
+                paid_until = max(paid_until, :paid_until)
+            """,
+            {"identity": identity, "capacity": float(self.limit), "now": now,
+             "paid_until": now + self.paid_ttl if paid else 0.0})
+
+    def purge_expired(self, now=None):
+        """Deletes entries idle for longer than the TTL. Returns the number removed."""
+        now = time.time() if now is None else now
+        cursor = self._connect().execute(
+            "DELETE FROM quota WHERE updated_at < ? AND paid_until < ?",
+            (now - self.idle_ttl, now))
+        return cursor.rowcount
@@ -0,0 +1,119 @@
+"""
+Exact-match cache of /api/chat responses.
+
+Entries are keyed on the normalized instruction, the Gemini model name, a hash of
+the system prompt and the version of the vector store the context came from, so a
+rebuilt store or a prompt change never serves stale completions. Eviction is LRU
+bounded by both an entry count and an approximate memory cap, with a TTL on top.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "64"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+
+
+def make_cache_key(*parts):
+    """Hashes the key parts into a fixed-size cache key."""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU + TTL cache of JSON-serializable responses.
+
+    Parameters:
+        max_entries (int): Maximum number of cached responses (0 disables the cache).
+        max_bytes (int): Approximate memory cap, measured as serialized JSON size.
+        ttl (float): Seconds an entry stays valid.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes=int(RESPONSE_CACHE_MAX_MB * 1024 * 1024), ttl=RESPONSE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key, now=None):
+        """Returns the cached value or None, refreshing its LRU position."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contains(self, key, now=None):
+        """Whether `key` has a live entry; unlike get() it neither counts a lookup nor refreshes the entry."""
+        if not self.enabled:
+            return False
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > now
+
+    def put(self, key, value, now=None):
+        """Stores a value, evicting least recently used entries to respect both caps."""
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (now + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
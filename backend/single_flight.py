@@ -0,0 +1,75 @@
+"""
+Single-flight coalescing of concurrent identical requests.
+
+While a computation for a key is in flight, later callers with the same key wait
+on it instead of starting their own. Every caller gets its own Future chained to
+the shared one, so a caller that times out or cancels does not cancel the
+computation for the others.
+"""
+import threading
+from concurrent.futures import Future
+
+
+def _copy_outcome(source, target):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def _chain(source):
+    target = Future()
+    source.add_done_callback(lambda f: _copy_outcome(f, target))
+    return target
+
+
+class SingleFlight:
+    """Deduplicates in-flight work by key and counts how often it coalesced."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def submit(self, key, fn):
+        """
+        Returns (future, shared). `fn` is only called when no computation for `key`
+        is in flight; it must return a concurrent.futures.Future.
+        """
+        with self._lock:
+            shared = self._calls.get(key)
+            if shared is not None:
+                self.followers += 1
+                return _chain(shared), True
+            shared = Future()
+            self._calls[key] = shared
+            self.leaders += 1
+
+        try:
+            inner = fn()
+        except Exception as e:
+            inner = Future()
+            inner.set_exception(e)
+
+        def finish(f):
+            with self._lock:
+                self._calls.pop(key, None)
+            _copy_outcome(f, shared)
+        inner.add_done_callback(finish)
+        return _chain(shared), False
+
+    def stats(self):
+        """Leader/follower counts and the fraction of requests that were coalesced."""
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "coalescing_rate": round(self.followers / total, 4) if total else 0.0,
+            }
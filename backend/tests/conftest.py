@@ -0,0 +1,80 @@
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+
+class KeywordEmbeddings:
+    """Embeds text onto one axis per keyword ('eth', 'nft' and 'contract' by default)."""
+
+    def __init__(self, keywords=("eth", "nft", "contract")):
+        self.keywords = keywords
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        vectors = np.array([[float(k in s) for k in self.keywords] for s in sentences], dtype=np.float32) + 1e-3
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class EchoGemini:
+    """Answers with the instruction of the prompt's first context example."""
+
+    def generate(self, prompt):
+        return prompt.split("Context Example 1:\nInstruction: ")[-1].split("\n")[0]
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+def write_samples(base, instructions):
+    """Writes a vector store of `instructions` (output "code") embedded with KeywordEmbeddings."""
+    from vector_store import write_store
+    samples = [{"instruction": text, "output": "code"} for text in instructions]
+    write_store(base, samples, KeywordEmbeddings().encode(instructions))
+
+
+def write_manifest(directory, corpora):
+    path = directory / "corpora.json"
+    path.write_text(json.dumps({"corpora": corpora}))
+    return str(path)
+
+
+@pytest.fixture
+def engine_factory(monkeypatch, tmp_path):
+    """
+    make(instructions) builds an LLMEngine on KeywordEmbeddings and EchoGemini over a
+    store of `instructions` at tmp_path / "vector_samples"; make(corpora=[...]) over the
+    manifest entries given, each with its "instructions". Hybrid retrieval, MMR and the
+    reload watcher are off unless make(hybrid=True, diversity=True, reload_interval=...)
+    """
+    pytest.importorskip("dotenv")
+    import engine
+    from corpus_registry import load_registry
+    monkeypatch.setattr(engine.GeminiClient, "from_env", classmethod(lambda cls, *args: EchoGemini()))
+    engines = []
+
+    def make(instructions=None, corpora=None, hybrid=False, diversity=False, reload_interval=0, **kwargs):
+        monkeypatch.setattr(engine, "HYBRID_RETRIEVAL", hybrid)
+        monkeypatch.setattr(engine, "CONTEXT_DIVERSITY", diversity)
+        if corpora is not None:
+            for entry in corpora:
+                write_samples(str(tmp_path / entry["name"]), entry.pop("instructions"))
+            kwargs["registry"] = load_registry(write_manifest(tmp_path, corpora))
+        else:
+            write_samples(str(tmp_path / "vector_samples"), instructions)
+            kwargs.update(samples_file=str(tmp_path / "missing.jsonl"), store_base=str(tmp_path / "vector_samples"))
+        instance = engine.LLMEngine(embedding_model=KeywordEmbeddings(), api_key="test-key",
+                                    reload_interval=reload_interval, **kwargs)
+        engines.append(instance)
+        return instance
+
+    yield make
+    for instance in engines:
+        instance.close()
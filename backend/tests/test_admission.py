@@ -0,0 +1,77 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add the parent directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from admission import AdmissionController, Overloaded
+from llm_pool import DeadlineExceeded, LLMWorkerPool
+
+
+class SlowEngine:
+    """Takes a fixed time per prompt and reports when it finished."""
+
+    def generate(self, prompt):
+        time.sleep(0.3)
+        return {"response": prompt, "context_chunks": "", "finished_at": time.time()}
+
+
+def slow_engine_factory():
+    return SlowEngine()
+
+
+class FakeLoadPool:
+    def __init__(self, paid=0, free=0, capacity=2, free_slots=0, avg_service_time=2.0):
+        self._load = {"queued": {"paid": paid, "free": free}, "capacity": capacity,
+                      "free_slots": free_slots, "avg_service_time": avg_service_time}
+
+    def load(self):
+        return self._load
+
+
+def test_admits_when_a_slot_is_free():
+    controller = AdmissionController(max_queue={"paid": 4, "free": 4})
+    controller.admit(FakeLoadPool(free_slots=1), "free", time_left=0.5)
+    assert controller.stats()["admitted"] == 1
+
+
+def test_rejects_full_lane_with_503():
+    controller = AdmissionController(max_queue={"paid": 4, "free": 4})
+    with pytest.raises(Overloaded) as excinfo:
+        controller.admit(FakeLoadPool(free=4), "free", time_left=60)
+    assert excinfo.value.status == 503
+    assert excinfo.value.retry_after >= 1
+
+
+def test_rejects_early_when_expected_wait_exceeds_deadline():
+    controller = AdmissionController(max_queue={"paid": 100, "free": 100})
+    # 10 free requests ahead, 2 slots, 2s each: about 11s of queueing
+    pool = FakeLoadPool(free=10)
+    with pytest.raises(Overloaded) as excinfo:
+        controller.admit(pool, "free", time_left=5)
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after == 11
+    # Paid requests do not wait behind the free lane
+    controller.admit(pool, "paid", time_left=5)
+    assert controller.stats()["rejected"] == {"queue_full": 0, "deadline": 1}
+
+
+def test_pool_serves_paid_lane_first_and_expires_queued_jobs():
+    pool = LLMWorkerPool(size=1, concurrency=1, engine_factory=slow_engine_factory).start()
+    try:
+        pool.generate("warm up", timeout=30)
+        busy = pool.submit("busy")
+        free = pool.submit("free", lane="free")
+        expiring = pool.submit("late", lane="free", deadline=time.monotonic() + 0.1)
+        paid = pool.submit("paid", lane="paid")
+
+        assert paid.result(timeout=10)["finished_at"] < free.result(timeout=10)["finished_at"]
+        assert busy.result(timeout=10)["response"] == "busy"
+        with pytest.raises(DeadlineExceeded):
+            expiring.result(timeout=10)
+        assert pool.load()["avg_service_time"] >= 0.3
+    finally:
+        pool.shutdown()
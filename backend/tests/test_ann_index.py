@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from ann_index import ExactIndex, IVFFlatIndex, build_index, load_or_build_index
+from vector_store import normalize_rows
+
+
+def clustered_matrix(count=3000, dim=32, clusters=40, seed=1):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    rows = centers[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, dim))
+    return normalize_rows(rows)
+
+
+def recall(approximate, exact):
+    return np.mean([len(set(a[0]) & set(e[0])) / len(e[0]) for a, e in zip(approximate, exact)])
+
+
+def test_ivf_recall_improves_with_nprobe_and_is_exact_when_probing_everything():
+    matrix = clustered_matrix()
+    queries = matrix[:50] + 0.05
+    exact = ExactIndex(matrix).search(queries, 5)
+    index = IVFFlatIndex.build(matrix, n_lists=32)
+
+    assert recall(index.search(queries, 5, nprobe=8), exact) >= 0.9
+    full = index.search(queries, 5, nprobe=index.n_lists)
+    assert all(np.array_equal(a[0], e[0]) for a, e in zip(full, exact))
+    np.testing.assert_allclose(full[0][1], exact[0][1], rtol=1e-5)
+
+
+def test_auto_uses_exact_for_small_corpora():
+    assert build_index(clustered_matrix(count=100)).kind == "exact"
+    assert build_index(clustered_matrix(count=100), kind="ivf", n_lists=4).kind == "ivf"
+
+
+def test_saved_index_is_reused_only_for_the_same_store(tmp_path):
+    matrix = clustered_matrix()
+    path = str(tmp_path / "vector_samples.ivf.npz")
+    built = load_or_build_index(matrix, path, version="v1", kind="ivf")
+    loaded = IVFFlatIndex.load(path, matrix, version="v1")
+
+    assert loaded is not None
+    np.testing.assert_array_equal(loaded.list_ids, built.list_ids)
+    assert IVFFlatIndex.load(path, matrix, version="v2") is None
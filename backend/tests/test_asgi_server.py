@@ -0,0 +1,214 @@
+import sys
+from pathlib import Path
+from concurrent.futures import Future
+
+import pytest
+
+# Add the parent directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+starlette_testclient = pytest.importorskip("starlette.testclient")
+
+import chat_service
+import api_server
+from admission import Overloaded
+from quota import QuotaStore
+import asgi_server
+
+
+class FakePool:
+    """Answers every prompt immediately without spawning workers."""
+
+    def __init__(self):
+        self.prompts = []
+        self.batches = []
+        self.corpora = []
+
+    def submit(self, prompt, lane="free", deadline=None, corpora=None):
+        self.prompts.append(prompt)
+        self.corpora.append(corpora)
+        future = Future()
+        future.set_result({"response": f"echo: {prompt}", "context_chunks": ""})
+        return future
+
+    def submit_batch(self, prompts, lane="free", deadline=None, corpora=None):
+        self.batches.append(list(prompts))
+        future = Future()
+        future.set_result([{"response": f"echo: {prompt}", "context_chunks": ""} for prompt in prompts])
+        return future
+
+    def load(self):
+        return {"queued": {"paid": 0, "free": 0}, "capacity": 1, "free_slots": 1, "avg_service_time": None}
+
+    def stats(self):
+        return {"queued": 0, "queued_by_lane": {"paid": 0, "free": 0}, "in_flight": 0,
+                "ready_workers": 1, "restarts": 0}
+
+    def shutdown(self):
+        pass
+
+
+def as_user(user_id):
+    """Headers of a request carrying a signed per-user quota token"""
+    return {"Authorization": f"Bearer {chat_service.issue_quota_token(user_id)}"}
+
+
+@pytest.fixture(autouse=True)
+def fake_pool(monkeypatch, tmp_path):
+    pool = FakePool()
+    monkeypatch.setattr(chat_service, "QUOTA_TOKEN_SECRET", "test-secret")
+    monkeypatch.setattr(chat_service, "_llm_pool", pool)
+    monkeypatch.setattr(chat_service, "_quota_store", QuotaStore(str(tmp_path / "quota.db"), limit=1))
+    monkeypatch.setenv("LLM_POOL_WARM_START", "0")
+    chat_service.response_cache.clear()
+    return pool
+
+
+def test_asgi_chat_matches_flask_contract(fake_pool):
+    flask_client = api_server.app.test_client()
+    flask_response = flask_client.post('/api/chat', json={"message": "transfer 1 eth"})
+
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        asgi_response = client.post('/api/chat', json={"message": "transfer 1 eth"})
+
+    assert asgi_response.status_code == flask_response.status_code == 200
+    assert asgi_response.json() == flask_response.get_json()
+    assert asgi_response.json()["response"] == "echo: transfer 1 eth"
+    # The second identical prompt was answered from the response cache
+    assert fake_pool.prompts == ["transfer 1 eth"]
+    assert asgi_response.json()["free_limit"] == 1
+
+
+def test_asgi_free_limit_and_payment():
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        assert client.post('/api/chat', json={"message": "hi"}).status_code == 200
+        limited = client.post('/api/chat', json={"message": "hi again"})
+        assert limited.status_code == 402
+        assert limited.json()["payment_required"] is True
+        assert int(limited.headers["Retry-After"]) == limited.json()["retry_after"]
+
+        # Quotas are per user: another identity still has its free request
+        other = client.post('/api/chat', json={"message": "hi"}, headers=as_user("alice"))
+        assert other.status_code == 200
+
+        assert client.post('/api/verify-payment', json={}).status_code == 400
+        paid = client.post('/api/verify-payment', json={"tx_hash": "0xabc"}).json()
+        assert paid["success"] is True
+        # The payment comes with a token of its own quota, which later requests present
+        token = {"Authorization": f"Bearer {paid['quota_token']}"}
+        status = client.get('/api/user/status', headers=token).json()
+        assert (status["requests_made"], status["paid"]) == (0, True)
+        assert client.post('/api/chat', json={"message": "hi again"}, headers=token).status_code == 200
+        assert client.get('/api/health').json()["status"] == "healthy"
+
+
+def test_quota_identity_ignores_unverified_client_values():
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        assert client.post('/api/chat', json={"message": "hi"}).status_code == 200
+        # A made-up user id or an unsigned token still counts against the client address
+        assert client.post('/api/chat', json={"message": "hi"}, headers={"X-User-Id": "eve"}).status_code == 402
+        forged = {"Authorization": "Bearer eve." + "0" * 64}
+        assert client.post('/api/chat', json={"message": "hi"}, headers=forged).status_code == 402
+        assert client.post('/api/chat', json={"message": "hi"}, headers=as_user("eve")).status_code == 200
+
+
+def test_clients_behind_a_trusted_proxy_get_separate_quotas(monkeypatch):
+    monkeypatch.setattr(chat_service, "TRUSTED_PROXIES", {"testclient"})
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        first, second = {"X-Forwarded-For": "203.0.113.1"}, {"X-Forwarded-For": "203.0.113.2"}
+        assert client.post('/api/chat', json={"message": "hi"}, headers=first).status_code == 200
+        assert client.post('/api/chat', json={"message": "hi"}, headers=first).status_code == 402
+        assert client.post('/api/chat', json={"message": "hi"}, headers=second).status_code == 200
+        # Hops before the one the proxy appended are client-chosen
+        spoofed = {"X-Forwarded-For": "198.51.100.7, 203.0.113.1"}
+        assert client.post('/api/chat', json={"message": "hi"}, headers=spoofed).status_code == 402
+
+
+def test_shed_requests_do_not_use_the_quota(monkeypatch):
+    def overloaded(*args):
+        raise Overloaded("Server overloaded, try again later", 503, 2)
+    monkeypatch.setattr(chat_service.admission, "admit", overloaded)
+
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        for path, body in (('/api/chat', {"message": "hi"}), ('/api/chat/stream', {"message": "hi"}),
+                           ('/api/chat/batch', {"messages": ["hi"]})):
+            assert client.post(path, json=body).status_code == 503
+        assert client.get('/api/user/status').json()["requests_made"] == 0
+
+    flask_client = api_server.app.test_client()
+    assert flask_client.post('/api/chat', json={"message": "hi"}).status_code == 503
+    assert flask_client.get('/api/user/status').get_json()["requests_made"] == 0
+
+
+def test_batch_chat_shares_one_job_and_the_cache(fake_pool):
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        assert client.post('/api/chat', json={"message": "swap tokens"}).status_code == 200
+        response = client.post('/api/chat/batch', json={"messages": ["swap tokens", "mint nft", "Mint NFT"]},
+                               headers=as_user("ops"))
+        assert client.post('/api/chat/batch', json={"messages": []},
+                           headers=as_user("bob")).status_code == 400
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["response"] for r in results] == ["echo: swap tokens", "echo: mint nft", "echo: mint nft"]
+    assert all(r["success"] for r in results)
+    # The cached prompt is skipped and the two spellings of the same prompt are sent once
+    assert fake_pool.batches == [["mint nft"]]
+
+
+def test_chat_passes_the_corpus_selection_and_rejects_unknown_corpora(fake_pool):
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        chosen = client.post('/api/chat', json={"message": "deploy erc20", "corpus": "default"},
+                             headers=as_user("carol"))
+        unknown = client.post('/api/chat', json={"message": "deploy erc20", "corpus": ["nope"]},
+                              headers=as_user("dave"))
+
+    assert chosen.status_code == 200
+    assert fake_pool.corpora == [("default",)]
+    assert unknown.status_code == 400 and "nope" in unknown.json()["error"]
+
+
+def test_batch_is_charged_per_uncached_prompt(fake_pool):
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        # The free limit is 1: two new prompts cost 2
+        over = client.post('/api/chat/batch', json={"messages": ["stake eth", "unstake eth"]})
+        assert over.status_code == 402 and fake_pool.batches == []
+        # An invalid body is rejected before it is charged
+        assert client.post('/api/chat/batch', json={"messages": []}).status_code == 400
+        assert client.post('/api/chat/batch', json={"messages": ["stake eth"]}).status_code == 200
+    assert fake_pool.batches == [["stake eth"]]
+
+
+def test_pricing_a_batch_does_not_count_as_cache_lookups(fake_pool, monkeypatch, tmp_path):
+    monkeypatch.setattr(chat_service, "_quota_store", QuotaStore(str(tmp_path / "pricing.db"), limit=2))
+    before = chat_service.response_cache.stats()
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        assert client.post('/api/chat/batch', json={"messages": ["stake eth", "wrap eth"]},
+                           headers=as_user("pricing")).status_code == 200
+    after = chat_service.response_cache.stats()
+    # One miss per prompt, none from pricing the batch
+    assert (after["hits"] - before["hits"], after["misses"] - before["misses"]) == (0, 2)
+
+
+def test_batch_result_after_a_timeout_is_dropped(fake_pool, monkeypatch, caplog):
+    pending = Future()
+    monkeypatch.setattr(fake_pool, "submit_batch", lambda prompts, **kwargs: pending)
+    future = chat_service.submit_chat_batch(["wrap eth"])
+    assert future.cancel()
+
+    pending.set_result([{"response": "late"}])
+    assert "exception calling callback" not in caplog.text
+
+
+def test_metrics_endpoint_reports_requests_and_cache(fake_pool):
+    with starlette_testclient.TestClient(asgi_server.app) as client:
+        client.post('/api/chat', json={"message": "bridge usdc"}, headers=as_user("metrics"))
+        response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'neopay_requests_total{endpoint="chat",outcome="allowed"}' in body
+    assert 'neopay_request_duration_seconds_count{endpoint="chat",status="200"}' in body
+    assert 'neopay_llm_queue_depth{lane="free"} 0' in body
+    assert 'neopay_response_cache_lookups_total{result="miss"}' in body
@@ -0,0 +1,65 @@
+import sys
+from pathlib import Path
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from context_packer import TRUNCATION_MARKER, pack_examples, truncate_code
+from prompting import build_full_prompt
+
+
+def words(text):
+    """Deterministic token counter for the tests: one token per whitespace-separated word."""
+    return len(text.split())
+
+
+CONTRACT = """pragma solidity ^0.8.0;
+
+contract Token {
+    mapping(address => uint256) balances;
+
+    function transfer(address to, uint256 amount) public {
+        balances[msg.sender] -= amount;
+        balances[to] += amount;
+    }
+}
+
+contract Vault {
+    function deposit() public payable {
+        emit Deposited(msg.sender, msg.value);
+    }
+}
+"""
+
+
+def test_truncate_code_cuts_at_a_closed_top_level_block():
+    truncated = truncate_code(CONTRACT, 30, words)
+
+    assert truncated.endswith("}" + TRUNCATION_MARKER)
+    assert "contract Token" in truncated and "contract Vault" not in truncated
+    assert words(truncated) <= 30
+    assert truncate_code(CONTRACT, 1000, words) == CONTRACT
+
+
+def test_pack_examples_fills_the_budget_in_relevance_order():
+    samples = [{"instruction": "deploy token", "output": CONTRACT},
+               {"instruction": "send eth", "output": "transfer_eth(to, 1)"},
+               {"instruction": "mint nft", "output": "mint(to)"}]
+
+    packed, tokens = pack_examples(samples, budget=1000, count=words)
+    assert [instruction for instruction, _ in packed] == ["deploy token", "send eth", "mint nft"]
+
+    packed, tokens = pack_examples(samples, budget=20, count=words)
+    assert [instruction for instruction, _ in packed] == ["send eth", "mint nft"]
+    assert tokens <= 20
+
+
+def test_build_full_prompt_respects_the_budget():
+    samples = [{"instruction": f"example {i}", "output": CONTRACT} for i in range(5)]
+
+    full, _ = build_full_prompt("generate code to deploy", samples)
+    small, chunks = build_full_prompt("generate code to deploy", samples, token_budget=150)
+
+    assert full.count("Context Example") == 5
+    assert 1 <= small.count("Context Example") < 5
+    assert chunks[0]["instruction"] == "example 0"
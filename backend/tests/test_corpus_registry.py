@@ -0,0 +1,109 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from corpus_registry import DEFAULT_CORPUS, load_registry, parse_corpora, registry_version, route
+from conftest import write_manifest
+from vector_store import write_store
+
+
+def test_manifest_paths_are_relative_to_it(tmp_path):
+    registry = load_registry(write_manifest(tmp_path, [
+        {"name": "agentkit", "keywords": ["AgentKit"], "ann": {"index": "exact"}},
+        {"name": "solidity", "store": "stores/solidity", "memory_budget_mb": 64, "routable": False},
+    ]))
+
+    assert list(registry) == ["agentkit", "solidity"]
+    assert registry["agentkit"].store_base == str(tmp_path / "agentkit")
+    assert registry["agentkit"].keywords == ("agentkit",)
+    assert registry["solidity"].store_base == str(tmp_path / "stores" / "solidity")
+    assert registry["solidity"].memory_budget_mb == 64 and not registry["solidity"].routable
+    assert list(load_registry(str(tmp_path / "missing.json"))) == [DEFAULT_CORPUS]
+    with pytest.raises(ValueError):
+        load_registry(write_manifest(tmp_path, [{"name": "a"}, {"name": "a"}]))
+
+
+def test_selection_routing_and_versions(tmp_path):
+    registry = load_registry(write_manifest(tmp_path, [
+        {"name": "agentkit", "keywords": ["transfer"]},
+        {"name": "solidity", "keywords": ["contract"]},
+    ]))
+
+    assert parse_corpora(None, registry) is None
+    assert parse_corpora("solidity", registry) == ("solidity",)
+    assert parse_corpora(["solidity", "agentkit", "solidity"], registry) == ("solidity", "agentkit")
+    with pytest.raises(ValueError):
+        parse_corpora(["nope"], registry)
+    with pytest.raises(ValueError):
+        parse_corpora(3, registry)
+
+    assert route(registry, "deploy a contract to transfer eth") == ("agentkit", "solidity")
+    assert route(registry, "mint an nft") is None
+    assert route(registry, "mint an nft", ("solidity",)) == ("solidity",)
+
+    assert registry_version({DEFAULT_CORPUS: "store-1"}) == "store-1"
+    assert registry_version({"b": "2", "a": "1"}) == "a:1|b:2"
+
+
+def test_engine_routes_and_merges_corpora(engine_factory):
+    llm = engine_factory(corpora=[
+        {"name": "wallet", "instructions": ["send eth", "send more eth"]},
+        {"name": "nfts", "instructions": ["mint nft", "list nft"]},
+        {"name": "solidity", "keywords": ["solidity"], "instructions": ["deploy contract"]},
+    ])
+
+    # No keyword: the closest centroid wins
+    result = llm.generate("send eth to bob")
+    assert result["corpora"] == ["wallet"] and "send eth" in result["response"]
+    assert result["store_version"] == llm.corpus_set.version and "wallet:" in result["store_version"]
+    assert llm.select_corpora("solidity erc20", llm.embed(["solidity erc20"])[0]) == ("solidity",)
+
+    # Requested corpora are searched together and their hits merged by score
+    hits = llm.retrieve("mint nft with eth", top_n=3, corpora=("wallet", "nfts"))
+    assert {hit["instruction"] for hit in hits} <= {"send eth", "send more eth", "mint nft", "list nft"}
+    assert len(hits) == 3
+    batch = llm.generate_batch(["mint nft", "deploy contract"], corpora=("solidity",))
+    assert [r["corpora"] for r in batch] == [["solidity"], ["solidity"]]
+    # A cached completion from one corpus is not reused for another
+    assert "semantic_cache_hit" not in llm.generate("mint nft")
+
+
+def test_hybrid_hits_are_fused_across_corpora_by_similarity(engine_factory):
+    llm = engine_factory(corpora=[
+        {"name": "wallet", "instructions": ["eth", "eth contract"]},
+        {"name": "misc", "instructions": ["eth nft contract"]},
+    ], hybrid=True)
+
+    # No BM25 match ("ethereum" embeds like "eth"): the cosine ranking over both corpora decides,
+    # rather than each corpus' top hit ranking first
+    hits = llm.retrieve("ethereum", top_n=2, corpora=("wallet", "misc"))
+    assert [hit["instruction"] for hit in hits] == ["eth", "eth contract"]
+
+
+def test_memory_budget_quantizes_large_corpora(tmp_path, monkeypatch):
+    pytest.importorskip("dotenv")
+    import engine
+    from corpus_registry import CorpusSpec
+    from vector_store import QuantizedMatrix, load_store
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((512, 64)).astype(np.float32)
+    write_store(str(tmp_path / "big"), [{"instruction": str(i)} for i in range(512)], embeddings)
+    store = load_store(str(tmp_path / "big"))
+
+    # 128 KiB float32 matrix: int8 (32 KiB) fits 0.04 MiB and is rescored from the memory-mapped rows
+    matrix, rescore = engine._fit_memory_budget(CorpusSpec("big", "", memory_budget_mb=0.04), store)
+    assert isinstance(matrix, QuantizedMatrix) and matrix.dtype == "int8"
+    assert rescore is store.matrix
+    with pytest.raises(ValueError):
+        engine._fit_memory_budget(CorpusSpec("big", "", memory_budget_mb=0.01), store)
+
+    # Loaded from JSONL the float32 rows are in memory and would count against the budget
+    in_memory = load_store(str(tmp_path / "big"), mmap=False)
+    matrix, rescore = engine._fit_memory_budget(CorpusSpec("big", "", memory_budget_mb=0.04), in_memory)
+    assert matrix.dtype == "int8" and rescore is None
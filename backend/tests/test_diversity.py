@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from diversity import mmr_select
+
+
+def test_mmr_prefers_a_different_example_over_a_close_variant():
+    vectors = np.array([[1.0, 0.0], [0.9, 0.1], [0.6, 0.8]])
+    relevance = np.array([0.95, 0.9, 0.7])
+
+    assert mmr_select(relevance, vectors, 2, lambda_=1.0, duplicate_threshold=1.01) == [0, 1]
+    assert mmr_select(relevance, vectors, 2, lambda_=0.5, duplicate_threshold=1.01) == [0, 2]
+
+
+def test_duplicates_are_dropped_even_when_slots_remain():
+    vectors = np.array([[1.0, 0.0], [1.0, 0.001], [0.0, 1.0], [0.999, 0.0]])
+    relevance = np.array([0.9, 0.89, 0.5, 0.88])
+
+    assert mmr_select(relevance, vectors, 4, lambda_=1.0, duplicate_threshold=0.95) == [0, 2]
+    assert mmr_select([], np.zeros((0, 2)), 3) == []
+
+
+def test_engine_mmr_keeps_a_hit_only_bm25_found(engine_factory):
+    llm = engine_factory(["send eth", "send eth now", "send eth contract", "mint nft via transferFrom"],
+                         hybrid=True, diversity=True)
+
+    hits = [hit["instruction"] for hit in llm.retrieve("send eth using transferFrom", top_n=2)]
+    # The exact identifier match ranks high by fusion although its embedding is far off;
+    # "send eth now" duplicates "send eth" and is dropped
+    assert sorted(hits) == ["mint nft via transferFrom", "send eth"]
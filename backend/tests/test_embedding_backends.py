@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from embedding_backends import OnnxEmbeddingModel, export_onnx, load_embedding_model, mean_pool
+
+SENTENCES = ["generate code to transfer 1 eth to alice", "write a solidity erc20 token", "mint an nft"]
+
+
+def test_mean_pool_ignores_padding():
+    tokens = np.array([[[1.0, 1.0], [3.0, 3.0], [100.0, 100.0]]])
+    np.testing.assert_allclose(mean_pool(tokens, np.array([[1, 1, 0]])), [[2.0, 2.0]])
+
+
+@pytest.fixture(scope="module")
+def onnx_dir(tmp_path_factory):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    pytest.importorskip("torch")
+    pytest.importorskip("sentence_transformers")
+    out_dir = tmp_path_factory.mktemp("minilm-onnx")
+    try:
+        return export_onnx("sentence-transformers/all-MiniLM-L6-v2", str(out_dir), int8=True)
+    except OSError as e:  # model not cached and no network
+        pytest.skip(f"all-MiniLM-L6-v2 unavailable: {e}")
+
+
+@pytest.mark.parametrize("int8, min_cosine", [(False, 0.999), (True, 0.97)])
+def test_onnx_embeddings_match_torch(onnx_dir, int8, min_cosine):
+    reference = load_embedding_model("all-MiniLM-L6-v2", backend="torch").encode(
+        SENTENCES, normalize_embeddings=True)
+    onnx = OnnxEmbeddingModel(onnx_dir, int8=int8).encode(SENTENCES, normalize_embeddings=True)
+
+    assert onnx.shape == reference.shape
+    assert np.min(np.sum(onnx * reference, axis=1)) >= min_cosine
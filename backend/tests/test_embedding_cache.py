@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from embedding_cache import CachedEmbeddingModel, EmbeddingCache
+
+
+class CountingModel:
+    """Deterministic stand-in for SentenceTransformer that records every batch."""
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, sentences, normalize_embeddings=False):
+        self.batches.append(list(sentences))
+        return np.array([[len(s), 1.0, 0.5] for s in sentences], dtype=np.float32)
+
+
+def test_only_misses_reach_the_model():
+    model = CountingModel()
+    cached = CachedEmbeddingModel(model, EmbeddingCache(max_entries=10), persist_path="")
+
+    first = cached.encode(["send eth", "mint nft"], normalize_embeddings=True)
+    second = cached.encode(["mint nft", "swap", "swap"], normalize_embeddings=True)
+
+    assert model.batches == [["send eth", "mint nft"], ["swap"]]
+    assert second.dtype == np.float32
+    np.testing.assert_allclose(second[0], first[1])
+    assert cached.stats()["hits"] == 1 and cached.stats()["misses"] == 4
+
+
+def test_lru_eviction_and_float16_storage():
+    cache = EmbeddingCache(max_entries=2, dtype="float16")
+    cache.put_many(["a", "b"], np.ones((2, 4)))
+    cache.get_many(["a"])
+    cache.put_many(["c"], np.ones((1, 4)))
+
+    assert cache.get_many(["a", "b", "c"])[1] is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 2 * 4 * 2
+
+
+def test_persisted_cache_is_reloaded_for_the_same_model(tmp_path):
+    path = str(tmp_path / "query_embeddings.npz")
+    model = CountingModel()
+    cached = CachedEmbeddingModel(model, EmbeddingCache(namespace="minilm"), persist_path=path, save_every=1)
+    cached.encode(["bridge usdc"], normalize_embeddings=True)
+
+    warm = CachedEmbeddingModel(model, EmbeddingCache(namespace="minilm"), persist_path=path)
+    warm.encode(["bridge usdc"], normalize_embeddings=True)
+    assert model.batches == [["bridge usdc"]]
+    assert EmbeddingCache(namespace="other").load(path) == 0
@@ -0,0 +1,91 @@
+import sys
+import time
+import threading
+from pathlib import Path
+
+import pytest
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+pytest.importorskip("httpx")
+
+from gemini_client import GeminiClient, GeminiError, RestTransport
+from gemini_stub import GeminiStubServer
+
+
+def make_client(stub, **kwargs):
+    kwargs.setdefault("sleep", lambda seconds: None)
+    return GeminiClient(RestTransport("test-key", "gemini-2.0-flash", base_url=stub.url), **kwargs)
+
+
+def test_generate_and_stream_against_the_stub():
+    with GeminiStubServer() as stub:
+        client = make_client(stub)
+        assert "print('hello')" in client.generate("hello")
+        assert "print('hello')" in "".join(client.stream("hello"))
+        client.close()
+
+
+def test_retries_429_and_5xx_then_succeeds():
+    with GeminiStubServer(plan=[(429, 0), (503, 0)]) as stub:
+        client = make_client(stub, max_retries=3)
+        assert client.generate("hi")
+        assert stub.requests == 3
+        assert client.stats()["retries"] == 2
+
+
+def test_client_errors_are_not_retried_and_retries_are_bounded():
+    with GeminiStubServer(plan=[(400, 0)] + [(500, 0)] * 3) as stub:
+        client = make_client(stub, max_retries=2)
+        with pytest.raises(GeminiError) as excinfo:
+            client.generate("bad")
+        assert excinfo.value.status == 400 and stub.requests == 1
+
+        with pytest.raises(GeminiError) as excinfo:
+            client.generate("flaky")
+        assert excinfo.value.status == 500 and stub.requests == 4
+        assert client.stats()["errors"] == 2
+
+
+def test_timeouts_are_retried():
+    with GeminiStubServer(plan=[(200, 1.0)]) as stub:
+        client = make_client(stub, timeout=0.2, max_retries=1)
+        assert client.generate("slow once")
+        assert client.stats()["retries"] == 1
+
+
+def test_hedges_a_request_slower_than_p95():
+    with GeminiStubServer(plan=[(200, 0.0)] * 5 + [(200, 2.0)]) as stub:
+        client = make_client(stub, hedge=True, hedge_min_samples=5)
+        for _ in range(5):
+            client.generate("warm up")
+        started = time.perf_counter()
+        assert client.generate("slow")
+        assert time.perf_counter() - started < 1.5
+        assert client.stats()["hedges"] == 1 and client.stats()["hedge_wins"] == 1
+
+
+def test_concurrency_is_bounded():
+    with GeminiStubServer(delay=0.1) as stub:
+        client = make_client(stub, max_concurrency=2)
+        active, peak, lock = [0], [0], threading.Lock()
+        original = client.transport.generate
+
+        def tracking_generate(prompt, timeout):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            try:
+                return original(prompt, timeout)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        client.transport.generate = tracking_generate
+        threads = [threading.Thread(target=client.generate, args=(str(i),)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert peak[0] == 2
@@ -0,0 +1,89 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from lexical_index import BM25Index, load_or_build_lexical_index, tokenize
+from retriever import Retriever, reciprocal_rank_fusion
+
+SAMPLES = [
+    {"instruction": "generate code to send eth", "output": "transfer_eth(to, amount)"},
+    {"instruction": "generate code to move tokens for a spender", "output": "token.transferFrom(owner, to, amount)"},
+    {"instruction": "generate code to deploy an ERC20 token", "output": "contract Token is ERC20 {}"},
+    {"instruction": "generate code to check a balance", "output": "query_balance(address)"},
+]
+
+
+def reference_bm25(docs, query, k1=1.2, b=0.75):
+    tokenized = [tokenize(doc) for doc in docs]
+    avg = np.mean([len(doc) for doc in tokenized])
+    scores = []
+    for doc in tokenized:
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in other for other in tokenized)
+            tf = doc.count(term)
+            if tf:
+                idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg))
+        scores.append(score)
+    return np.array(scores)
+
+
+def test_tokenize_keeps_identifiers_whole():
+    assert tokenize("call transferFrom on an ERC20, send 0.5") == [
+        "call", "transferfrom", "on", "an", "erc20", "send", "0.5"]
+
+
+def test_scores_match_reference_bm25():
+    docs = [f"{s['instruction']} {s['output']}" for s in SAMPLES]
+    index = BM25Index.build(docs, max_df=1.0)
+    for query in ("transferFrom tokens", "erc20 token deploy", "balance of address", "unknown"):
+        np.testing.assert_allclose(index.scores(query), reference_bm25(docs, query), rtol=1e-5)
+
+
+def test_frequent_terms_are_skipped_when_rarer_ones_exist():
+    index = BM25Index.from_samples(SAMPLES)
+    ids, _ = index.search(["generate code to use transferFrom"], 4)[0]
+    assert ids.tolist() == [1]
+
+
+def test_save_and_reload(tmp_path):
+    path = str(tmp_path / "vector_samples.bm25.npz")
+    built = load_or_build_lexical_index(SAMPLES, path, version="v1")
+    loaded = BM25Index.load(path, len(SAMPLES), "v1")
+
+    assert loaded.vocabulary == built.vocabulary
+    np.testing.assert_array_equal(loaded.scores("erc20"), built.scores("erc20"))
+    assert BM25Index.load(path, len(SAMPLES), "v2") is None
+
+
+def test_reciprocal_rank_fusion():
+    ids, scores = reciprocal_rank_fusion([[3, 1, 2], [1, 4]], top_n=3, k=60)
+    assert ids.tolist() == [1, 3, 4]
+    assert scores[0] == np.float32(1 / 62 + 1 / 61)
+
+
+def test_hybrid_retriever_surfaces_exact_identifier_matches():
+    matrix = np.eye(4, dtype=np.float32)
+    query = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)  # closest to "send eth"
+    vector_only = Retriever(SAMPLES, matrix, threshold=0.5)
+    hybrid = Retriever(SAMPLES, matrix, threshold=0.5, lexical=BM25Index.from_samples(SAMPLES))
+
+    assert vector_only.retrieve(query, 2) == [[SAMPLES[0]]]
+    assert hybrid.retrieve(query, 2, texts=["generate code to call transferFrom"]) == [[SAMPLES[0], SAMPLES[1]]]
+    assert hybrid.retrieve(query, 2) == [[SAMPLES[0]]]
+
+
+def test_weak_lexical_only_hits_are_cut_off():
+    matrix = np.eye(4, dtype=np.float32)
+    query = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+    hybrid = Retriever(SAMPLES, matrix, threshold=0.5, lexical=BM25Index.from_samples(SAMPLES))
+
+    # "token" and "a" overlap other samples weakly; only the vector match is kept
+    assert hybrid.retrieve(query, 3, texts=["generate code to send eth as a token"]) == [[SAMPLES[0]]]
+    # A lexical-only hit as strong as the best one still gets in
+    assert hybrid.retrieve(query, 3, texts=["send eth and check balance"]) == [[SAMPLES[0], SAMPLES[3]]]
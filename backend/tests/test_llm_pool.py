@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add the parent directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from llm_pool import LLMWorkerPool, WorkerCrashed
+
+
+class EchoEngine:
+    """Stand-in for LLMEngine that needs no model or API key."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+
+    def generate(self, prompt):
+        if prompt == "crash":
+            os._exit(3)
+        return {"response": prompt.upper(), "context_chunks": str(self.pid)}
+
+    def stats(self):
+        return {"embedding_cache": {"hits": 1, "misses": 1, "hit_ratio": 0.5}}
+
+    def generate_batch(self, prompts):
+        return [self.generate(prompt) for prompt in prompts]
+
+    def generate_stream(self, prompt):
+        yield "context", {"context_chunks": "ctx"}
+        for word in prompt.split():
+            yield "token", {"text": word}
+        return self.generate(prompt)
+
+
+def echo_engine_factory():
+    return EchoEngine()
+
+
+@pytest.fixture
+def stages():
+    return []
+
+
+@pytest.fixture
+def pool(stages):
+    pool = LLMWorkerPool(size=2, concurrency=2, engine_factory=echo_engine_factory,
+                         stage_observer=lambda stage, seconds: stages.append(stage)).start()
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_reuses_warm_workers(pool):
+    futures = [pool.submit(f"transfer {i} eth") for i in range(10)]
+    results = [f.result(timeout=30) for f in futures]
+
+    assert [r["response"] for r in results] == [f"TRANSFER {i} ETH" for i in range(10)]
+    # Ten prompts are served by at most two long-lived processes
+    assert len({r["context_chunks"] for r in results}) <= 2
+
+
+def test_pool_reports_stage_timings(pool, stages):
+    pool.generate("time me", timeout=30)
+
+    assert {"engine_init", "worker_startup", "queue_wait", "worker_job"} <= set(stages)
+
+    # Engine counters are reported after jobs and summed across workers
+    deadline = time.monotonic() + 10
+    while not pool.stats()["engine"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert pool.stats()["engine"]["embedding_cache"]["hit_ratio"] == 0.5
+
+
+def test_pool_restarts_crashed_worker(pool):
+    assert pool.generate("warm up", timeout=30)["response"] == "WARM UP"
+
+    with pytest.raises(WorkerCrashed):
+        pool.generate("crash", timeout=30)
+
+    assert pool.generate("after crash", timeout=30)["response"] == "AFTER CRASH"
+    assert pool.stats()["restarts"] >= 1
+
+
+def test_pool_runs_batch_as_one_job(pool):
+    results = pool.submit_batch(["a b", "c"]).result(timeout=30)
+
+    assert [r["response"] for r in results] == ["A B", "C"]
+    # Both prompts ran on the same worker
+    assert results[0]["context_chunks"] == results[1]["context_chunks"]
+
+
+def test_pool_streams_events_before_result(pool):
+    handle = pool.submit_stream("send 1 eth")
+    events = list(handle.events(timeout=30))
+
+    assert events[0] == ("context", {"context_chunks": "ctx"})
+    assert [data["text"] for event, data in events[1:]] == ["send", "1", "eth"]
+    assert handle.result()["response"] == "SEND 1 ETH"
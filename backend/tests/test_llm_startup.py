@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+MODEL_DIR = Path(__file__).parent.parent / "model"
+# Generous for CI machines; importing numpy alone takes about this long, torch many seconds
+IMPORT_BUDGET = 0.1
+HEAVY_MODULES = ["numpy", "google.generativeai", "sentence_transformers", "torch", "sklearn", "onnxruntime"]
+
+
+def run_python(code, stdin="", env_overrides=None):
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    env.update(env_overrides or {})
+    return subprocess.run([sys.executable, "-c", code], input=stdin, capture_output=True, text=True,
+                          cwd=MODEL_DIR, env=env, timeout=60)
+
+
+def test_importing_llm_loads_no_heavy_dependencies_within_budget():
+    code = (
+        "import sys, time, json; start = time.perf_counter(); import llm; "
+        "elapsed = time.perf_counter() - start; "
+        f"print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))"
+    )
+    result = run_python(code)
+    elapsed, loaded = json.loads(result.stdout)
+    assert loaded == []
+    assert elapsed < IMPORT_BUDGET
+
+
+@pytest.mark.parametrize("stdin, env, error", [
+    ('{"prompt": "hi"}', {}, "GEMINI_API_KEY environment variable not set"),
+    ("not json", {"GEMINI_API_KEY": "test-key"}, "Invalid input format"),
+])
+def test_validation_errors_return_before_the_pipeline_loads(stdin, env, error):
+    code = "import sys, llm\ntry:\n    llm.main()\nfinally:\n    print('numpy' in sys.modules, file=sys.stderr)"
+    result = run_python(code, stdin, env)
+    assert result.returncode == 1
+    assert error in json.loads(result.stdout)["error"]
+    assert result.stderr.strip().endswith("False")
@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+# Add the parent directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("stage_seconds", "Stage latency.", ("stage",), buckets=(0.1, 1.0))
+    latency.observe(0.05, stage="embed")
+    latency.observe(0.5, stage="embed")
+    latency.observe(3, stage="embed")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE stage_seconds histogram" in lines
+    assert 'stage_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="embed",le="1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="embed",le="+Inf"} 3' in lines
+    assert 'stage_seconds_sum{stage="embed"} 3.55' in lines
+    assert 'stage_seconds_count{stage="embed"} 3' in lines
+
+
+def test_counter_and_collectors():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("endpoint",))
+    requests.inc(endpoint="chat")
+    requests.inc(2, endpoint="chat")
+    registry.add_collector(lambda: [("queue_depth", "gauge", "Queued jobs.", [({"lane": 'pa"id'}, 4)])])
+
+    body = registry.render()
+    assert 'requests_total{endpoint="chat"} 3' in body
+    assert 'queue_depth{lane="pa\\"id"} 4' in body
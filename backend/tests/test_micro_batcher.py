@@ -0,0 +1,58 @@
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from micro_batcher import BatchingEmbeddingModel, MicroBatcher
+
+
+def test_concurrent_submissions_share_a_batch():
+    batches = []
+    gate = threading.Barrier(8)
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait=0.5)
+    results = [None] * 8
+
+    def call(i):
+        gate.wait()
+        results[i] = batcher.submit(i).result(timeout=5)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [i * 2 for i in range(8)]
+    assert len(batches) < 8
+    assert batcher.stats()["items"] == 8
+
+
+def test_batch_size_cap_and_errors():
+    batcher = MicroBatcher(lambda items: [len(items)] * len(items), max_batch_size=3, max_wait=0.05)
+    assert max(f.result(timeout=5) for f in batcher.submit_many(range(7))) <= 3
+
+    failing = MicroBatcher(lambda items: 1 / 0, max_wait=0)
+    with pytest.raises(ZeroDivisionError):
+        failing.submit("x").result(timeout=5)
+
+
+def test_batching_embedding_model_returns_rows_in_order():
+    class Model:
+        def encode(self, sentences, normalize_embeddings=False):
+            return np.array([[len(s), float(normalize_embeddings)] for s in sentences])
+
+    model = BatchingEmbeddingModel(Model(), max_wait=0.001)
+    vectors = model.encode(["a", "bbb", "cc"], normalize_embeddings=True)
+
+    assert vectors.dtype == np.float32
+    np.testing.assert_array_equal(vectors, [[1, 1], [3, 1], [2, 1]])
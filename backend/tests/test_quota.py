@@ -0,0 +1,88 @@
+import sys
+import threading
+from pathlib import Path
+
+# Add the parent directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from quota import QuotaStore
+
+
+def make_store(tmp_path, **kwargs):
+    return QuotaStore(str(tmp_path / "quota.db"), **kwargs)
+
+
+def test_quota_is_per_identity(tmp_path):
+    store = make_store(tmp_path, limit=2, window=3600)
+
+    assert store.consume("alice", now=0).allowed
+    assert store.consume("alice", now=1).allowed
+    denied = store.consume("alice", now=2)
+    assert not denied.allowed
+    assert denied.requests_made == 3
+    assert denied.retry_after > 0
+
+    assert store.consume("bob", now=2).allowed
+
+
+def test_quota_refills_over_window(tmp_path):
+    store = make_store(tmp_path, limit=2, window=100)
+
+    store.consume("alice", now=0)
+    store.consume("alice", now=0)
+    assert not store.consume("alice", now=10).allowed
+    # Half a window refills one of the two tokens
+    assert store.consume("alice", now=50).allowed
+    assert store.peek("alice", now=50).remaining == 0
+
+
+def test_payment_resets_only_payer(tmp_path):
+    store = make_store(tmp_path, limit=1, window=3600)
+
+    store.consume("alice", now=0)
+    store.consume("bob", now=0)
+    store.reset("alice", paid=True, now=1)
+
+    assert store.peek("alice", now=1).paid
+    assert store.consume("alice", now=1).allowed
+    assert not store.consume("bob", now=1).allowed
+
+
+def test_refund_gives_back_the_charged_requests(tmp_path):
+    store = make_store(tmp_path, limit=2, window=3600)
+
+    store.consume("alice", cost=2, now=0)
+    store.refund("alice", 2)
+    state = store.peek("alice", now=0)
+    assert (state.requests_made, state.remaining) == (0, 2)
+    # Never more than the bucket holds
+    store.refund("alice")
+    assert store.peek("alice", now=0).remaining == 2
+
+
+def test_idle_entries_expire(tmp_path):
+    store = make_store(tmp_path, limit=1, window=3600, idle_ttl=60)
+
+    store.consume("alice", now=0)
+    store.consume("bob", now=100)
+    assert store.purge_expired(now=100) == 1
+    assert store.peek("alice", now=100).requests_made == 0
+
+
+def test_concurrent_consumers_never_overspend(tmp_path):
+    store = make_store(tmp_path, limit=50, window=1e9)
+    allowed = []
+
+    def hammer():
+        # A second store instance stands in for another server process
+        other = make_store(tmp_path, limit=50, window=1e9)
+        allowed.append(sum(other.consume("alice").allowed for _ in range(20)))
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(allowed) == 50
+    assert store.peek("alice").requests_made == 160
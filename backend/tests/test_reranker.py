@@ -0,0 +1,82 @@
+import sys
+import time
+import threading
+from pathlib import Path
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from reranker import LexicalOverlapScorer, Reranker, load_reranker
+
+
+def samples(*instructions):
+    return [{"instruction": text, "output": "code"} for text in instructions]
+
+
+def test_lexical_rerank_promotes_the_exact_match():
+    reranker = Reranker(LexicalOverlapScorer(), budget=5)
+    candidates = samples("transfer eth with a memo to a wallet", "transfer eth", "swap eth for usdc")
+
+    orders = reranker.rerank(["generate code to transfer eth"], [candidates])
+
+    assert orders == [[1, 0, 2]]
+    assert reranker.stats()["reranked"] == 1 and reranker.stats()["fallbacks"] == 0
+    # Scored inline: no batcher thread or batching window
+    assert reranker.batcher is None and reranker.stats()["batches"] == 0
+
+
+class FixedScorer:
+    inline = True
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score(self, pairs):
+        return self.scores[:len(pairs)]
+
+
+def test_first_pass_bonus_runs_from_one_to_zero():
+    # Bonuses 0.1, 0.05 and 0: the last candidate's 0.05 only ties the second, which keeps its place
+    reranker = Reranker(FixedScorer([0.0, 0.0, 0.05]), first_pass_weight=0.1)
+    assert reranker.rerank(["q"], [samples("a", "b", "c")]) == [[0, 1, 2]]
+    assert reranker.rerank(["q"], [samples("a")]) == [[0]]
+
+
+class SlowScorer:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = []
+
+    def score(self, pairs):
+        self.calls.append(len(pairs))
+        time.sleep(self.delay)
+        return [float(len(sample["instruction"])) for _, sample in pairs]
+
+
+def test_over_budget_requests_keep_the_first_pass_order():
+    reranker = Reranker(SlowScorer(0.2), budget=0.02)
+    started = time.monotonic()
+    orders = reranker.rerank(["q"], [samples("a", "bbb", "cc")])
+
+    assert orders == [[0, 1, 2]]
+    assert time.monotonic() - started < 0.15
+    assert reranker.stats()["fallbacks"] == 1
+
+
+def test_concurrent_requests_share_scorer_batches():
+    scorer = SlowScorer(0.01)
+    reranker = Reranker(scorer, budget=5, first_pass_weight=0, max_wait=0.05)
+    results = [None] * 4
+
+    def run(i):
+        results[i] = reranker.rerank([f"q{i}"], [samples("a", "bbb", "cc")])[0]
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [[1, 2, 0]] * 4
+    assert sum(scorer.calls) == 12 and len(scorer.calls) < 4
+    assert load_reranker("off") is None
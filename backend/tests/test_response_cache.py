@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+# Add the parent directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from response_cache import ResponseCache, make_cache_key
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+from versioning import file_version
+
+
+def test_lru_eviction_and_counters():
+    cache = ResponseCache(max_entries=2, max_bytes=1 << 20, ttl=60)
+    cache.put("a", {"response": "1"}, now=0)
+    cache.put("b", {"response": "2"}, now=0)
+    assert cache.get("a", now=1) == {"response": "1"}
+
+    cache.put("c", {"response": "3"}, now=2)  # evicts b, the least recently used
+
+    assert cache.get("b", now=3) is None
+    assert cache.get("c", now=3) == {"response": "3"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1)
+
+    # contains() is not a lookup
+    assert cache.contains("c", now=4) and not cache.contains("b", now=4) and not cache.contains("c", now=62)
+    assert cache.stats() == stats
+
+
+def test_ttl_and_memory_cap():
+    cache = ResponseCache(max_entries=100, max_bytes=60, ttl=10)
+    cache.put("a", {"response": "x" * 20}, now=0)
+    assert cache.get("a", now=11) is None
+    assert cache.stats()["expirations"] == 1
+
+    cache.put("b", {"response": "y" * 20}, now=20)
+    cache.put("c", {"response": "z" * 20}, now=20)  # both together exceed 60 bytes
+    assert cache.stats()["entries"] == 1
+    assert cache.get("c", now=21) is not None
+
+
+def test_key_changes_with_store_version(tmp_path):
+    store = tmp_path / "vector_samples.jsonl"
+    store.write_text("{}\n")
+    before = make_cache_key("generate code to send 1 eth", "gemini-2.0-flash", file_version(str(store)))
+
+    store.write_text("{}\n{}\n")
+    after = make_cache_key("generate code to send 1 eth", "gemini-2.0-flash", file_version(str(store)))
+
+    assert before != after
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from retriever import Retriever
+from vector_store import QuantizedMatrix
+
+
+def reference(query, samples, top_n, threshold):
+    """The original cosine + threshold + sorted() implementation."""
+    embeddings = np.array([s["embedding"] for s in samples])
+    sims = embeddings @ query / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query))
+    ranked = sorted([(sim, s) for sim, s in zip(sims, samples) if sim >= threshold], key=lambda x: x[0], reverse=True)
+    return [s for _, s in ranked[:top_n]]
+
+
+def test_matches_reference_on_unnormalized_embeddings():
+    rng = np.random.default_rng(0)
+    samples = [{"instruction": str(i), "embedding": (rng.normal(size=16) * rng.uniform(1, 5)).tolist()}
+               for i in range(300)]
+    retriever = Retriever.from_samples(samples)
+
+    for _ in range(20):
+        query = rng.normal(size=16).astype(np.float32)
+        query /= np.linalg.norm(query)
+        for threshold in (-1.0, 0.2, 0.5):
+            assert retriever.retrieve(query, 5, threshold)[0] == reference(query, samples, 5, threshold)
+
+
+def test_threshold_and_batch_search():
+    samples = [{"instruction": "a", "embedding": [1.0, 0.0]}, {"instruction": "b", "embedding": [0.6, 0.8]},
+               {"instruction": "c", "embedding": [0.0, -1.0]}]
+    retriever = Retriever.from_samples(samples, threshold=0.5)
+
+    (ids, scores), (other_ids, _) = retriever.search(np.array([[1.0, 0.0], [0.0, -1.0]]), top_n=3)
+    assert ids.tolist() == [0, 1]
+    np.testing.assert_allclose(scores, [1.0, 0.6], rtol=1e-6)
+    assert other_ids.tolist() == [2]
+
+
+def test_int8_rescoring_returns_exact_scores_and_applies_threshold_after():
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(400, 32)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    samples = [{"instruction": str(i)} for i in range(400)]
+    exact = Retriever(samples, matrix, threshold=0.3)
+    rescored = Retriever(samples, QuantizedMatrix.quantize(matrix, "int8"), threshold=0.3, rescore_matrix=matrix)
+
+    queries = matrix[:10] + rng.normal(scale=0.3, size=(10, 32)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    for (ids, scores), (want_ids, want_scores) in zip(rescored.search(queries, 5), exact.search(queries, 5)):
+        np.testing.assert_array_equal(ids, want_ids)
+        np.testing.assert_allclose(scores, want_scores, rtol=1e-5)
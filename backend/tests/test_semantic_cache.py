@@ -0,0 +1,87 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from semantic_cache import SemanticCache, extract_parameters
+
+ALICE = "0x" + "ab" * 20
+BOB = "0x" + "cd" * 20
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_paraphrases_share_parameters():
+    assert (extract_parameters(f"send 0.1 eth to {ALICE}")
+            == extract_parameters(f"transfer 0.10 ether to {ALICE.upper().replace('0X', '0x')}"))
+    assert extract_parameters("send 1,000 usdc to vitalik.eth") == extract_parameters("pay 1000 usdc to vitalik.eth")
+
+
+def test_parameter_changes_are_detected():
+    base = extract_parameters(f"send 0.1 eth to {ALICE}")
+    assert extract_parameters(f"send 0.1 eth to {BOB}") != base
+    assert extract_parameters(f"send 0.2 eth to {ALICE}") != base
+    assert extract_parameters(f"send 0.1 usdc to {ALICE}") != base
+    assert extract_parameters(f"swap 0.1 eth to {ALICE}") != base
+    assert extract_parameters("send 0.1 eth to bob.eth") != extract_parameters("send 0.1 eth to alice.eth")
+
+
+def test_reordered_amounts_directions_and_named_recipients_are_detected():
+    assert (extract_parameters(f"send 1 eth to {ALICE} and 2 eth to {BOB}")
+            != extract_parameters(f"send 2 eth to {ALICE} and 1 eth to {BOB}"))
+    assert (extract_parameters(f"send 1 eth from {ALICE} to {BOB}")
+            != extract_parameters(f"send 1 eth from {BOB} to {ALICE}"))
+    assert extract_parameters("send 1 eth to alice") != extract_parameters("send 1 eth to bob")
+    assert extract_parameters("generate code to send 1 eth to alice") == extract_parameters("transfer 1 ETH to Alice")
+
+
+def test_every_non_stop_word_is_a_parameter():
+    pairs = [
+        ("send 1 eth to alice and bob", "send 1 eth to alice and carol"),
+        ("send 1 eth to alice, bob", "send 1 eth to alice, carol"),
+        ("deploy an erc20 token named foo", "deploy an erc20 token named bar"),
+        ("send 1 eth on base", "send 1 eth on arbitrum"),
+        ("base sepolia", "base mainnet"),
+        ("send half of my eth", "send all of my eth"),
+        ("send 1 eth tomorrow", "send 1 eth today"),
+        ("send 1 eth", "do not send 1 eth"),
+        ("send 1 eth", "don't send 1 eth"),
+    ]
+    for first, second in pairs:
+        assert extract_parameters(first) != extract_parameters(second), (first, second)
+    assert extract_parameters("please send 1 eth to alice and bob") == extract_parameters("pay 1 ether to alice, bob")
+
+
+def test_reuses_similar_queries_with_identical_parameters_only():
+    cache = SemanticCache(max_entries=10, threshold=0.95)
+    cache.put(unit(1, 0, 0), f"send 0.1 eth to {ALICE}", {"response": "transfer alice"})
+
+    assert cache.get(unit(1, 0.1, 0), f"transfer 0.1 ETH to {ALICE}") == {"response": "transfer alice"}
+    assert cache.get(unit(1, 0.1, 0), f"send 0.1 eth to {BOB}") is None
+    assert cache.get(unit(0, 1, 0), f"send 0.1 eth to {ALICE}") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["guard_rejections"]) == (1, 2, 1)
+
+
+def test_evicts_least_recently_used():
+    cache = SemanticCache(max_entries=2, threshold=0.99)
+    cache.put(unit(1, 0, 0), "send 1 eth", "a")
+    cache.put(unit(0, 1, 0), "send 2 eth", "b")
+    assert cache.get(unit(1, 0, 0), "send 1 eth") == "a"
+    cache.put(unit(0, 0, 1), "send 3 eth", "c")
+
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
+    assert cache.get(unit(0, 1, 0), "send 2 eth") is None
+    assert cache.get(unit(1, 0, 0), "send 1 eth") == "a"
+
+
+def test_disabled_cache():
+    cache = SemanticCache(max_entries=0)
+    cache.put(unit(1, 0), "send 1 eth", "a")
+    assert cache.get(unit(1, 0), "send 1 eth") is None
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+from concurrent.futures import Future
+
+# Add the parent directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from single_flight import SingleFlight
+
+
+def test_identical_keys_share_one_computation():
+    flights = SingleFlight()
+    inner = Future()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return inner
+
+    results = [flights.submit("send 1 eth", compute) for _ in range(5)]
+    inner.set_result({"response": "ok"})
+
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert all(f.result(timeout=1) == {"response": "ok"} for f, _ in results)
+    assert flights.stats()["coalescing_rate"] == 0.8
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_cancelled_follower_does_not_cancel_leader():
+    flights = SingleFlight()
+    inner = Future()
+    leader, _ = flights.submit("k", lambda: inner)
+    follower, _ = flights.submit("k", lambda: inner)
+
+    assert follower.cancel()
+    inner.set_result("done")
+    assert leader.result(timeout=1) == "done"
+
+
+def test_new_flight_after_completion_and_errors_propagate():
+    flights = SingleFlight()
+    failed = Future()
+    first, _ = flights.submit("k", lambda: failed)
+    failed.set_exception(RuntimeError("boom"))
+    assert isinstance(first.exception(timeout=1), RuntimeError)
+
+    second, shared = flights.submit("k", lambda: Future())
+    assert not shared
@@ -0,0 +1,47 @@
+import time
+from pathlib import Path
+
+from conftest import write_samples
+
+
+def test_reload_swaps_the_corpus_and_old_snapshots_keep_working(tmp_path, engine_factory):
+    llm, base = engine_factory(["send eth"]), str(tmp_path / "vector_samples")
+    old = llm.corpus_set
+    first = llm.generate("send eth")
+    assert first["response"] == "send eth" and first["store_version"] == old.version
+    assert first["corpora"] == ["default"]
+    assert not llm.reload_if_changed()
+
+    time.sleep(0.01)
+    write_samples(base, ["send eth with memo"])
+    assert llm.reload_if_changed()
+
+    assert llm.corpus_set is not old and llm.corpus_set.version != old.version
+    # A request that started before the swap still retrieves from its own snapshot
+    assert llm.retrieve("generate code to send eth", corpus_set=old)[0]["instruction"] == "send eth"
+    second = llm.generate("send eth")
+    assert second["response"] == "send eth with memo" and "semantic_cache_hit" not in second
+    assert llm.stats()["store"] == {"reloads": 1, "reload_failures": 0}
+
+
+def test_watcher_picks_up_a_rewritten_store(tmp_path, engine_factory):
+    llm, base = engine_factory(["send eth"], reload_interval=0.02), str(tmp_path / "vector_samples")
+    version = llm.corpus_set.version
+    time.sleep(0.01)
+    write_samples(base, ["mint nft"])
+
+    deadline = time.monotonic() + 5
+    while llm.corpus_set.version == version and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert llm.samples[0]["instruction"] == "mint nft"
+
+
+def test_a_broken_store_keeps_the_old_corpus(tmp_path, engine_factory):
+    llm, base = engine_factory(["send eth"]), str(tmp_path / "vector_samples")
+    old = llm.corpus_set
+    time.sleep(0.01)
+    Path(base + ".npy").write_bytes(b"not a matrix")
+    Path(base + ".meta.json").write_text(Path(base + ".meta.json").read_text())
+
+    assert not llm.reload_if_changed()
+    assert llm.corpus_set is old and llm.reload_failures == 1
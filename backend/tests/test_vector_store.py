@@ -0,0 +1,62 @@
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Add the model directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "model"))
+
+from vector_store import QuantizedMatrix, convert_jsonl, load_store, store_exists, write_store
+
+
+def test_store_round_trip_is_memory_mapped_and_normalized(tmp_path):
+    base = str(tmp_path / "vector_samples")
+    samples = [{"instruction": "send eth", "output": "a", "embedding": [3.0, 4.0]},
+               {"instruction": "mint nft", "output": "b", "embedding": [0.0, 2.0]}]
+    write_store(base, samples, np.array([s["embedding"] for s in samples]), "all-MiniLM-L6-v2")
+
+    store = load_store(base)
+    assert store_exists(base)
+    assert isinstance(store.matrix, np.memmap)
+    assert store.matrix.dtype == np.float32
+    np.testing.assert_allclose(store.matrix, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+    assert store.samples == [{"instruction": "send eth", "output": "a"}, {"instruction": "mint nft", "output": "b"}]
+    assert store.meta["model"] == "all-MiniLM-L6-v2"
+
+
+def test_convert_jsonl(tmp_path):
+    jsonl = tmp_path / "vector_samples.jsonl"
+    jsonl.write_text("\n".join(json.dumps({"instruction": str(i), "output": "", "embedding": [1.0, float(i)]})
+                               for i in range(3)) + "\n")
+
+    store = convert_jsonl(str(jsonl), str(tmp_path / "store"))
+
+    assert len(store) == 3 and store.dim == 2
+    assert [s["instruction"] for s in load_store(str(tmp_path / "store")).samples] == ["0", "1", "2"]
+
+
+def test_int8_store_scores_close_to_float32_and_keeps_rescore_vectors(tmp_path):
+    base = str(tmp_path / "vector_samples")
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(50, 32)).astype(np.float32)
+    samples = [{"instruction": str(i)} for i in range(50)]
+    write_store(base, samples, embeddings, dtype="int8", keep_float32=True)
+
+    store = load_store(base)
+    assert isinstance(store.matrix, QuantizedMatrix) and store.matrix.dtype == np.int8
+    assert store.matrix.nbytes < store.rescore_matrix.nbytes / 3
+    exact = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.testing.assert_allclose(store.rescore_matrix, exact, rtol=1e-6)
+    queries = exact[:3]
+    np.testing.assert_allclose(store.matrix.scores(queries), queries @ exact.T, atol=0.02)
+    np.testing.assert_allclose(store.matrix[:2], exact[:2], atol=0.02)
+
+
+def test_float16_store_without_rescore(tmp_path):
+    base = str(tmp_path / "vector_samples")
+    write_store(base, [{"instruction": "a"}], np.array([[3.0, 4.0]]), dtype="float16")
+
+    store = load_store(base)
+    assert store.matrix.dtype == np.float16 and store.rescore_matrix is None
+    np.testing.assert_allclose(store.matrix.scores(np.array([0.6, 0.8])), [[1.0]], atol=1e-3)
@@ -10,6 +10,8 @@ export default defineConfig({
       '/api': {
         target: 'http://localhost:8000',
         changeOrigin: true,
+        // X-Forwarded-For lets the backend keep per-client quotas (TRUSTED_PROXIES)
+        xfwd: true,
       },
     },
   },